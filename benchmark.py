@@ -0,0 +1,428 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import shutil
+import platform
+import statistics
+import subprocess
+import threading
+import multiprocessing
+import numpy as np
+import cv2
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+STAGES = ('merge', 'validate', 'filter', 'download')
+CLASS_NAMES = ['snake', 'raccoon', 'squirrel']
+
+
+def parse_resolutions(text):
+    """'1920x1080,640x480' -> [(1920, 1080), (640, 480)]"""
+    return [tuple(int(v) for v in item.lower().split('x')) for item in text.split(',')]
+
+
+def synthetic_image(rng, width, height, boxes):
+    """Smooth gradient background with a filled rectangle per box, so images compress like photos"""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = rng.integers(0, 256, size=3)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    for c in range(3):
+        img[:, :, c] = ((x * (c + 1) / 3 + y * (3 - c) / 3 + base[c]) % 256).astype(np.uint8)
+    for _, cx, cy, bw, bh in boxes:
+        color = tuple(int(v) for v in rng.integers(0, 256, size=3))
+        p1 = (int((cx - bw / 2) * width), int((cy - bh / 2) * height))
+        p2 = (int((cx + bw / 2) * width), int((cy + bh / 2) * height))
+        cv2.rectangle(img, p1, p2, color, -1)
+    return img
+
+
+def synthetic_boxes(rng, count, small_fraction):
+    """(count, 5) YOLO boxes; small_fraction of them are below 5% of the image in both dimensions"""
+    boxes = np.empty((count, 5))
+    boxes[:, 0] = rng.integers(0, len(CLASS_NAMES), size=count)
+    small = rng.random(count) < small_fraction
+    boxes[:, 3] = np.where(small, rng.uniform(0.01, 0.045, count), rng.uniform(0.08, 0.5, count))
+    boxes[:, 4] = np.where(small, rng.uniform(0.01, 0.045, count), rng.uniform(0.08, 0.5, count))
+    boxes[:, 1] = rng.uniform(boxes[:, 3] / 2, 1 - boxes[:, 3] / 2)
+    boxes[:, 2] = rng.uniform(boxes[:, 4] / 2, 1 - boxes[:, 4] / 2)
+    return boxes
+
+
+def generate_dataset(root, images=1000, resolutions=((1280, 720),), duplicate_rate=0.05,
+                     boxes_per_image=(1, 6), small_fraction=0.2, seed=0, image_format='.jpg'):
+    """Write a reproducible YOLO source folder (root/images, root/labels) for the merger
+
+    Generation is skipped when root already holds a dataset built from the same parameters.
+    """
+    params = {
+        'images': images, 'resolutions': [list(r) for r in resolutions], 'duplicate_rate': duplicate_rate,
+        'boxes_per_image': list(boxes_per_image), 'small_fraction': small_fraction, 'seed': seed,
+        'image_format': image_format
+    }
+    params_path = os.path.join(root, 'params.json')
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            if json.load(f) == params:
+                print(f"Reusing synthetic dataset at {root}")
+                return params
+        shutil.rmtree(root)
+
+    rng = np.random.default_rng(seed)
+    image_dir = os.path.join(root, 'images')
+    label_dir = os.path.join(root, 'labels')
+    os.makedirs(image_dir)
+    os.makedirs(label_dir)
+
+    written = []
+    for i in range(images):
+        name = f"img_{i:06d}"
+        image_path = os.path.join(image_dir, name + image_format)
+        if written and rng.random() < duplicate_rate:
+            # Byte-identical copy of an earlier image, with its label
+            source = written[int(rng.integers(len(written)))]
+            shutil.copyfile(source + image_format, image_path)
+            shutil.copyfile(source.replace(image_dir, label_dir) + '.txt', os.path.join(label_dir, name + '.txt'))
+            continue
+
+        width, height = resolutions[i % len(resolutions)]
+        boxes = synthetic_boxes(rng, int(rng.integers(boxes_per_image[0], boxes_per_image[1] + 1)), small_fraction)
+        cv2.imwrite(image_path, synthetic_image(rng, width, height, boxes))
+        np.savetxt(os.path.join(label_dir, name + '.txt'), boxes, fmt=['%d'] + ['%.6f'] * 4)
+        written.append(os.path.join(image_dir, name))
+
+    with open(params_path, 'w') as f:
+        json.dump(params, f)
+    print(f"Generated {images} images ({len(written)} unique) at {root}")
+    return params
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children (e.g. pool workers), in MB"""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        # Linux carries ru_maxrss over exec, so a spawned process would report its parent's peak;
+        # VmHWM starts fresh with the new program
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    return max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale / 1e6
+
+
+def _timed(results, name, items, func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    results[name] = {'seconds': time.perf_counter() - start, 'items': items}
+    return value
+
+
+def _clear_caches(dataset):
+    """Remove label-index and dimension caches so every stage measures a cold run"""
+    from label_index import LABEL_INDEX_FILE
+
+    paths = [os.path.join(dataset, '.dimension_cache.sqlite')]
+    paths += [os.path.join(dataset, split, LABEL_INDEX_FILE) for split in ('train', 'val', 'test')]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _count_images(dataset):
+    return sum(len(os.listdir(os.path.join(dataset, split, 'images'))) for split in ('train', 'val', 'test'))
+
+
+def bench_merge(work_dir, workers):
+    from dataset_merger import DatasetMerger
+
+    output_base = os.path.join(work_dir, 'merged')
+    shutil.rmtree(output_base, ignore_errors=True)
+    merger = DatasetMerger({
+        'input_folders': [os.path.join(work_dir, 'source')],
+        'output_base': output_base,
+        'split_ratio': (0.7, 0.2, 0.1),
+        'target_size': (640, 640),
+        'class_names': CLASS_NAMES,
+        'workers': workers
+    })
+
+    results = {}
+    random.seed(0)  # split_dataset shuffles
+    pairs = _timed(results, 'collect_pairs', None, merger.collect_pairs)
+    results['collect_pairs']['items'] = len(pairs)
+    unique = _timed(results, 'remove_duplicates', len(pairs), merger.remove_duplicates, pairs)
+    splits = merger.split_dataset(unique)
+    _timed(results, 'process_splits', len(unique), merger.process_splits, splits)
+    merger.create_yaml()
+
+    # Later stages read the merged dataset from a fixed path
+    dataset = os.path.join(work_dir, 'dataset')
+    shutil.rmtree(dataset, ignore_errors=True)
+    os.replace(merger.output_folder, dataset)
+    return results
+
+
+def bench_validate(work_dir, workers):
+    from validate_annotations import AnnotationValidator
+
+    dataset = os.path.join(work_dir, 'dataset')
+    _clear_caches(dataset)
+    images = _count_images(dataset)
+
+    results = {}
+    validator = AnnotationValidator(dataset)
+    if workers > 1:
+        issues_path = os.path.join(work_dir, 'issues.jsonl')
+        _timed(results, 'validate_dataset_parallel', images, validator.validate_dataset_parallel,
+               None, workers, issues_path)
+    else:
+        _timed(results, 'validate_dataset', images, validator.validate_dataset)
+    return results
+
+
+def bench_filter(work_dir, workers):
+    from filter_small_objects import SmallObjectFilter
+
+    dataset = os.path.join(work_dir, 'dataset')
+    images = _count_images(dataset)
+    results = {}
+    for link_mode in ('copy', 'hardlink'):
+        _clear_caches(dataset)
+        output_dir = os.path.join(work_dir, f'filtered_{link_mode}')
+        shutil.rmtree(output_dir, ignore_errors=True)
+        _timed(results, f'filter_{link_mode}', images,
+               SmallObjectFilter(dataset).filter_dataset, output_dir, link_mode)
+    return results
+
+
+class ImageServer:
+    """Local HTTP stand-in for image hosts: serves fixed JPEG bytes at /<n>.jpg after a delay"""
+
+    def __init__(self, body, latency=0.0):
+        body_bytes = body
+        delay = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like real CDNs
+
+            def do_GET(self):
+                if delay:
+                    time.sleep(delay)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body_bytes)))
+                self.end_headers()
+                self.wfile.write(body_bytes)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def bench_download(work_dir, workers, count=200, latency=0.01):
+    from reddit_downloader import RedditImageDownloader
+
+    rng = np.random.default_rng(0)
+    boxes = synthetic_boxes(rng, 3, 0.2)
+    ok, body = cv2.imencode('.jpg', synthetic_image(rng, 1280, 720, boxes))
+    out_dir = os.path.join(work_dir, 'downloads')
+
+    # Dummy credentials: praw only contacts Reddit when a listing is requested
+    credentials = {'client_id': 'bench', 'client_secret': 'bench', 'username': 'bench', 'password': 'bench'}
+    downloader = RedditImageDownloader(credentials, max_workers=max(workers, 2),
+                                       per_host_limit=max(workers, 2), host_delay=0.0)
+
+    results = {}
+    with ImageServer(body.tobytes(), latency) as server:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.makedirs(out_dir)
+        urls = [(f"{server.url}/{i}.jpg", os.path.join(out_dir, f"{i}.jpg")) for i in range(count)]
+
+        def sequential():
+            for url, path in urls:
+                downloader.download_image(url, path)
+
+        _timed(results, 'download_image', count, sequential)
+        shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        summary = _timed(results, 'download_many', count, downloader.download_many, urls)
+        results['download_many']['bytes'] = summary['bytes']
+    return results
+
+
+BENCHMARKS = {'merge': bench_merge, 'validate': bench_validate, 'filter': bench_filter, 'download': bench_download}
+
+
+def _run_in_child(stage, work_dir, workers, results_queue, kwargs):
+    # Progress output and bars from the tools would swamp the report; a crash's traceback
+    # still reaches the real stderr
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = sys.stderr = devnull
+        try:
+            results = BENCHMARKS[stage](work_dir, workers, **kwargs)
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    results_queue.put((results, peak_rss_mb()))
+
+
+def run_stage(stage, work_dir, workers, poll_seconds=1.0, **kwargs):
+    """Run one stage in a freshly spawned process so peak RSS belongs to that stage alone
+
+    Raises RuntimeError if the child dies (exception, OOM kill) before reporting results.
+    """
+    context = multiprocessing.get_context('spawn')
+    results_queue = context.Queue()
+    process = context.Process(target=_run_in_child, args=(stage, work_dir, workers, results_queue, kwargs))
+    process.start()
+    while True:
+        try:
+            results, rss = results_queue.get(timeout=poll_seconds)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # The child exited; its results may have arrived just before it did
+        try:
+            results, rss = results_queue.get(timeout=poll_seconds)
+            break
+        except queue.Empty:
+            process.join()
+            raise RuntimeError(f"Benchmark stage '{stage}' exited with code {process.exitcode} without results")
+    process.join()
+    if process.exitcode:
+        raise RuntimeError(f"Benchmark stage '{stage}' exited with code {process.exitcode}")
+    for entry in results.values():
+        entry['items_per_sec'] = entry['items'] / entry['seconds'] if entry['seconds'] > 0 else None
+        entry['peak_rss_mb'] = rss
+    return results
+
+
+def run_benchmarks(args):
+    """Generate the dataset, run the requested stages and return the results document"""
+    source = os.path.join(args.work_dir, 'source')
+    params = generate_dataset(
+        source, args.images, parse_resolutions(args.resolutions), args.duplicate_rate,
+        tuple(int(v) for v in args.boxes.split('-')), args.small_fraction, args.seed
+    )
+
+    stages = args.stages.split(',')
+    if any(stage in ('validate', 'filter') for stage in stages) and 'merge' not in stages \
+            and not os.path.exists(os.path.join(args.work_dir, 'dataset')):
+        stages.insert(0, 'merge')  # validate and filter read the merged dataset
+
+    timings = {}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        kwargs = {'count': args.download_count, 'latency': args.download_latency} if stage == 'download' else {}
+        runs = [run_stage(stage, args.work_dir, args.workers, **kwargs) for _ in range(args.repeat)]
+        for name in runs[0]:
+            entry = dict(runs[0][name])
+            entry['seconds'] = statistics.median(run[name]['seconds'] for run in runs)
+            entry['items_per_sec'] = entry['items'] / entry['seconds'] if entry['items'] and entry['seconds'] else None
+            if entry['peak_rss_mb'] is not None:
+                entry['peak_rss_mb'] = max(run[name]['peak_rss_mb'] for run in runs)
+            timings[f"{stage}.{name}"] = entry
+            rate = f"{entry['items_per_sec']:10.1f}/s" if entry['items_per_sec'] else ' ' * 12
+            rss = f"{entry['peak_rss_mb']:8.0f} MB" if entry['peak_rss_mb'] is not None else ''
+            print(f"  {stage + '.' + name:40} {entry['seconds']:9.3f}s {rate} {rss}")
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'workers': args.workers,
+        'repeat': args.repeat,
+        'dataset': params,
+        'stages': timings
+    }
+
+
+def compare(results, baseline, threshold, min_delta=0.05):
+    """Print stage-by-stage changes against a baseline and return the names that regressed
+
+    A stage regresses when it is more than threshold slower and at least min_delta seconds
+    slower, so millisecond-scale stages do not fail on timer noise.
+    """
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created')} ({baseline.get('commit')}):")
+    if baseline.get('dataset') != results['dataset'] or baseline.get('workers') != results['workers']:
+        print("  Warning: dataset parameters or worker count differ from the baseline")
+
+    for name, entry in results['stages'].items():
+        old = baseline['stages'].get(name)
+        if not old:
+            continue
+        change = entry['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        regressed = change > threshold and entry['seconds'] - old['seconds'] >= min_delta
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:40} {old['seconds']:9.3f}s -> {entry['seconds']:9.3f}s "
+              f"({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark merge/validate/filter/download on synthetic YOLO data')
+    parser.add_argument('--work-dir', default='benchmark_data', help='Where datasets are generated')
+    parser.add_argument('--images', type=int, default=1000)
+    parser.add_argument('--resolutions', default='1920x1080,1280x720,640x640', help='Cycled WIDTHxHEIGHT list')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='Fraction of byte-identical copies')
+    parser.add_argument('--boxes', default='1-6', help='Boxes per image as MIN-MAX')
+    parser.add_argument('--small-fraction', type=float, default=0.2, help='Fraction of boxes under 5%% per side')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per stage; the median time is reported')
+    parser.add_argument('--download-count', type=int, default=200)
+    parser.add_argument('--download-latency', type=float, default=0.01, help='Seconds the local server waits')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown before failing (0.10 = 10%%)')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='Ignore slowdowns smaller than this many seconds')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
@@ -1,82 +1,428 @@
 import os
 import shutil
 import random
-from glob import glob
-from pathlib import Path
 import cv2
 import yaml
 from datetime import datetime
 import hashlib
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from merge_manifest import MergeManifest
+from perceptual_hash import HASH_FUNCTIONS, BKTree
+from image_probe import read_image_header, oriented_size
+from file_links import link_file
+from shard_dataset import SHARD_SIZE, ShardWriter
+from label_index import load_label_index, parse_label_file, scan_pairs
+from metrics import METRICS
+from profiling import span
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Bytes read per update when hashing
+
+REDUCED_DECODE_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+
+def hash_file(path, algorithm='blake2b', chunk_size=HASH_CHUNK_SIZE):
+    """Hash a file in fixed-size chunks so large images are never held in memory"""
+    if algorithm == 'xxhash':
+        if xxhash is None:
+            raise ValueError("hash_algorithm 'xxhash' requires the xxhash package")
+        digest = xxhash.xxh3_128()
+    else:
+        digest = hashlib.new(algorithm)
+
+    with METRICS.timer('hash_seconds'), open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def output_image_name(img_path, output_format=None):
+    """Name of the processed image, optionally switching its extension"""
+    filename = os.path.basename(img_path)
+    if output_format:
+        filename = os.path.splitext(filename)[0] + output_format
+    return filename
+
+
+def _decode_flag(size, target_size):
+    """Smallest JPEG DCT-scaled decode that still covers the target size"""
+    for factor, flag in REDUCED_DECODE_FLAGS.items():
+        if size[0] // factor >= target_size[0] and size[1] // factor >= target_size[1]:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def _encode_params(img_out_path, options):
+    ext = os.path.splitext(img_out_path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        return [cv2.IMWRITE_JPEG_QUALITY, options['jpeg_quality']]
+    if ext == '.png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, options['png_compression']]
+    return []
+
+
+def _is_passthrough(img_path, img_out_name, header, target_size):
+    """Already the right size, unrotated and in the output format: no decode/encode needed"""
+    same_format = os.path.splitext(img_out_name)[1].lower() == os.path.splitext(img_path)[1].lower()
+    return header is not None and header == (*target_size, 1) and same_format
+
+
+def _load_resized(img_path, header, options, timings):
+    """Decode and resize an image, adding the seconds spent on each step to timings"""
+    target_size = options['target_size']
+    flag = cv2.IMREAD_COLOR
+    if header and options['reduced_decode'] and img_path.lower().endswith(('.jpg', '.jpeg')):
+        flag = _decode_flag(oriented_size(header), target_size)
+
+    start = time.perf_counter()
+    img = cv2.imread(img_path, flag)
+    timings['decode'] = time.perf_counter() - start
+    if img is not None and img.shape[1::-1] != target_size:
+        start = time.perf_counter()
+        img = cv2.resize(img, target_size, interpolation=cv2.INTER_LINEAR)
+        timings['resize'] = time.perf_counter() - start
+    return img
+
+
+def record_image_timings(timings, ok):
+    """Record the per-step timings a pool worker returned for one image"""
+    for stage, seconds in timings.items():
+        METRICS.observe('image_stage_seconds', seconds, stage=stage)
+    METRICS.inc('images_processed_total', status='ok' if ok else 'failed')
+
+
+def _process_image(task):
+    """Resize one image and copy its label (runs inside pool workers)
+
+    Returns (img_path, ok, timings) where timings maps each step to seconds.
+    """
+    img_path, lbl_path, img_out_dir, lbl_out_dir, options = task
+    img_out_path = os.path.join(img_out_dir, output_image_name(img_path, options['output_format']))
+    timings = {}
+
+    header = read_image_header(img_path)
+    start = time.perf_counter()
+    if _is_passthrough(img_path, img_out_path, header, options['target_size']):
+        link_file(img_path, img_out_path, options['link_mode'])
+        timings['link'] = time.perf_counter() - start
+    else:
+        img = _load_resized(img_path, header, options, timings)
+        if img is None:
+            return img_path, False, timings
+
+        start = time.perf_counter()
+        if os.path.lexists(img_out_path):
+            os.remove(img_out_path)  # Never write through a hardlink into a source image
+        cv2.imwrite(img_out_path, img, _encode_params(img_out_path, options))
+        timings['write'] = time.perf_counter() - start
+
+    shutil.copy(lbl_path, os.path.join(lbl_out_dir, os.path.basename(lbl_path)))
+    return img_path, True, timings
+
+
+def _encode_image(task):
+    """Return (img_path, image name, encoded bytes or None, timings) for shard output (runs inside pool workers)"""
+    img_path, options = task
+    img_out_name = output_image_name(img_path, options['output_format'])
+    timings = {}
+
+    header = read_image_header(img_path)
+    if _is_passthrough(img_path, img_out_name, header, options['target_size']):
+        start = time.perf_counter()
+        with open(img_path, 'rb') as f:
+            image_bytes = f.read()
+        timings['read'] = time.perf_counter() - start
+        return img_path, img_out_name, image_bytes, timings
+
+    img = _load_resized(img_path, header, options, timings)
+    if img is None:
+        return img_path, img_out_name, None, timings
+
+    start = time.perf_counter()
+    ok, encoded = cv2.imencode(os.path.splitext(img_out_name)[1], img, _encode_params(img_out_name, options))
+    timings['encode'] = time.perf_counter() - start
+    return img_path, img_out_name, encoded.tobytes() if ok else None, timings
+
+
+def _encode_chunk(tasks):
+    """_encode_image over a list of tasks (runs inside pool workers)"""
+    return [_encode_image(task) for task in tasks]
+
+
+def _ordered_results(executor, func, chunks, max_in_flight):
+    """Yield the items of func(chunk) in order, keeping at most max_in_flight chunks submitted"""
+    pending = deque()
+    for chunk in chunks:
+        if len(pending) >= max_in_flight:
+            yield from pending.popleft().result()
+        pending.append(executor.submit(func, chunk))
+    while pending:
+        yield from pending.popleft().result()
+
 
 class DatasetMerger:
     def __init__(self, config):
         self.input_folders = config['input_folders']
         self.output_base = config['output_base']
         self.split_ratio = config['split_ratio']
-        self.target_size = config['target_size']
+        self.target_size = tuple(config['target_size'])
         self.class_names = config['class_names']
+        self.workers = config.get('workers', 1)  # >1 enables the process pool
+        self.chunk_size = config.get('chunk_size', 32)  # Tasks sent to a worker per batch
+        self.hash_algorithm = config.get('hash_algorithm', 'blake2b')  # Any hashlib name or 'xxhash'
+        self.hash_workers = config.get('hash_workers', 8)  # Threads overlapping file reads
+        self.near_duplicate_radius = config.get('near_duplicate_radius')  # Hamming radius, None disables
+        self.perceptual_hash = config.get('perceptual_hash', 'dhash')  # 'dhash' or 'phash'
+        self.perceptual_batch_size = config.get('perceptual_batch_size', 10000)  # Bounds in-flight decodes
+        self.image_options = {
+            'target_size': self.target_size,
+            'output_format': config.get('output_format'),  # e.g. '.png'; None keeps each source's extension
+            'jpeg_quality': config.get('jpeg_quality', 95),
+            'png_compression': config.get('png_compression', 1),
+            'link_mode': config.get('link_mode', 'hardlink'),  # How already-sized images are placed
+            'reduced_decode': config.get('reduced_decode', True)
+        }
+        self.output_layout = config.get('output_layout', 'files')  # 'files' or 'shards'
+        self.shard_size = config.get('shard_size', SHARD_SIZE)  # Bytes per shard file
+        self.shard_info = {}
+        self.write_label_index = config.get('write_label_index', True)  # Pre-build the validator/filter index
+        self.incremental = config.get('incremental', False)
+        if self.incremental and self.output_layout != 'files':
+            raise ValueError("Incremental merges only support output_layout 'files'")
         
-        # Create timestamped output folder
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.output_folder = os.path.join(self.output_base, f"dataset_{timestamp}")
+        if self.incremental:
+            # Incremental merges keep updating one folder tracked by a manifest
+            self.output_folder = os.path.join(self.output_base, config.get('incremental_folder', 'dataset_incremental'))
+        else:
+            # Create timestamped output folder
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.output_folder = os.path.join(self.output_base, f"dataset_{timestamp}")
         
     def run(self):
         """Main method to run the dataset merging process"""
-        all_pairs = self.collect_pairs()
-        
+        if self.incremental:
+            return self.run_incremental()
+
+        with span('collect_pairs'):
+            all_pairs = self.collect_pairs()
         
-        unique_pairs = self.remove_duplicates(all_pairs)
+        with span('remove_duplicates'):
+            unique_pairs = self.remove_duplicates(all_pairs)
         print(f"Found {len(all_pairs)} pairs, {len(unique_pairs)} after removing duplicates")
-        
+
+        if self.near_duplicate_radius is not None:
+            with span('remove_near_duplicates'):
+                unique_pairs = self.remove_near_duplicates(unique_pairs)
+            print(f"{len(unique_pairs)} pairs after removing near-duplicates")
         
         splits = self.split_dataset(unique_pairs)
         
-        
-        self.process_splits(splits)
-        
+        with span('process_splits'):
+            self.process_splits(splits)
         
         self.create_yaml()
         
         print(f"Dataset created at: {self.output_folder}")
 
+    def run_incremental(self):
+        """Merge only new or changed pairs into the manifest-tracked output folder"""
+        manifest = MergeManifest(os.path.join(self.output_folder, 'manifest.sqlite'))
+        try:
+            known = manifest.load()
+            with span('collect_pairs'):
+                all_pairs = self.collect_pairs()
+
+            # Unchanged pairs (same size and mtimes) are never re-read
+            changed = []
+            for img_path, label_path in all_pairs:
+                img_stat = os.stat(img_path)
+                label_mtime_ns = os.stat(label_path).st_mtime_ns
+                row = known.get(img_path)
+                if not manifest.is_unchanged(row, img_stat.st_size, img_stat.st_mtime_ns, label_mtime_ns):
+                    changed.append({
+                        'image_path': img_path,
+                        'label_path': label_path,
+                        'size': img_stat.st_size,
+                        'mtime_ns': img_stat.st_mtime_ns,
+                        'label_mtime_ns': label_mtime_ns,
+                        'split': row['split'] if row else None
+                    })
+
+            removed = set(known) - {img_path for img_path, _ in all_pairs}
+            self.remove_outputs(known[img_path] for img_path in removed)
+            manifest.remove(removed)
+
+            hasher = partial(hash_file, algorithm=self.hash_algorithm)
+            with span('hash_changed'), ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+                hashes = list(executor.map(hasher, [entry['image_path'] for entry in changed]))
+
+            # Unchanged duplicates of content whose placed copy was removed or changed are
+            # considered again, otherwise that content would vanish from the dataset
+            changed_paths = {entry['image_path'] for entry in changed}
+            released = {known[path]['content_hash'] for path in removed | changed_paths
+                        if path in known and known[path]['split']}
+            for path, row in known.items():
+                if (row['split'] is None and row['content_hash'] in released
+                        and path not in removed and path not in changed_paths):
+                    entry = {key: row[key] for key in ('image_path', 'label_path', 'size', 'mtime_ns', 'label_mtime_ns')}
+                    entry['split'] = None
+                    changed.append(entry)
+                    hashes.append(row['content_hash'])
+            changed_paths = {entry['image_path'] for entry in changed}
+            seen_hashes = {row['content_hash'] for path, row in known.items()
+                           if path not in changed_paths and path not in removed and row['split']}
+
+            splits = {'train': [], 'val': [], 'test': []}
+            for entry, content_hash in zip(changed, hashes):
+                entry['content_hash'] = content_hash
+                if content_hash in seen_hashes:
+                    # Remember duplicates with no split so they are skipped next run too
+                    print(f"Removed duplicate: {entry['image_path']}")
+                    if entry['image_path'] in known:
+                        self.remove_outputs([known[entry['image_path']]])
+                    entry.update(split=None, image_out=None, label_out=None)
+                    continue
+
+                seen_hashes.add(content_hash)
+                entry['split'] = entry['split'] or self.assign_split(content_hash)
+                splits[entry['split']].append((entry['image_path'], entry['label_path']))
+
+            print(f"Found {len(all_pairs)} pairs, {len(changed)} new or changed, {len(removed)} removed")
+
+            with span('process_splits'):
+                summary = self.process_splits(splits)
+            failed = {path for stats in summary.values() for path in stats['failed']}
+
+            rows = []
+            for entry in changed:
+                if entry['image_path'] in failed:
+                    continue  # Left out of the manifest so the next run retries it
+                if entry['split']:
+                    split_dir = os.path.join(self.output_folder, entry['split'])
+                    entry['image_out'] = os.path.join(
+                        split_dir, 'images', output_image_name(entry['image_path'], self.image_options['output_format']))
+                    entry['label_out'] = os.path.join(split_dir, 'labels', os.path.basename(entry['label_path']))
+                rows.append(entry)
+            manifest.upsert(rows)
+        finally:
+            manifest.close()
+
+        self.create_yaml()
+
+        print(f"Dataset updated at: {self.output_folder}")
+
+    def assign_split(self, content_hash):
+        """Pick a split from the content hash so assignments stay stable across runs"""
+        position = int(content_hash[:8], 16) / 0xFFFFFFFF
+        if position < self.split_ratio[0]:
+            return 'train'
+        if position < self.split_ratio[0] + self.split_ratio[1]:
+            return 'val'
+        return 'test'
+
+    def remove_outputs(self, rows):
+        """Delete processed outputs whose source pair disappeared"""
+        for row in rows:
+            for path in (row['image_out'], row['label_out']):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
     def collect_pairs(self):
-        """Collect all valid (image, label) pairs from input folders"""
-        image_extensions = ['.jpg', '.jpeg', '.png']
-        all_pairs = []
+        """Collect all valid (image, label) pairs from input folders
         
+        Each folder's images/ and labels/ are listed once and joined by stem; folders are
+        scanned concurrently since the time goes to directory I/O.
+        """
+        folders = []
         for folder in self.input_folders:
-            image_dir = os.path.join(folder, 'images')
-            label_dir = os.path.join(folder, 'labels')
-            
-            if not os.path.exists(image_dir) or not os.path.exists(label_dir):
+            if not os.path.isdir(os.path.join(folder, 'images')) or not os.path.isdir(os.path.join(folder, 'labels')):
                 print(f"Missing images/labels folder in {folder}")
                 continue
-                
-            for ext in image_extensions:
-                for img_path in glob(os.path.join(image_dir, f'*{ext}')):
-                    label_path = os.path.join(label_dir, Path(img_path).stem + '.txt')
-                    if os.path.exists(label_path):
-                        all_pairs.append((img_path, label_path))
-                    else:
-                        print(f"Missing label for {img_path}")
+            folders.append(folder)
+        
+        with ThreadPoolExecutor(max_workers=max(min(len(folders), self.hash_workers), 1)) as executor:
+            listings = list(executor.map(partial(scan_pairs, label_mtimes=False), folders))
+        
+        all_pairs = []
+        for folder, (image_names, label_mtimes) in zip(folders, listings):
+            image_prefix = os.path.join(folder, 'images', '')
+            label_prefix = os.path.join(folder, 'labels', '')
+            for img_file, label_mtime in zip(image_names.tolist(), label_mtimes.tolist()):
+                if label_mtime < 0:
+                    print(f"Missing label for {image_prefix + img_file}")
+                    continue
+                all_pairs.append((image_prefix + img_file, label_prefix + img_file.rpartition('.')[0] + '.txt'))
         
         return all_pairs
 
     def remove_duplicates(self, pairs):
-        """Remove duplicate images using MD5 hashing"""
+        """Remove duplicate images, hashing only files whose byte size collides"""
+        sizes = [os.path.getsize(img_path) for img_path, _ in pairs]
+        size_counts = Counter(sizes)
+
+        # An exact duplicate must have the same size, so unique sizes skip hashing
+        to_hash = [img_path for (img_path, _), size in zip(pairs, sizes) if size_counts[size] > 1]
+        hasher = partial(hash_file, algorithm=self.hash_algorithm)
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+            hashes = dict(zip(to_hash, executor.map(hasher, to_hash)))
+
         unique_hashes = set()
         unique_pairs = []
-        
-        for img_path, label_path in pairs:
-            with open(img_path, 'rb') as f:
-                img_hash = hashlib.md5(f.read()).hexdigest()
-                
+
+        for (img_path, label_path), size in zip(pairs, sizes):
+            if size_counts[size] == 1:
+                unique_pairs.append((img_path, label_path))
+                continue
+
+            img_hash = (size, hashes[img_path])
             if img_hash not in unique_hashes:
                 unique_hashes.add(img_hash)
                 unique_pairs.append((img_path, label_path))
             else:
                 print(f"Removed duplicate: {img_path}")
-        
+
+        return unique_pairs
+
+    def remove_near_duplicates(self, pairs):
+        """Keep one representative per cluster of perceptually similar images"""
+        hash_func = HASH_FUNCTIONS[self.perceptual_hash]
+        tree = BKTree()  # Holds representatives only, so memory tracks unique images
+        unique_pairs = []
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+        try:
+            for batch_start in range(0, len(pairs), self.perceptual_batch_size):
+                batch = pairs[batch_start:batch_start + self.perceptual_batch_size]
+                paths = [img_path for img_path, _ in batch]
+                if executor:
+                    hashes = executor.map(hash_func, paths, chunksize=self.chunk_size)
+                else:
+                    hashes = map(hash_func, paths)
+
+                for (img_path, label_path), value in zip(batch, hashes):
+                    if value is None:
+                        unique_pairs.append((img_path, label_path))  # Unreadable, left for process_splits to report
+                        continue
+
+                    matches = tree.find(value, self.near_duplicate_radius)
+                    if matches:
+                        _, kept = min(matches)
+                        print(f"Removed near-duplicate: {img_path} (similar to {unique_pairs[kept][0]})")
+                        continue
+
+                    tree.add(value, len(unique_pairs))
+                    unique_pairs.append((img_path, label_path))
+        finally:
+            if executor:
+                executor.shutdown()
+
         return unique_pairs
 
     def split_dataset(self, pairs):
@@ -94,45 +440,138 @@ class DatasetMerger:
 
     def process_splits(self, splits):
         """Process and save each split"""
-        for split_name, pairs in splits.items():
-            img_out_dir = os.path.join(self.output_folder, split_name, 'images')
-            lbl_out_dir = os.path.join(self.output_folder, split_name, 'labels')
-            
-            os.makedirs(img_out_dir, exist_ok=True)
-            os.makedirs(lbl_out_dir, exist_ok=True)
-            
-            print(f"Processing {split_name} set ({len(pairs)} samples)")
-            
-            for img_path, lbl_path in pairs:
-                # Process image
-                img = cv2.imread(img_path)
-                if img is None:
-                    print(f"Failed to read image: {img_path}")
-                    continue
-                    
-                resized = cv2.resize(img, self.target_size, interpolation=cv2.INTER_LINEAR)
-                img_filename = os.path.basename(img_path)
-                img_out_path = os.path.join(img_out_dir, img_filename)
-                cv2.imwrite(img_out_path, resized)
-                
-                # Process label
-                lbl_filename = os.path.basename(lbl_path)
-                shutil.copy(lbl_path, os.path.join(lbl_out_dir, lbl_filename))
+        summary = {}
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+        try:
+            for split_name, pairs in splits.items():
+                print(f"Processing {split_name} set ({len(pairs)} samples)")
+
+                start = time.perf_counter()
+                with span(split_name):
+                    if self.output_layout == 'shards':
+                        failed = self.write_shards(split_name, pairs, executor)
+                    else:
+                        failed = self.write_files(split_name, pairs, executor)
+                elapsed = time.perf_counter() - start
+
+                summary[split_name] = {
+                    'images': len(pairs) - len(failed),
+                    'failed': failed,
+                    'seconds': elapsed
+                }
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.print_summary(summary)
+        return summary
+
+    def write_files(self, split_name, pairs, executor):
+        """Write a split as individual image and label files, returning failed image paths"""
+        img_out_dir = os.path.join(self.output_folder, split_name, 'images')
+        lbl_out_dir = os.path.join(self.output_folder, split_name, 'labels')
+
+        os.makedirs(img_out_dir, exist_ok=True)
+        os.makedirs(lbl_out_dir, exist_ok=True)
+
+        tasks = [(img_path, lbl_path, img_out_dir, lbl_out_dir, self.image_options)
+                 for img_path, lbl_path in pairs]
+        if executor:
+            results = executor.map(_process_image, tasks, chunksize=self.chunk_size)
+        else:
+            results = map(_process_image, tasks)
+
+        failed = []
+        for img_path, ok, timings in results:
+            record_image_timings(timings, ok)
+            if not ok:
+                print(f"Failed to read image: {img_path}")
+                failed.append(img_path)
+        
+        if self.write_label_index:
+            # Labels were just written and are still cached, so the validator and filter can
+            # load this index instead of parsing the split again (they still list it)
+            load_label_index(os.path.join(self.output_folder, split_name))
+        return failed
+
+    def write_shards(self, split_name, pairs, executor):
+        """Pack a split into shard files, returning failed image paths"""
+        writer = ShardWriter(os.path.join(self.output_folder, split_name), self.shard_size)
+        label_paths = dict(pairs)
+
+        tasks = [(img_path, self.image_options) for img_path, _ in pairs]
+        if executor:
+            # Encoded images wait in memory until the writer takes them, so only a few
+            # chunks per worker are in flight at once
+            chunks = [tasks[i:i + self.chunk_size] for i in range(0, len(tasks), self.chunk_size)]
+            results = _ordered_results(executor, _encode_chunk, chunks, max_in_flight=2 * self.workers)
+        else:
+            results = map(_encode_image, tasks)
+
+        failed = []
+        for img_path, img_name, image_bytes, timings in results:
+            record_image_timings(timings, image_bytes is not None)
+            if image_bytes is None:
+                print(f"Failed to read image: {img_path}")
+                failed.append(img_path)
+                continue
+            try:
+                labels = parse_label_file(label_paths[img_path])
+            except ValueError as e:
+                print(e)  # Skipped like load_label_index does
+                failed.append(img_path)
+                continue
+            writer.add(img_name, image_bytes, labels)
+
+        self.shard_info[split_name] = writer.close()
+        return failed
+
+    def print_summary(self, summary):
+        """Print per-split throughput and failure counts"""
+        print(f"\nProcessing summary ({self.workers} worker(s)):")
+        for split_name, stats in summary.items():
+            rate = stats['images'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+            print(f"- {split_name}: {stats['images']} images in {stats['seconds']:.1f}s "
+                  f"({rate:.1f} images/sec), {len(stats['failed'])} failures")
 
     def create_yaml(self):
         """Create YOLO dataset config file"""
-        data = {
-            'train': os.path.join('.', 'train', 'images'),
-            'val': os.path.join('.', 'val', 'images'),
-            'test': os.path.join('.', 'test', 'images'),
-            'nc': len(self.class_names),
-            'names': self.class_names
-        }
+        if self.output_layout == 'shards':
+            data = {
+                'format': 'shards',
+                'train': os.path.join('.', 'train'),
+                'val': os.path.join('.', 'val'),
+                'test': os.path.join('.', 'test'),
+                'shards': self.shard_info,
+                'nc': len(self.class_names),
+                'names': self.class_names
+            }
+        else:
+            data = {
+                'train': os.path.join('.', 'train', 'images'),
+                'val': os.path.join('.', 'val', 'images'),
+                'test': os.path.join('.', 'test', 'images'),
+                'nc': len(self.class_names),
+                'names': self.class_names
+            }
         
         with open(os.path.join(self.output_folder, 'data.yaml'), 'w') as f:
             yaml.dump(data, f, sort_keys=False)
 
 if __name__ == "__main__":
+    import argparse
+    import profiling
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process new or changed pairs, tracked by a manifest in the output folder')
+    parser.add_argument('--metrics', help='Write hash/decode/resize/write timings here in Prometheus text format')
+    parser.add_argument('--near-duplicate-radius', type=int, metavar='BITS',
+                        help='Also drop images whose perceptual hashes differ by at most BITS (e.g. 6); off by default')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
     config = {
         'input_folders': [
             r"C:\Users\harsh\OneDrive\Desktop\Drexel\Volunteert\animal_dataset\test",
@@ -143,8 +582,23 @@ if __name__ == "__main__":
         'output_base': r"C:\Users\harsh\OneDrive\Desktop\Drexel\Volunteert",
         'split_ratio': (0.7, 0.2, 0.1),
         'target_size': (640, 640),
-        'class_names': ['snake', 'raccoon', 'squirrel']
+        'class_names': ['snake', 'raccoon', 'squirrel'],
+        'workers': os.cpu_count() or 1,
+        'chunk_size': 32,
+        'hash_algorithm': 'blake2b',
+        'hash_workers': 8,
+        'near_duplicate_radius': args.near_duplicate_radius,
+        'perceptual_hash': 'dhash',
+        'jpeg_quality': 95,
+        'link_mode': 'hardlink',
+        'output_layout': 'files',
+        'incremental': args.incremental
     }
     
     merger = DatasetMerger(config)
-    merger.run()
\ No newline at end of file
+    with profiling.from_args(args):
+        merger.run()
+    
+    if args.metrics:
+        from metrics import write_textfile
+        write_textfile(args.metrics)
\ No newline at end of file
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import uuid
+from datetime import datetime
+from rq import Queue, Retry, get_current_job
+from rq.job import Dependency
+from dataset_merger import DatasetMerger, _process_image, record_image_timings
+from label_index import load_label_index
+from metrics import METRICS
+from profiling import span
+
+# Redis keys per merge id:
+#   merge:<id>         hash: config, output_folder, chunks, state, images, failed_images
+#   merge:<id>:chunks  hash: chunk index -> JSON [split, [[image, label], ...]]
+#   merge:<id>:status  hash: chunk index -> pending | done | failed
+#   merge:<id>:errors  hash: chunk index -> last error
+#   merge:<id>:failed  list of unreadable images
+MERGE_TTL = 7 * 24 * 3600  # Seconds merge state is kept after the last update
+
+_mergers = {}
+
+
+def _key(merge_id, part=None):
+    return f"merge:{merge_id}:{part}" if part else f"merge:{merge_id}"
+
+
+def _merger(connection, merge_id):
+    """DatasetMerger rebuilt from the stored config, writing into the merge's output folder (cached per process)"""
+    if merge_id not in _mergers:
+        config, output_folder = connection.hmget(_key(merge_id), 'config', 'output_folder')
+        if config is None:
+            raise KeyError(f"Unknown merge {merge_id}")
+        merger = DatasetMerger(json.loads(config))
+        merger.output_folder = output_folder.decode()
+        _mergers[merge_id] = merger
+    return _mergers[merge_id]
+
+
+def _connection():
+    job = get_current_job()
+    if job is None:
+        raise RuntimeError("Distributed merge jobs must run inside an RQ worker")
+    return job.connection
+
+
+def enqueue_merge(config, connection, chunk_images=256, retries=2, queue_name='default'):
+    """Plan a merge on this machine and enqueue its resize/write work as chunk jobs
+
+    Pairs are collected, deduplicated and split here exactly as DatasetMerger.run does;
+    any worker.py process then resizes and writes the chunks, and a finalizer writes
+    data.yaml once every chunk is done. Input and output folders must be reachable at the
+    same paths from every worker (e.g. a shared mount). Returns the merge id.
+    """
+    config = {**config, 'incremental': False}
+    merger = DatasetMerger(config)
+    if merger.output_layout != 'files':
+        raise ValueError("Distributed merges only support output_layout 'files'")
+
+    with span('collect_pairs'):
+        all_pairs = merger.collect_pairs()
+    with span('remove_duplicates'):
+        unique_pairs = merger.remove_duplicates(all_pairs)
+    print(f"Found {len(all_pairs)} pairs, {len(unique_pairs)} after removing duplicates")
+
+    if merger.near_duplicate_radius is not None:
+        with span('remove_near_duplicates'):
+            unique_pairs = merger.remove_near_duplicates(unique_pairs)
+        print(f"{len(unique_pairs)} pairs after removing near-duplicates")
+
+    chunks = []
+    for split_name, pairs in merger.split_dataset(unique_pairs).items():
+        os.makedirs(os.path.join(merger.output_folder, split_name, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(merger.output_folder, split_name, 'labels'), exist_ok=True)
+        for start in range(0, len(pairs), chunk_images):
+            chunks.append((split_name, pairs[start:start + chunk_images]))
+
+    merge_id = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+    pipe = connection.pipeline()
+    pipe.hset(_key(merge_id), mapping={
+        'config': json.dumps(config),
+        'output_folder': merger.output_folder,
+        'chunks': len(chunks),
+        'state': 'running',
+        'created': time.time()
+    })
+    if chunks:
+        pipe.hset(_key(merge_id, 'chunks'), mapping={i: json.dumps(chunk) for i, chunk in enumerate(chunks)})
+        pipe.hset(_key(merge_id, 'status'), mapping=dict.fromkeys(range(len(chunks)), 'pending'))
+    for part in (None, 'chunks', 'status'):
+        pipe.expire(_key(merge_id, part), MERGE_TTL)
+    pipe.execute()
+
+    _enqueue_chunks(connection, merge_id, range(len(chunks)), retries, queue_name)
+    print(f"Merge {merge_id}: enqueued {len(chunks)} chunks of up to {chunk_images} images into {merger.output_folder}")
+    return merge_id
+
+
+def resume_merge(connection, merge_id, retries=2, queue_name='default'):
+    """Re-enqueue every chunk that is not done (e.g. failed after all retries), plus a new finalizer"""
+    statuses = connection.hgetall(_key(merge_id, 'status'))
+    indices = sorted(int(i) for i, status in statuses.items() if status != b'done')
+    connection.hset(_key(merge_id), 'state', 'running')
+    _enqueue_chunks(connection, merge_id, indices, retries, queue_name)
+    print(f"Merge {merge_id}: re-enqueued {len(indices)} chunks")
+    return indices
+
+
+def _enqueue_chunks(connection, merge_id, indices, retries, queue_name):
+    """Enqueue chunk jobs in one round trip, then a finalizer that waits for all of them"""
+    # Jobs name their functions by import path so enqueueing also works from this file's __main__
+    queue = Queue(queue_name, connection=connection)
+    jobs = queue.enqueue_many([
+        Queue.prepare_data(
+            'distributed_merge.process_chunk', args=(merge_id, i),
+            retry=Retry(max=retries) if retries else None,
+            description=f"merge {merge_id}: chunk {i}"
+        )
+        for i in indices
+    ])
+    # allow_failure: the finalizer also runs when chunks fail for good, and records it
+    queue.enqueue(
+        'distributed_merge.finalize_merge', merge_id,
+        depends_on=Dependency(jobs=jobs, allow_failure=True) if jobs else None,
+        description=f"merge {merge_id}: finalize"
+    )
+
+
+def process_chunk(merge_id, chunk_index):
+    """Job: resize and write one chunk of a distributed merge"""
+    connection = _connection()
+    merger = _merger(connection, merge_id)
+    try:
+        split_name, pairs = json.loads(connection.hget(_key(merge_id, 'chunks'), chunk_index))
+        img_out_dir = os.path.join(merger.output_folder, split_name, 'images')
+        lbl_out_dir = os.path.join(merger.output_folder, split_name, 'labels')
+        os.makedirs(img_out_dir, exist_ok=True)
+        os.makedirs(lbl_out_dir, exist_ok=True)
+
+        failed = []
+        for img_path, lbl_path in pairs:
+            _, ok, timings = _process_image((img_path, lbl_path, img_out_dir, lbl_out_dir, merger.image_options))
+            record_image_timings(timings, ok)
+            if not ok:
+                print(f"Failed to read image: {img_path}")
+                failed.append(img_path)
+    except Exception as e:
+        # Marked failed for the finalizer; RQ still retries the job if attempts remain
+        connection.hset(_key(merge_id, 'status'), chunk_index, 'failed')
+        connection.hset(_key(merge_id, 'errors'), chunk_index, repr(e))
+        connection.expire(_key(merge_id, 'errors'), MERGE_TTL)
+        raise
+    finally:
+        METRICS.flush(connection)
+
+    # Counts are only added once, by the attempt that completes the chunk
+    pipe = connection.pipeline()
+    pipe.hset(_key(merge_id, 'status'), chunk_index, 'done')
+    pipe.hincrby(_key(merge_id), 'images', len(pairs) - len(failed))
+    pipe.hincrby(_key(merge_id), 'failed_images', len(failed))
+    if failed:
+        pipe.rpush(_key(merge_id, 'failed'), *failed)
+        pipe.expire(_key(merge_id, 'failed'), MERGE_TTL)
+    pipe.execute()
+    return {'images': len(pairs) - len(failed), 'failed': len(failed)}
+
+
+def finalize_merge(merge_id):
+    """Job: write data.yaml (and label indexes) once every chunk is done"""
+    connection = _connection()
+    status = merge_status(connection, merge_id)
+    if status['pending'] or status['failed']:
+        connection.hset(_key(merge_id), 'state', 'incomplete')
+        print(f"Merge {merge_id} incomplete: {status['failed']} chunks failed, {status['pending']} pending; "
+              f"re-run them with distributed_merge.py --resume {merge_id}")
+        return status
+
+    merger = _merger(connection, merge_id)
+    if merger.write_label_index:
+        for split_name in ('train', 'val', 'test'):
+            load_label_index(os.path.join(merger.output_folder, split_name))
+    merger.create_yaml()
+    connection.hset(_key(merge_id), mapping={'state': 'complete', 'finished': time.time()})
+    status['state'] = 'complete'
+    print(f"Merge {merge_id} complete: {status['images']} images ({status['failed_images']} unreadable) "
+          f"in {merger.output_folder}")
+    return status
+
+
+def merge_status(connection, merge_id):
+    """Chunk counts by status plus image totals for a merge"""
+    pipe = connection.pipeline(transaction=False)
+    pipe.hgetall(_key(merge_id))
+    pipe.hvals(_key(merge_id, 'status'))
+    info, statuses = pipe.execute()
+    if not info:
+        raise KeyError(f"Unknown merge {merge_id}")
+    return {
+        'state': info[b'state'].decode(),
+        'output_folder': info[b'output_folder'].decode(),
+        'chunks': int(info[b'chunks']),
+        'done': statuses.count(b'done'),
+        'failed': statuses.count(b'failed'),
+        'pending': statuses.count(b'pending'),
+        'images': int(info.get(b'images', 0)),
+        'failed_images': int(info.get(b'failed_images', 0))
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import yaml
+    import profiling
+    from redis import Redis
+
+    parser = argparse.ArgumentParser(description="Merge datasets with the resize/write work spread over RQ workers")
+    parser.add_argument('input_folders', nargs='*', help='Dataset folders with images/ and labels/ (default: existing_datasets)')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--redis-host', default=os.getenv('REDIS_HOST', 'localhost'))
+    parser.add_argument('--redis-port', type=int, default=int(os.getenv('REDIS_PORT', 6379)))
+    parser.add_argument('--fake-redis', action='store_true',
+                        help='Use an in-process fakeredis server (implies --burst); for local testing, '
+                             'needs requirements-dev.txt')
+    parser.add_argument('--burst', action='store_true',
+                        help='Also work the queue in this process until it is empty')
+    parser.add_argument('--status', metavar='MERGE_ID', help='Print the progress of a merge and exit')
+    parser.add_argument('--resume', metavar='MERGE_ID', help='Re-enqueue the chunks of a merge that did not finish')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    merge_config = config.get('distributed_merge', {})
+
+    if args.fake_redis:
+        import fakeredis
+        connection = fakeredis.FakeRedis()
+    else:
+        connection = Redis(host=args.redis_host, port=args.redis_port)
+
+    with profiling.from_args(args):
+        if args.status:
+            print(merge_status(connection, args.status))
+        else:
+            if args.resume:
+                merge_id = args.resume
+                resume_merge(connection, merge_id, merge_config.get('retries', 2))
+            else:
+                merge_id = enqueue_merge({
+                    'input_folders': args.input_folders or config.get('existing_datasets', []),
+                    'output_base': config['output_base'],
+                    'split_ratio': config['split_ratios'],
+                    'target_size': config['target_size'],
+                    'class_names': config['class_names'],
+                    'write_label_index': merge_config.get('write_label_index', True)
+                }, connection, merge_config.get('chunk_images', 256), merge_config.get('retries', 2))
+
+            if args.burst or args.fake_redis:
+                from rq import SimpleWorker
+                SimpleWorker(['default'], connection=connection).work(burst=True)
+                print(merge_status(connection, merge_id))
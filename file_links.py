@@ -0,0 +1,48 @@
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, XFS, ...)
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def link_file(src, dst, mode='hardlink'):
+    """Place src at dst by hardlink, reflink, symlink or copy, falling back to a copy if linking fails
+
+    Returns the mode that was actually used.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return 'hardlink'
+        if mode == 'reflink':
+            _reflink(src, dst)
+            return 'reflink'
+        if mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+            return 'symlink'
+    except (OSError, NotImplementedError):
+        pass  # Cross-device, unsupported filesystem or missing privileges
+
+    shutil.copy2(src, dst)
+    return 'copy'
@@ -1,7 +1,90 @@
 import os
+import cv2
 import yaml
-import shutil
 from tqdm import tqdm
+import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from label_index import load_label_index, parse_label_file
+from file_links import LINK_MODES, link_file
+from profiling import span
+
+def tile_origins(length, tile, overlap):
+    """Start offsets of tiles covering [0, length) with at least the given overlap fraction"""
+    if length <= tile:
+        return np.zeros(1, dtype=np.int64)
+    count = int(np.ceil((length - tile) / (tile * (1 - overlap)))) + 1
+    return np.round(np.linspace(0, length - tile, count)).astype(np.int64)
+
+
+def clip_boxes_to_tiles(boxes, tiles, min_visibility=0.5):
+    """Clip pixel boxes (N, 4: x1 y1 x2 y2) to every tile (T, 4) at once
+
+    Returns (clipped (T, N, 4) in tile-relative pixels, keep (T, N)) where keep marks boxes
+    with at least min_visibility of their area inside the tile.
+    """
+    tiles = tiles[:, None, :]
+    x1 = np.maximum(boxes[None, :, 0], tiles[..., 0])
+    y1 = np.maximum(boxes[None, :, 1], tiles[..., 1])
+    x2 = np.minimum(boxes[None, :, 2], tiles[..., 2])
+    y2 = np.minimum(boxes[None, :, 3], tiles[..., 3])
+    visible = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = visible >= min_visibility * np.maximum(area, 1e-12)[None, :]
+    clipped = np.stack([x1 - tiles[..., 0], y1 - tiles[..., 1], x2 - tiles[..., 0], y2 - tiles[..., 1]], axis=-1)
+    return clipped, keep
+
+
+def _tile_image(task):
+    """Cut tiles around one image's small objects and write them with their labels (runs inside pool workers)
+
+    Every small object gets the grid tile whose centre is nearest its own, so each one is
+    covered with the most context and overlapping neighbours are not written twice.
+    Returns (img_path, tiles written, boxes kept, boxes dropped); tiles is None if unreadable.
+    """
+    img_path, boxes, img_out_dir, lbl_out_dir, tile_size, overlap, min_visibility, threshold = task
+    img = cv2.imread(img_path)
+    if img is None:
+        return img_path, None, 0, 0
+
+    h, w = img.shape[:2]
+    tile_w, tile_h = min(tile_size, w), min(tile_size, h)
+    xs, ys = np.meshgrid(tile_origins(w, tile_w, overlap), tile_origins(h, tile_h, overlap))
+    tiles = np.stack([xs.ravel(), ys.ravel(), xs.ravel() + tile_w, ys.ravel() + tile_h], axis=1)
+
+    # YOLO boxes (cls, cx, cy, bw, bh) relative to the image -> pixel corners
+    cls = boxes[:, 0].astype(np.int64)
+    cx, cy, bw, bh = boxes[:, 1] * w, boxes[:, 2] * h, boxes[:, 3] * w, boxes[:, 4] * h
+    corners = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+    small = (boxes[:, 3] < threshold) & (boxes[:, 4] < threshold)
+    tile_centres = (tiles[:, :2] + tiles[:, 2:]) / 2
+    distances = ((tile_centres[:, None, :] - np.stack([cx, cy], axis=1)[None, small]) ** 2).sum(axis=2)
+    tiles = tiles[np.unique(distances.argmin(axis=0))]
+
+    clipped, keep = clip_boxes_to_tiles(corners, tiles, min_visibility)
+    stem, ext = os.path.splitext(os.path.basename(img_path))
+    kept = 0
+    for (x1, y1, x2, y2), tile_boxes, tile_keep in zip(tiles, clipped, keep):
+        tile_boxes = tile_boxes[tile_keep]
+        labels = np.column_stack([
+            cls[tile_keep],
+            (tile_boxes[:, 0] + tile_boxes[:, 2]) / 2 / tile_w,
+            (tile_boxes[:, 1] + tile_boxes[:, 3]) / 2 / tile_h,
+            (tile_boxes[:, 2] - tile_boxes[:, 0]) / tile_w,
+            (tile_boxes[:, 3] - tile_boxes[:, 1]) / tile_h
+        ])
+        name = f"{stem}_{ext[1:]}_{x1}_{y1}"  # Extension kept so a.jpg and a.png do not share tiles
+        cv2.imwrite(os.path.join(img_out_dir, name + ext), img[y1:y2, x1:x2])
+        np.savetxt(os.path.join(lbl_out_dir, name + '.txt'), labels, fmt=['%d'] + ['%.6f'] * 4)
+        kept += len(labels)
+
+    # Dropped: boxes that show in some written tile but are kept by none of them (a box cut
+    # off at one tile's border is usually kept by the tile next to it)
+    visible = (clipped[..., 2] > clipped[..., 0]) & (clipped[..., 3] > clipped[..., 1])
+    dropped = int((visible.any(axis=0) & ~keep.any(axis=0)).sum())
+    return img_path, len(tiles), kept, dropped
+
 
 class SmallObjectFilter:
     def __init__(self, dataset_path, max_size_threshold=0.05):
@@ -16,60 +99,170 @@ class SmallObjectFilter:
         with open(os.path.join(dataset_path, 'data.yaml')) as f:
             self.config = yaml.safe_load(f)
     
-    def filter_dataset(self, output_dir):
-        """Filter dataset keeping only images with small objects"""
+    def filter_dataset(self, output_dir, link_mode='copy'):
+        """Filter dataset keeping only images with small objects
+        
+        link_mode is one of copy, hardlink, reflink, symlink (unsupported links fall back
+        to copies) or manifest, which writes per-split file lists instead of any files.
+        """
         os.makedirs(output_dir, exist_ok=True)
+        splits = [split for split in ['train', 'val', 'test']
+                  if os.path.exists(os.path.join(self.dataset_path, split))]
+        
+        # Splits are filtered concurrently; the work is dominated by file I/O
+        with ThreadPoolExecutor(max_workers=max(len(splits), 1)) as executor:
+            results = dict(zip(splits, executor.map(
+                lambda split: self.filter_split(split, output_dir, link_mode), splits)))
         
-        # Create output directory structure
-        for split in ['train', 'val', 'test']:
-            split_path = os.path.join(self.dataset_path, split)
-            if not os.path.exists(split_path):
+        self.create_yaml(output_dir, results, link_mode)
+        
+        for split, modes in results.items():
+            summary = ', '.join(f"{count} {mode}" for mode, count in modes.items())
+            print(f"{split}: {summary or 'no images selected'}")
+    
+    def filter_split(self, split, output_dir, link_mode):
+        """Place one split's selected images, returning how many were placed per mode"""
+        split_path = os.path.join(self.dataset_path, split)
+        
+        # Select images with at least one small box in a single vectorized pass
+        with span(f'select_small_objects:{split}'):
+            index = load_label_index(split_path)
+            small = (index.w < self.threshold) & (index.h < self.threshold)
+            selected = [str(index.image_names[image_id]) for image_id in np.unique(index.image_id[small])]
+        
+        if link_mode == 'manifest':
+            # Only a file list; YOLO finds each label by swapping /images/ for /labels/
+            with open(os.path.join(output_dir, f'{split}.txt'), 'w') as f:
+                for img_file in selected:
+                    f.write(os.path.abspath(os.path.join(split_path, 'images', img_file)) + '\n')
+            return Counter({'manifest': len(selected)})
+        
+        # Create output subdirectories
+        os.makedirs(os.path.join(output_dir, split, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(output_dir, split, 'labels'), exist_ok=True)
+        
+        modes = Counter()
+        with span(f'place_files:{split}'):
+            for img_file in tqdm(selected, desc=split):
+                label_name = os.path.splitext(img_file)[0] + '.txt'
+                modes[link_file(
+                    os.path.join(split_path, 'images', img_file),
+                    os.path.join(output_dir, split, 'images', img_file),
+                    link_mode
+                )] += 1
+                link_file(
+                    os.path.join(split_path, 'labels', label_name),
+                    os.path.join(output_dir, split, 'labels', label_name),
+                    link_mode
+                )
+        return modes
+    
+    def tile_dataset(self, output_dir, tile_size=640, overlap=0.2, min_visibility=0.5, workers=None):
+        """Write tiles cut around small objects instead of whole images
+
+        Tiles are tile_size pixels square (smaller images are kept whole) and overlap their
+        grid neighbours by the overlap fraction. Boxes are clipped to each tile and dropped
+        when less than min_visibility of their area is inside it.
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError(f"Tile overlap must be in [0, 1), got {overlap}")
+        os.makedirs(output_dir, exist_ok=True)
+        splits = [split for split in ['train', 'val', 'test']
+                  if os.path.exists(os.path.join(self.dataset_path, split))]
+
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for split in splits:
+                with span(f'tile:{split}'):
+                    results[split] = self.tile_split(split, output_dir, tile_size, overlap, min_visibility, executor)
+
+        self.create_yaml(output_dir, results, 'copy')
+
+        for split, stats in results.items():
+            print(f"{split}: {stats['images']} images -> {stats['tiles']} tiles, "
+                  f"{stats['boxes']} boxes kept, {stats['dropped']} clipped boxes dropped, {stats['failed']} unreadable")
+
+    def tile_split(self, split, output_dir, tile_size, overlap, min_visibility, executor):
+        """Tile one split's small-object images on the pool, returning tile and box counts"""
+        split_path = os.path.join(self.dataset_path, split)
+        index = load_label_index(split_path)
+        small = (index.w < self.threshold) & (index.h < self.threshold)
+        selected = np.unique(index.image_id[small])
+
+        img_out_dir = os.path.join(output_dir, split, 'images')
+        lbl_out_dir = os.path.join(output_dir, split, 'labels')
+        os.makedirs(img_out_dir, exist_ok=True)
+        os.makedirs(lbl_out_dir, exist_ok=True)
+
+        # Box rows are grouped by image, so each image's boxes are one slice
+        starts = np.searchsorted(index.image_id, selected, side='left')
+        ends = np.searchsorted(index.image_id, selected, side='right')
+        tasks = [(os.path.join(split_path, 'images', str(index.image_names[image_id])), index.boxes[start:end],
+                  img_out_dir, lbl_out_dir, tile_size, overlap, min_visibility, self.threshold)
+                 for image_id, start, end in zip(selected, starts, ends)]
+
+        stats = Counter(images=len(tasks))
+        for img_path, tiles, kept, dropped in tqdm(executor.map(_tile_image, tasks, chunksize=16),
+                                                    total=len(tasks), desc=split):
+            if tiles is None:
+                print(f"Failed to read image: {img_path}")
+                stats['failed'] += 1
                 continue
-                
-            # Create output subdirectories
-            os.makedirs(os.path.join(output_dir, split, 'images'), exist_ok=True)
-            os.makedirs(os.path.join(output_dir, split, 'labels'), exist_ok=True)
-            
-            # Process each image
-            for img_file in tqdm(os.listdir(os.path.join(split_path, 'images'))):
-                if not img_file.endswith(('.jpg', '.png', '.jpeg')):
-                    continue
-                
-                label_file = os.path.join(split_path, 'labels', os.path.splitext(img_file)[0] + '.txt')
-                if not os.path.exists(label_file):
-                    continue
-                
-                if self.has_small_objects(label_file):
-                    # Copy image and label
-                    shutil.copy2(
-                        os.path.join(split_path, 'images', img_file),
-                        os.path.join(output_dir, split, 'images', img_file)
-                    )
-                    shutil.copy2(
-                        os.path.join(split_path, 'labels', label_file),
-                        os.path.join(output_dir, split, 'labels', os.path.basename(label_file))
-                    )
+            stats['tiles'] += tiles
+            stats['boxes'] += kept
+            stats['dropped'] += dropped
+        return stats
+
+    def create_yaml(self, output_dir, splits, link_mode):
+        """Write data.yaml for the filtered dataset"""
+        data = {}
+        for split in splits:
+            if link_mode == 'manifest':
+                data[split] = os.path.abspath(os.path.join(output_dir, f'{split}.txt'))
+            else:
+                data[split] = os.path.join('.', split, 'images')
+        data['nc'] = self.config.get('nc', len(self.config['names']))
+        data['names'] = self.config['names']
+        
+        with open(os.path.join(output_dir, 'data.yaml'), 'w') as f:
+            yaml.dump(data, f, sort_keys=False)
     
     def has_small_objects(self, label_path):
         """Check if label file contains small objects"""
-        with open(label_path) as f:
-            for line in f:
-                _, x, y, w, h = map(float, line.strip().split())
-                if w < self.threshold and h < self.threshold:
-                    return True
-        return False
+        boxes = parse_label_file(label_path)
+        return bool(np.any((boxes[:, 3] < self.threshold) & (boxes[:, 4] < self.threshold)))
 
 if __name__ == "__main__":
     import argparse
+    import profiling
     
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', type=str, required=True, help='Input YOLO dataset path')
     parser.add_argument('--output', type=str, required=True, help='Output directory for filtered dataset')
     parser.add_argument('--threshold', type=float, default=0.05, 
                        help='Size threshold (default: 0.05 = 5% of image dimension)')
+    parser.add_argument('--link-mode', choices=LINK_MODES + ('manifest',),
+                       help='How selected files are placed; manifest writes file lists only (default: copy)')
+    parser.add_argument('--tile', type=int, metavar='SIZE',
+                       help='Write SIZE x SIZE tiles around small objects instead of whole images')
+    parser.add_argument('--overlap', type=float, default=0.2,
+                       help='Fraction by which neighbouring tiles overlap (default: 0.2)')
+    parser.add_argument('--min-visibility', type=float, default=0.5,
+                       help='Drop boxes with less than this fraction of their area inside a tile (default: 0.5)')
+    parser.add_argument('--workers', type=int, help='Tiling processes (default: CPU count)')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    if args.tile is not None:
+        if args.tile <= 0:
+            parser.error('--tile SIZE must be a positive number of pixels')
+        if args.link_mode is not None:
+            parser.error('--link-mode does not apply to --tile; tiles are always written as new files')
     
     filter = SmallObjectFilter(args.dataset, args.threshold)
-    filter.filter_dataset(args.output)
+    with profiling.from_args(args):
+        if args.tile is not None:
+            filter.tile_dataset(args.output, args.tile, args.overlap, args.min_visibility, args.workers)
+        else:
+            filter.filter_dataset(args.output, args.link_mode or 'copy')
     
     print(f"Filtered dataset with small objects saved to {args.output}")
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import struct
+import cv2
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but do not
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def read_image_header(path):
+    """Return (width, height, exif_orientation) from the file header, or None if unparseable"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+            if head.startswith(PNG_SIGNATURE) and head[12:16] == b'IHDR':
+                width, height = struct.unpack('>II', head[16:24])
+                return width, height, 1
+            if head.startswith(b'\xff\xd8'):
+                f.seek(2)
+                return _read_jpeg_header(f)
+    except (OSError, ValueError, struct.error):
+        pass
+    return None
+
+
+def read_image_size(path):
+    """Return the (width, height) an image decodes to, or None if the header is unparseable"""
+    header = read_image_header(path)
+    return oriented_size(header) if header else None
+
+
+def probe_image_size(path):
+    """Return (width, height) from the header, decoding the image only if the header is unparseable"""
+    size = read_image_size(path)
+    if size is not None:
+        return size
+
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    return width, height
+
+
+def oriented_size(header):
+    """Apply the EXIF orientation of a parsed header to its stored (width, height)"""
+    width, height, orientation = header
+    if orientation in (5, 6, 7, 8):  # Rotated by 90 degrees when decoded
+        return height, width
+    return width, height
+
+
+def _read_jpeg_header(f):
+    orientation = 1
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+
+        marker = f.read(1)
+        while marker == b'\xff':  # Fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):  # End of image / start of scan before any frame header
+            return None
+
+        length = struct.unpack('>H', f.read(2))[0]
+        if length < 2:  # The length counts its own two bytes; anything less is corrupt
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            return width, height, orientation
+
+        segment = f.read(length - 2)
+        if marker == 0xE1 and segment.startswith(b'Exif\x00\x00'):
+            orientation = _exif_orientation(segment[6:]) or orientation
+
+
+def _exif_orientation(tiff):
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return None
+
+    try:
+        ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+        entry_count = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(entry_count):
+            entry = ifd_offset + 2 + i * 12
+            tag, _, _ = struct.unpack(endian + 'HHI', tiff[entry:entry + 8])
+            if tag == EXIF_ORIENTATION_TAG:
+                return struct.unpack(endian + 'H', tiff[entry + 8:entry + 10])[0]
+    except struct.error:
+        pass
+    return None
+
+
+class DimensionCache:
+    """Persistent (path, mtime) -> (width, height) cache so repeat probes only stat files"""
+
+    def __init__(self, db_path, flush_every=1000):
+        self.conn = sqlite3.connect(db_path, timeout=30)  # Shared by parallel validation workers
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS dimensions (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.flush_every = flush_every
+        self.pending = []
+
+    def get_size(self, path):
+        """Return (width, height) of an image, or None if it cannot be read"""
+        path = os.path.abspath(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        row = self.conn.execute(
+            "SELECT width, height FROM dimensions WHERE path = ? AND mtime_ns = ?", (path, mtime_ns)
+        ).fetchone()
+        if row:
+            return row
+
+        size = probe_image_size(path)
+        if size is not None:
+            self.pending.append((path, mtime_ns, *size))
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+        return size
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.conn.executemany("INSERT OR REPLACE INTO dimensions VALUES (?, ?, ?, ?)", self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
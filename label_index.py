@@ -0,0 +1,125 @@
+import os
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.jpeg')
+LABEL_INDEX_FILE = 'labels.index.npz'
+LABEL_INDEX_VERSION = 3  # Bump when the cached arrays change; 2: float64 boxes, 3: strict line parsing
+
+
+def parse_label_file(label_path):
+    """Load a YOLO label file as an (N, 5) float64 array
+
+    Raises ValueError unless every non-empty line holds exactly five numbers (so polygon
+    labels are rejected too).
+    """
+    with open(label_path) as f:
+        rows = [line.split() for line in f if line.strip()]
+    if any(len(row) != 5 for row in rows):
+        raise ValueError(f"Malformed label file: {label_path}")
+    try:
+        return np.array(rows, dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        raise ValueError(f"Non-numeric value in label file: {label_path}") from None
+
+
+class LabelIndex:
+    """Every box of a split in contiguous columns, one row per box
+
+    image_names[i] is the i-th image of the split; has_label[i] says whether its
+    label file exists. Box columns (image_id, cls, x, y, w, h) all share one length.
+    """
+
+    def __init__(self, image_names, label_mtimes, image_id, boxes):
+        self.image_names = image_names
+        self.label_mtimes = label_mtimes
+        self.has_label = label_mtimes >= 0
+        self.image_id = image_id
+        self.cls = boxes[:, 0].astype(np.int32)
+        self.x = boxes[:, 1]
+        self.y = boxes[:, 2]
+        self.w = boxes[:, 3]
+        self.h = boxes[:, 4]
+        self.boxes = boxes
+
+    def __len__(self):
+        return len(self.image_names)
+
+    def class_counts(self, num_classes):
+        """Number of boxes per class id; ids outside range(num_classes) are left out (see unknown_class_images)"""
+        known = (self.cls >= 0) & (self.cls < num_classes)
+        return np.bincount(self.cls[known], minlength=num_classes)
+
+    def unknown_class_images(self, num_classes):
+        """Names of images with a box whose class id is outside range(num_classes)"""
+        unknown = (self.cls < 0) | (self.cls >= num_classes)
+        return self.image_names[np.unique(self.image_id[unknown])]
+
+    def boxes_per_image(self):
+        return np.bincount(self.image_id, minlength=len(self.image_names))
+
+
+def scan_pairs(folder, label_mtimes=True):
+    """List folder/images and folder/labels once each with scandir and join them by file stem
+
+    Image extensions match in any case (.JPG, .Png). Returns (image_names, label_mtimes):
+    the sorted image filenames and, per image, its label file's mtime in ns or -1 when it
+    has no label. With label_mtimes=False present labels are 0 and no label is stat'ed.
+    """
+    images = []
+    with os.scandir(os.path.join(folder, 'images')) as entries:
+        for entry in entries:
+            stem, dot, ext = entry.name.rpartition('.')
+            if dot and '.' + ext.lower() in IMAGE_EXTENSIONS and entry.is_file():
+                images.append((entry.name, stem))
+    images.sort()
+
+    labels = {}
+    labels_dir = os.path.join(folder, 'labels')
+    if os.path.isdir(labels_dir):
+        with os.scandir(labels_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.txt'):
+                    labels[entry.name[:-4]] = entry.stat().st_mtime_ns if label_mtimes else 0
+
+    mtimes = np.array([labels.get(stem, -1) for _, stem in images], dtype=np.int64)
+    return np.array([name for name, _ in images], dtype=str), mtimes
+
+
+def load_label_index(split_path, use_cache=True):
+    """Load a split's LabelIndex, rebuilding the on-disk cache when any label file changed
+
+    The split is listed on every call, cache hit or not: the listing and label mtimes are
+    what tell a fresh cache from a stale one. A hit only saves parsing the label files.
+    """
+    image_names, label_mtimes = scan_pairs(split_path)
+    cache_path = os.path.join(split_path, LABEL_INDEX_FILE)
+
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if ('version' in cached.files and int(cached['version']) == LABEL_INDEX_VERSION
+                    and np.array_equal(cached['image_names'], image_names)
+                    and np.array_equal(cached['label_mtimes'], label_mtimes)):
+                return LabelIndex(image_names, label_mtimes, cached['image_id'], cached['boxes'])
+
+    labels_dir = os.path.join(split_path, 'labels')
+    image_ids = []
+    boxes = []
+    for i in np.flatnonzero(label_mtimes >= 0):
+        label_path = os.path.join(labels_dir, os.path.splitext(image_names[i])[0] + '.txt')
+        try:
+            labels = parse_label_file(label_path)
+        except ValueError as e:
+            print(e)
+            continue
+        boxes.append(labels)
+        image_ids.append(np.full(len(labels), i, dtype=np.int32))
+
+    boxes = np.concatenate(boxes) if boxes else np.zeros((0, 5), dtype=np.float64)
+    image_id = np.concatenate(image_ids) if image_ids else np.zeros(0, dtype=np.int32)
+
+    if use_cache:
+        with open(cache_path + '.tmp', 'wb') as f:
+            np.savez(f, version=LABEL_INDEX_VERSION, image_names=image_names, label_mtimes=label_mtimes,
+                     image_id=image_id, boxes=boxes)
+        os.replace(cache_path + '.tmp', cache_path)
+    return LabelIndex(image_names, label_mtimes, image_id, boxes)
@@ -0,0 +1,88 @@
+import os
+import socket
+import threading
+import uuid
+
+# Both scripts only act while the key still holds our token, so an owner whose lease expired
+# can never extend or delete a lease that has since been taken by someone else
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLock:
+    """Redis lease held by one owner at a time, kept alive by a heartbeat thread
+
+    The lease expires ttl seconds after the last renewal, so a worker that crashes or is
+    killed mid-job frees it without anyone cleaning up. Not reentrant.
+    """
+
+    def __init__(self, connection, name, ttl=120, heartbeat=None):
+        """
+        Args:
+            name: Lock name; stored at lock:<name>
+            ttl: Seconds the lease survives without a renewal
+            heartbeat: Seconds between renewals (default ttl / 3)
+        """
+        self.connection = connection
+        self.key = f"lock:{name}"
+        self.ttl = ttl
+        self.heartbeat = heartbeat or ttl / 3
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.lost = threading.Event()  # Set if a renewal found the lease gone or taken over
+        self._renew = connection.register_script(RENEW_SCRIPT)
+        self._release = connection.register_script(RELEASE_SCRIPT)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        """Take the lease if nobody holds it; never blocks"""
+        if not self.connection.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)):
+            return False
+        self.lost.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._keep_alive, name=f"lease-{self.key}", daemon=True)
+        self._thread.start()
+        return True
+
+    def release(self):
+        """Stop the heartbeat and delete the lease if it is still ours"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._release(keys=[self.key], args=[self.token])
+
+    def holder(self):
+        """Token of the current owner (host:pid:id), or None when the lease is free"""
+        value = self.connection.get(self.key)
+        return value.decode() if value else None
+
+    def _keep_alive(self):
+        while not self._stop.wait(self.heartbeat):
+            try:
+                renewed = self._renew(keys=[self.key], args=[self.token, int(self.ttl * 1000)])
+            except Exception as e:
+                print(f"Lease heartbeat failed for {self.key}: {e}")
+                continue  # Try again; the lease survives until ttl runs out
+            if not renewed:
+                print(f"Lease lost: {self.key}")
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        if self._thread:
+            self.release()
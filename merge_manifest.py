@@ -0,0 +1,63 @@
+import os
+import sqlite3
+
+
+class MergeManifest:
+    """On-disk index of merged pairs keyed by source image path"""
+
+    COLUMNS = ('image_path', 'label_path', 'size', 'mtime_ns', 'label_mtime_ns',
+               'content_hash', 'split', 'image_out', 'label_out')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pairs (
+                image_path TEXT PRIMARY KEY,
+                label_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                label_mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                split TEXT,
+                image_out TEXT,
+                label_out TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_hash ON pairs (content_hash)")
+        self.conn.commit()
+
+    def load(self):
+        """Return every row as a dict keyed by source image path"""
+        rows = self.conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM pairs")
+        return {row[0]: dict(zip(self.COLUMNS, row)) for row in rows}
+
+    @staticmethod
+    def is_unchanged(row, size, mtime_ns, label_mtime_ns):
+        """Check whether a manifest row still matches the files on disk"""
+        return (
+            row is not None
+            and row['size'] == size
+            and row['mtime_ns'] == mtime_ns
+            and row['label_mtime_ns'] == label_mtime_ns
+        )
+
+    def upsert(self, rows):
+        """Insert or replace rows (dicts with the manifest columns)"""
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO pairs ({', '.join(self.COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in self.COLUMNS)})",
+            [tuple(row[col] for col in self.COLUMNS) for row in rows]
+        )
+        self.conn.commit()
+
+    def remove(self, image_paths):
+        """Drop rows for sources that no longer exist"""
+        self.conn.executemany("DELETE FROM pairs WHERE image_path = ?", [(p,) for p in image_paths])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,256 @@
+import os
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; covers sub-millisecond hashes up to multi-minute dataset downloads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+COUNTERS_KEY = "metrics:counters"  # Redis hash: series -> running total
+HISTOGRAMS_KEY = "metrics:histograms"  # Redis hash: "series|<le>", "series|sum", "series|count" -> totals
+
+
+def series_name(name, labels):
+    """Prometheus series identifier, e.g. download_seconds{source="reddit"}"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+def _split_series(series):
+    """Split a series into (metric name, label part including braces)"""
+    name, _, labels = series.partition('{')
+    return name, '{' + labels if labels else ''
+
+
+class Metrics:
+    """Thread-safe in-process counters and histograms, pushed to Redis in one pipelined round trip
+
+    Each process records locally and flush() adds its deltas to the shared Redis totals,
+    so hot paths never wait on the network.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}  # series -> [per-bucket counts..., +Inf count, sum]
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        series = series_name(name, labels)
+        with self.lock:
+            self.counters[series] += value
+
+    def observe(self, name, value, **labels):
+        """Record one observation (usually seconds) in a histogram"""
+        series = series_name(name, labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            hist = self.histograms.get(series)
+            if hist is None:
+                hist = self.histograms[series] = [0] * (len(self.buckets) + 1) + [0.0]
+            hist[slot] += 1
+            hist[-1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of a with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def drain(self):
+        """Return and clear everything recorded so far, e.g. to ship it back from a pool worker"""
+        with self.lock:
+            snapshot = (dict(self.counters), self.histograms)
+            self.counters = defaultdict(float)
+            self.histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add a snapshot taken with drain() (possibly in another process)"""
+        counters, histograms = snapshot
+        with self.lock:
+            for series, value in counters.items():
+                self.counters[series] += value
+            for series, values in histograms.items():
+                hist = self.histograms.setdefault(series, [0] * (len(self.buckets) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    hist[i] += value
+
+    def flush(self, connection):
+        """Add local deltas to the Redis totals in one MULTI/EXEC round trip
+
+        The transaction keeps readers from seeing a histogram's buckets without its count.
+        """
+        counters, histograms = self.drain()
+        if not counters and not histograms:
+            return
+
+        pipe = connection.pipeline(transaction=True)
+        for series, value in counters.items():
+            pipe.hincrbyfloat(COUNTERS_KEY, series, value)
+        for series, values in histograms.items():
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                if count:
+                    pipe.hincrby(HISTOGRAMS_KEY, f"{series}|{bound}", count)
+            pipe.hincrby(HISTOGRAMS_KEY, f"{series}|count", sum(values[:-1]))
+            pipe.hincrbyfloat(HISTOGRAMS_KEY, f"{series}|sum", values[-1])
+        pipe.execute()
+
+    def snapshot(self):
+        """Current local totals in the same shape as read_totals()"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {}
+            for series, values in self.histograms.items():
+                histograms[series] = {
+                    'buckets': dict(zip(self.buckets + (float('inf'),), values[:-1])),
+                    'count': sum(values[:-1]),
+                    'sum': values[-1]
+                }
+        return counters, histograms
+
+
+METRICS = Metrics()  # Process-wide registry used by the downloaders, merger and validator
+inc = METRICS.inc
+observe = METRICS.observe
+timer = METRICS.timer
+
+
+def read_totals(connection):
+    """Fetch the aggregated counters and histograms from Redis in one round trip
+
+    Returns (counters, histograms) with histograms as {series: {'buckets': {le: count}, 'count', 'sum'}}.
+    """
+    pipe = connection.pipeline(transaction=False)
+    pipe.hgetall(COUNTERS_KEY)
+    pipe.hgetall(HISTOGRAMS_KEY)
+    return parse_totals(*pipe.execute())
+
+
+def parse_totals(raw_counters, raw_histograms):
+    """Decode HGETALL replies of the counters and histograms hashes (see read_totals)"""
+    counters = {key.decode(): float(value) for key, value in raw_counters.items()}
+    histograms = {}
+    for key, value in raw_histograms.items():
+        series, _, field = key.decode().rpartition('|')
+        hist = histograms.setdefault(series, {'buckets': {}, 'count': 0, 'sum': 0.0})
+        if field in ('count', 'sum'):
+            hist[field] = float(value)
+        else:
+            hist['buckets'][float(field)] = int(value)
+    return counters, histograms
+
+
+def quantile(buckets, q):
+    """Estimate a quantile from {upper bound: count} by interpolating inside the bucket (as Prometheus does)"""
+    bounds = sorted(set(DEFAULT_BUCKETS) | set(buckets))  # Empty buckets still set the lower edge
+    total = sum(buckets.values())
+    if total <= 0:
+        return None
+
+    rank = q * total
+    seen = 0
+    lower = 0.0
+    for bound in bounds:
+        count = buckets.get(bound, 0)
+        if seen + count >= rank and count > 0:
+            if bound == float('inf'):
+                return lower  # Open-ended bucket: best estimate is its lower edge
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound
+    return lower
+
+
+def prometheus_text(counters, histograms):
+    """Render totals in the Prometheus text exposition format"""
+    lines = []
+    typed = set()
+    for series, value in sorted(counters.items()):
+        name, labels = _split_series(series)
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{labels} {value:g}")
+
+    for series, hist in sorted(histograms.items()):
+        name, labels = _split_series(series)
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        prefix = labels[1:-1] + ',' if labels else ''
+        cumulative = 0
+        # Every bound is written, including empty ones, so the series set is stable between scrapes
+        for bound in sorted(set(DEFAULT_BUCKETS) | set(hist['buckets']) - {float('inf')}):
+            cumulative += hist['buckets'].get(bound, 0)
+            lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {hist["count"]:g}')
+        lines.append(f"{name}_sum{labels} {hist['sum']:g}")
+        lines.append(f"{name}_count{labels} {hist['count']:g}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path, connection=None):
+    """Write Prometheus text to path (e.g. for node_exporter's textfile collector)
+
+    Uses the Redis totals when a connection is given, otherwise this process's metrics.
+    """
+    totals = read_totals(connection) if connection is not None else METRICS.snapshot()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(prometheus_text(*totals))
+    os.replace(tmp_path, path)
+
+
+def serve(connection, port=9108, host='0.0.0.0'):
+    """Serve the Redis totals at http://host:port/metrics from a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text(*read_totals(connection)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the console
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics at http://{host}:{server.server_port}/metrics")
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+    from redis import Redis
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--port', type=int, default=9108, help='Port for the /metrics endpoint')
+    parser.add_argument('--textfile', help='Write the metrics to this file once instead of serving them')
+    args = parser.parse_args()
+
+    connection = Redis(host=args.redis_host, port=args.redis_port)
+    if args.textfile:
+        write_textfile(args.textfile, connection)
+    else:
+        server = serve(connection, args.port)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+
+def dhash(img_path, hash_size=8):
+    """Difference hash of an image, decoded at reduced resolution"""
+    img = cv2.imread(img_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+
+    small = cv2.resize(img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return _pack_bits(bits.flatten())
+
+
+def phash(img_path, hash_size=8):
+    """DCT perceptual hash of an image, decoded at reduced resolution"""
+    img = cv2.imread(img_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+
+    small = cv2.resize(img, (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(small.astype('float32'))[:hash_size, :hash_size]
+    low = dct.flatten()
+    return _pack_bits(low > np.median(low[1:]))  # Median skips the DC term
+
+
+HASH_FUNCTIONS = {'dhash': dhash, 'phash': phash}
+
+
+def _pack_bits(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """BK-tree over integer hashes for Hamming-radius lookups
+
+    Nodes are kept in parallel lists rather than per-node objects, and child
+    maps are only allocated for internal nodes, to keep memory per hash small.
+    """
+
+    def __init__(self):
+        self.hashes = []
+        self.children = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, value, item):
+        """Insert a hash with an associated item (e.g. its image path)"""
+        index = len(self.hashes)
+        self.hashes.append(value)
+        self.children.append(None)
+        self.items.append(item)
+        if index == 0:
+            return
+
+        node = 0
+        while True:
+            distance = hamming(value, self.hashes[node])
+            if self.children[node] is None:
+                self.children[node] = {}
+            child = self.children[node].get(distance)
+            if child is None:
+                self.children[node][distance] = index
+                return
+            node = child
+
+    def find(self, value, radius):
+        """Return (distance, item) for every stored hash within radius"""
+        if not self.hashes:
+            return []
+
+        matches = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, self.hashes[node])
+            if distance <= radius:
+                matches.append((distance, self.items[node]))
+            if self.children[node] is None:
+                continue
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_distance, child in self.children[node].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return matches
@@ -1,5 +1,6 @@
 import os
 import time
+import multiprocessing
 import yaml
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -7,6 +8,7 @@ from redis import Redis
 from rq import Queue
 from rq_scheduler import Scheduler
 from dotenv import load_dotenv
+from profiling import span
 
 load_dotenv()
 
@@ -36,69 +38,197 @@ class Pipeline:
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
     def schedule_extractions(self):
-        """Schedule Reddit and Roboflow jobs with proper intervals"""
-        from tasks import run_reddit_job, run_roboflow_job
-        
-        # Clear existing schedules
+        """Schedule Reddit and Roboflow jobs with proper intervals
+
+        Schedules have stable ids, so a restart keeps an unchanged schedule (and its next run
+        time) instead of recreating it, and a changed one resumes from the last recorded run.
+        """
+        from rq.job import Job
+        from tasks import run_reddit_job, run_roboflow_job, next_run_time
+
+        scheduling = self.config['scheduling']
+        catch_up = scheduling.get('catch_up', 'once')
+        # (source, func, description, delay of the very first run)
+        schedules = [
+            ('reddit', run_reddit_job, 'Reddit image download', timedelta(0)),
+            ('roboflow', run_roboflow_job, 'Roboflow dataset download', timedelta(minutes=5)),
+        ]
+        job_ids = {f"schedule-{source}" for source, *_ in schedules}
+        func_names = {f"tasks.{func.__name__}" for _, func, *_ in schedules}
+
+        # Drop schedules left by versions that gave every run a random id
         for job in self.scheduler.get_jobs():
-            self.scheduler.cancel(job)
-        
-        # Convert hours to seconds for RQ Scheduler
-        reddit_interval = self.config['scheduling']['reddit_interval_hours'] * 3600
-        roboflow_interval = self.config['scheduling']['roboflow_interval_hours'] * 3600
+            if job.id not in job_ids and job.func_name in func_names:
+                self.scheduler.cancel(job)
+
+        for source, func, description, first_delay in schedules:
+            job_id = f"schedule-{source}"
+            # Convert hours to seconds for RQ Scheduler
+            interval = scheduling[f'{source}_interval_hours'] * 3600
+            if job_id in self.scheduler:
+                job = Job.fetch(job_id, connection=self.redis_conn)
+                if job.meta.get('interval') == interval and tuple(job.args) == (self.config_path,):
+                    print(f"Keeping existing {source} schedule")
+                    continue
+                self.scheduler.cancel(job)
+
+            scheduled_time = next_run_time(self.redis_conn, source, interval, catch_up)
+            if scheduled_time is None:
+                scheduled_time = datetime.utcnow() + first_delay
+            self.scheduler.schedule(
+                scheduled_time=scheduled_time,
+                func=func,
+                args=(self.config_path,),
+                interval=interval,
+                queue_name='default',
+                id=job_id,
+                meta={'description': description}
+            )
+            print(f"Scheduled {source} every {interval / 3600:g}h, next run at {scheduled_time:%Y-%m-%d %H:%M} UTC")
+
+    def run_workers(self):
+        """Start the worker supervisor, which scales workers with the queue (see parallelism in config.yaml)"""
+        from worker import clean_registries, preload
+        from worker_supervisor import WorkerSupervisor
         
-        # Schedule Reddit job (in seconds)
-        self.scheduler.schedule(
-            scheduled_time=datetime.utcnow(),
-            func=run_reddit_job,
-            args=(self.config_path,),
-            interval=reddit_interval,
-            queue_name='default',
-            meta={'description': 'Reddit image download'}
-        )
+        # Registries are cleaned once here instead of in every worker, and job modules are
+        # imported before forking so worker processes inherit them already loaded. Spawned
+        # workers inherit nothing and preload for themselves (see WorkerSupervisor._spawn).
+        with span('clean_registries'):
+            clean_registries(self.redis_conn)
+        if multiprocessing.get_start_method() == 'fork':
+            with span('preload'):
+                preload(self.config_path)
         
-        # Schedule Roboflow job (in seconds)
-        self.scheduler.schedule(
-            scheduled_time=datetime.utcnow() + timedelta(minutes=5),
-            func=run_roboflow_job,
-            args=(self.config_path,),
-            interval=roboflow_interval,  # Now passing integer seconds
-            queue_name='default',
-            meta={'description': 'Roboflow dataset download'}
-        )
+        supervisor = WorkerSupervisor(self.redis_conn, self.config_path, self.config['parallelism'],
+                                      log_path=self.output_dir / 'scaling.jsonl')
+        supervisor.start()
+        return supervisor
 
-    def run_workers(self, num_workers=4):
-        """Start worker processes"""
-        from multiprocessing import Process
-        from worker import start_worker
+    def run_streaming(self):
+        """Ingest downloaded datasets as soon as their jobs finish, instead of batch re-scans
+        
+        Existing datasets are queued once at startup; after that only folders announced by
+        download jobs on the ingest list are scanned.
+        """
+        from metrics import METRICS
+        from stream_ingest import StreamingIngest
+        from tasks import INGEST_QUEUE_KEY
         
-        workers = []
-        for i in range(num_workers):
-            p = Process(target=start_worker)
-            p.start()
-            workers.append(p)
-            print(f"Started worker {i+1} (PID: {p.pid})")
+        stream_config = self.config.get('streaming', {})
+        ingest = StreamingIngest(
+            {
+                'input_folders': [],
+                'output_base': self.config['output_base'],
+                'split_ratio': self.config['split_ratios'],
+                'target_size': self.config['target_size'],
+                'class_names': self.config['class_names'],
+                'workers': self.config['parallelism']['workers']
+            },
+            min_object_size=stream_config.get('min_object_size', 0.02),
+            small_object_threshold=stream_config.get('small_object_threshold', 0.05),
+            queue_size=stream_config.get('queue_size', 64)
+        )
+        ingest.start()
         
-        return workers
+        try:
+            for folder in self.config['existing_datasets'] + [str(self.output_base / "roboflow_images")]:
+                if os.path.exists(folder):
+                    with span('submit_folder'):
+                        print(f"Queued {ingest.submit_folder(folder)} pairs from {folder}")
+            
+            while True:
+                item = self.redis_conn.blpop(INGEST_QUEUE_KEY, timeout=stream_config.get('poll_seconds', 5))
+                if item:
+                    folder = item[1].decode()
+                    with span('submit_folder'):
+                        print(f"Queued {ingest.submit_folder(folder)} pairs from {folder}")
+                METRICS.flush(self.redis_conn)
+        except KeyboardInterrupt:
+            print("\nStopping streaming ingest...")
+        finally:
+            ingest.close()
+            METRICS.flush(self.redis_conn)
 
-    def monitor_queue(self):
-        """Monitor queue status"""
+    def monitor_queue(self, interval=10):
+        """Live dashboard of queue depth, throughput and latencies over the last interval"""
+        from metrics import COUNTERS_KEY, HISTOGRAMS_KEY, parse_totals
+        
+        previous = None
         try:
             while True:
-                print(f"\nQueue status at {datetime.now()}")
-                print(f"Pending jobs: {len(self.task_queue)}")
-                print(f"Failed jobs: {len(self.task_queue.failed_job_registry)}")
-                time.sleep(10)
+                # Queue sizes and metric totals come back in a single round trip
+                pipe = self.redis_conn.pipeline(transaction=False)
+                pipe.llen(self.task_queue.key)
+                pipe.zcard(self.task_queue.started_job_registry.key)
+                pipe.zcard(self.task_queue.failed_job_registry.key)
+                pipe.hgetall(COUNTERS_KEY)
+                pipe.hgetall(HISTOGRAMS_KEY)
+                pending, running, failed, raw_counters, raw_histograms = pipe.execute()
+                current = (time.monotonic(), *parse_totals(raw_counters, raw_histograms))
+                
+                print(f"\nQueue status at {datetime.now():%H:%M:%S}: "
+                      f"{pending} pending, {running} running, {failed} failed")
+                if previous:
+                    self.print_rates(previous, current)
+                previous = current
+                time.sleep(interval)
         except KeyboardInterrupt:
             print("\nStopping monitoring...")
 
+    def print_rates(self, previous, current):
+        """Print counter rates and histogram p50/p95 for what happened between two samples"""
+        from metrics import quantile
+        
+        start, old_counters, old_histograms = previous
+        end, counters, histograms = current
+        elapsed = max(end - start, 1e-9)
+        
+        for series, value in sorted(counters.items()):
+            delta = value - old_counters.get(series, 0)
+            if delta <= 0:
+                continue
+            if 'bytes' in series:
+                print(f"  {series:55} {delta / elapsed / 1e6:10.2f} MB/s")
+            else:
+                print(f"  {series:55} {delta / elapsed:10.2f} /s")
+        
+        for series, hist in sorted(histograms.items()):
+            old = old_histograms.get(series, {'buckets': {}, 'count': 0, 'sum': 0.0})
+            count = hist['count'] - old['count']
+            if count <= 0:
+                continue
+            buckets = {bound: n - old['buckets'].get(bound, 0) for bound, n in hist['buckets'].items()}
+            mean = (hist['sum'] - old['sum']) / count
+            # Quantiles are None when the bucket deltas are empty, e.g. totals read mid-update
+            p50, p95 = (quantile(buckets, q) for q in (0.5, 0.95))
+            p50, p95 = ('-' if p is None else f"{p * 1000:.1f}" for p in (p50, p95))
+            print(f"  {series:55} n={count:<6.0f} mean {mean * 1000:8.1f} ms  p50 {p50:>8} ms  p95 {p95:>8} ms")
+
 if __name__ == "__main__":
-    pipeline = Pipeline("config.yaml")
-    pipeline.schedule_extractions()
-    workers = pipeline.run_workers()
+    import argparse
+    import profiling
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stream', action='store_true',
+                        help='Merge downloads into the dataset as they arrive instead of only monitoring the queue')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
     
-    try:
-        pipeline.monitor_queue()
-    finally:
-        for w in workers:
-            w.terminate()
\ No newline at end of file
+    # Profiles this coordinating process until Ctrl-C; job time is spent in the worker processes
+    with profiling.from_args(args):
+        pipeline = Pipeline("config.yaml")
+        if pipeline.config.get('metrics', {}).get('port'):
+            from metrics import serve
+            serve(pipeline.redis_conn, pipeline.config['metrics']['port'])
+        with span('schedule_extractions'):
+            pipeline.schedule_extractions()
+        supervisor = pipeline.run_workers()
+        
+        try:
+            if args.stream:
+                pipeline.run_streaming()
+            else:
+                pipeline.monitor_queue()
+        finally:
+            supervisor.stop()
\ No newline at end of file
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+PROFILE_MODES = ('sample', 'cprofile')
+
+_NULL_SPAN = nullcontext()  # Returned by span() while profiling is off, so disabled spans cost one global lookup
+_profiler = None
+
+
+class Profiler:
+    """Records named timing spans plus either cProfile stats or sampled stacks for one run
+
+    Output files share output_prefix:
+        <prefix>.trace.json  spans as Chrome trace events (chrome://tracing, Perfetto, speedscope)
+        <prefix>.collapsed   sampled stacks, one "frame;frame;frame count" line each (flamegraph.pl, speedscope)
+        <prefix>.prof        cProfile stats (snakeviz, flameprof, pstats) in cprofile mode
+
+    Sampling sees every thread of this process, cProfile only the thread that started it.
+    Work done inside process pools shows up as time spent waiting on the pool.
+    """
+
+    def __init__(self, output_prefix, mode='sample', interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+        self.output_prefix = output_prefix
+        self.mode = mode
+        self.interval = interval  # Seconds between stack samples
+        self.events = []
+        self.samples = Counter()
+        self.stacks = defaultdict(list)  # thread id -> names of the spans open in that thread
+        self.profile = None
+        self.running = False
+
+    def start(self):
+        self.origin = time.perf_counter()
+        self.running = True
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self.sampler.start()
+
+    def stop(self):
+        """Stop profiling, write the output files and print where the time went"""
+        self.running = False
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(f"{self.output_prefix}.prof")
+        else:
+            self.sampler.join()
+            with open(f"{self.output_prefix}.collapsed", 'w') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+
+        with open(f"{self.output_prefix}.trace.json", 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+        self.print_summary()
+
+    @contextmanager
+    def span(self, name):
+        thread_id = threading.get_ident()
+        stack = self.stacks[thread_id]
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            self.events.append({
+                'name': name,
+                'cat': 'span',
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': thread_id,
+                'args': {'path': '/'.join(stack + [name])}
+            })
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # Open spans become the outermost frames, so flamegraphs group by stage first
+                spans = [f"[{name}]" for name in list(self.stacks.get(thread_id, ()))]
+                self.samples[';'.join(spans + frames[::-1])] += 1
+            time.sleep(self.interval)
+
+    def print_summary(self, top=15):
+        totals = defaultdict(lambda: [0, 0.0])
+        for event in self.events:
+            entry = totals[event['args']['path']]
+            entry[0] += 1
+            entry[1] += event['dur'] / 1e6
+
+        print("\nProfile spans:")
+        for path, (count, seconds) in sorted(totals.items()):
+            print(f"  {path:50} {count:6}x {seconds:9.3f}s")
+
+        if self.profile:
+            pstats.Stats(self.profile).sort_stats('cumulative').print_stats(top)
+            written = [f"{self.output_prefix}.prof"]
+        else:
+            print(f"{sum(self.samples.values())} stack samples every {self.interval * 1000:g} ms")
+            written = [f"{self.output_prefix}.collapsed"]
+        print(f"Profile written to {', '.join(written + [self.output_prefix + '.trace.json'])}")
+
+
+def span(name):
+    """Time a stage when profiling is on; a shared no-op context otherwise"""
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(name)
+
+
+def enable(output_prefix, mode='sample', interval=0.005):
+    """Start profiling the current process"""
+    global _profiler
+    _profiler = Profiler(output_prefix, mode, interval)
+    _profiler.start()
+    return _profiler
+
+
+def disable():
+    """Stop profiling and write its output files"""
+    global _profiler
+    if _profiler is not None:
+        profiler, _profiler = _profiler, None
+        profiler.stop()
+
+
+def add_arguments(parser):
+    """Add the --profile options shared by the tool CLIs"""
+    parser.add_argument('--profile', metavar='PREFIX',
+                        help='Profile the run, writing PREFIX.trace.json plus PREFIX.collapsed or PREFIX.prof')
+    parser.add_argument('--profile-mode', choices=PROFILE_MODES, default='sample',
+                        help='sample: low-overhead stack sampling for flamegraphs; cprofile: exact call counts')
+    parser.add_argument('--profile-interval', type=float, default=0.005,
+                        help='Seconds between stack samples in sample mode (default: 0.005)')
+
+
+@contextmanager
+def from_args(args):
+    """Profile the with-block if --profile was given"""
+    if not args.profile:
+        yield
+        return
+    enable(args.profile, args.profile_mode, args.profile_interval)
+    try:
+        yield
+    finally:
+        disable()
@@ -0,0 +1,112 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# Refills the bucket for the time elapsed since the last call, then takes tokens if enough are
+# available. Returns the seconds to wait before retrying (0 when the tokens were taken).
+# Uses the Redis server clock so workers on different machines agree on elapsed time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class TokenBucket(ABC):
+    """Token bucket limiter: `rate` tokens per second, bursts of up to `capacity`
+
+    Subclasses store the bucket; LocalTokenBucket is the default when there is no Redis.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+
+    @abstractmethod
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; return 0, or the seconds to wait before retrying"""
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are taken; return False if timeout seconds pass first"""
+        if tokens > self.capacity:
+            # The bucket never holds more than capacity, so this would wait forever
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of capacity {self.capacity}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class LocalTokenBucket(TokenBucket):
+    """In-process token bucket, used for tests and runs without Redis"""
+
+    def __init__(self, rate, capacity):
+        super().__init__(rate, capacity)
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+
+class RedisTokenBucket(TokenBucket):
+    """Token bucket stored in Redis and shared by every worker using the same key"""
+
+    def __init__(self, connection, key, rate, capacity):
+        super().__init__(rate, capacity)
+        self.key = f"rate_limit:{key}"
+        self.script = connection.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def try_acquire(self, tokens=1):
+        return float(self.script(keys=[self.key], args=[self.rate, self.capacity, tokens]))
+
+
+def bucket_settings(config, name):
+    """Return (rate, capacity) for a rate_limits entry
+
+    Entries are either {rate, burst} mappings or, as in older configs, a number of seconds
+    to wait between calls.
+    """
+    limit = config['rate_limits'][name]
+    if isinstance(limit, dict):
+        return float(limit['rate']), float(limit.get('burst', 1))
+    return 1.0 / float(limit), 1.0
+
+
+def get_rate_limiter(config, name, connection=None):
+    """Build the limiter for one API: Redis-backed when a connection is given, local otherwise"""
+    rate, capacity = bucket_settings(config, name)
+    if connection is None:
+        return LocalTokenBucket(rate, capacity)
+    return RedisTokenBucket(connection, name, rate, capacity)
+
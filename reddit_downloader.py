@@ -1,19 +1,144 @@
 import praw
+import prawcore
+import email.utils
+import itertools
 import os
 import requests
+import threading
 import time
-import random
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Tuple
+from urllib.parse import urlparse
+from metrics import METRICS
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+LISTINGS = ("new", "top", "hot")  # "new" first: it is chronological, so it can stop at the first seen post
+
+
+def retry_after(value, default: float) -> float:
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date), else default"""
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RateLimitedRequestor(prawcore.Requestor):
+    """prawcore requestor that takes a rate-limiter token before every Reddit API call"""
+    
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+    
+    def request(self, *args, **kwargs):
+        if self.limiter:
+            self.limiter.acquire()
+        return super().request(*args, **kwargs)
+
+
+class SeenPostIndex:
+    """Submission IDs processed by earlier runs, per subreddit, plus the ones to retry
+    
+    Stored in Redis sorted sets scored by time so entries older than ttl_days are trimmed;
+    without a connection it only lives for the current process. Posts whose download failed
+    are seen (listings skip them) but also kept in a retry set that is fetched directly.
+    """
+    
+    def __init__(self, connection=None, ttl_days: int = 30):
+        self.connection = connection
+        self.ttl = ttl_days * 86400
+        self.local: Dict[Tuple[str, str], set] = {}
+    
+    def load(self, subreddit_name: str) -> set:
+        return self._load("seen", subreddit_name)
+    
+    def add(self, subreddit_name: str, post_ids: List[str]) -> None:
+        self._add("seen", subreddit_name, post_ids)
+    
+    def load_retry(self, subreddit_name: str) -> set:
+        """Posts whose downloads failed in an earlier run"""
+        return self._load("retry", subreddit_name)
+    
+    def update_retry(self, subreddit_name: str, failed: List[str], done: List[str]) -> None:
+        """Add newly failed posts to the retry set and drop the ones that finally succeeded"""
+        self._add("retry", subreddit_name, failed)
+        if not done:
+            return
+        if self.connection is None:
+            self.local.get(("retry", subreddit_name), set()).difference_update(done)
+        else:
+            self.connection.zrem(f"reddit:retry:{subreddit_name.lower()}", *done)
+    
+    def _load(self, kind: str, subreddit_name: str) -> set:
+        if self.connection is None:
+            return set(self.local.get((kind, subreddit_name), ()))
+        key = f"reddit:{kind}:{subreddit_name.lower()}"
+        self.connection.zremrangebyscore(key, 0, time.time() - self.ttl)
+        return {member.decode() for member in self.connection.zrange(key, 0, -1)}
+    
+    def _add(self, kind: str, subreddit_name: str, post_ids: List[str]) -> None:
+        if not post_ids:
+            return
+        if self.connection is None:
+            self.local.setdefault((kind, subreddit_name), set()).update(post_ids)
+            return
+        now = time.time()
+        # nx keeps the first score, so a post that keeps failing expires from the retry set
+        self.connection.zadd(f"reddit:{kind}:{subreddit_name.lower()}", {post_id: now for post_id in post_ids},
+                             nx=kind == "retry")
+
 
 class RedditImageDownloader:
-    def __init__(self, credentials: Dict):
+    def __init__(
+        self,
+        credentials: Dict,
+        max_workers: int = 8,
+        per_host_limit: int = 2,
+        host_delay: float = 0.5,
+        retries: int = 3,
+        api_limiter=None,
+        image_limiter=None,
+        seen_index: SeenPostIndex = None,
+        seen_streak: int = 25
+    ):
         self.reddit = praw.Reddit(
             user_agent=True,
             client_id=credentials["client_id"],
             client_secret=credentials["client_secret"],
             username=credentials["username"],
-            password=credentials["password"]
+            password=credentials["password"],
+            requestor_class=RateLimitedRequestor,
+            requestor_kwargs={"limiter": api_limiter}
         )
+        
+        # One keep-alive connection pool shared by every download thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit  # Concurrent requests allowed per host
+        self.host_delay = host_delay  # Minimum seconds between request starts on one host
+        self.retries = retries
+        self.image_limiter = image_limiter  # Shared budget across all image hosts and workers
+        self.seen_index = seen_index or SeenPostIndex()
+        self.seen_streak = seen_streak  # Consecutive seen posts after which top/hot paging stops
+        
+        self._host_lock = threading.Lock()
+        self._host_slots = {}
+        self._host_next = {}
     
     @staticmethod
     def is_image_url(url: str) -> bool:
@@ -23,41 +148,173 @@ class RedditImageDownloader:
     def download_image(self, url: str, path: str) -> bool:
         """Download an image from a URL and save it to a specified path."""
         try:
-            img_data = requests.get(url, timeout=10).content
-            with open(path, "wb") as f:
-                f.write(img_data)
+            self._fetch(url, path)
             print(f"Downloaded: {url}")
             return True
         except Exception as e:
             print(f"Failed to download {url}: {e}")
             return False
     
+    def download_many(self, items: List[Tuple[str, str]]) -> Dict:
+        """Download (url, path) pairs concurrently and return a results summary."""
+        summary = {"downloaded": 0, "failed": 0, "skipped": 0, "bytes": 0, "failed_paths": []}
+        pending = []
+        unique = {path: url for url, path in items}  # The same post can appear in several listings
+        for path, url in unique.items():
+            if os.path.exists(path):
+                summary["skipped"] += 1
+            else:
+                pending.append((url, path))
+        
+        def run(item):
+            url, path = item
+            try:
+                return url, path, self._fetch(url, path), None
+            except Exception as e:
+                return url, path, None, e
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for url, path, size, error in executor.map(run, pending):
+                if error is None:
+                    print(f"Downloaded: {url}")
+                    summary["downloaded"] += 1
+                    summary["bytes"] += size
+                    METRICS.inc("downloads_total", source="reddit", status="ok")
+                    METRICS.inc("download_bytes_total", size, source="reddit")
+                else:
+                    print(f"Failed to download {url}: {error}")
+                    summary["failed"] += 1
+                    METRICS.inc("downloads_total", source="reddit", status="failed")
+                    summary["failed_paths"].append(path)
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+    
+    def _fetch(self, url: str, path: str) -> int:
+        """Stream url to a temp file, rename it into place, and return the bytes written."""
+        host = urlparse(url).netloc
+        tmp_path = f"{path}.part"
+        
+        for attempt in range(self.retries + 1):
+            if self.image_limiter:
+                self.image_limiter.acquire()
+            with self._host_slot(host):
+                try:
+                    start = time.perf_counter()
+                    with self.session.get(url, timeout=10, stream=True) as response:
+                        if response.status_code in RETRY_STATUS_CODES and attempt < self.retries:
+                            delay = retry_after(response.headers.get("Retry-After"), 2 ** attempt)
+                        else:
+                            response.raise_for_status()
+                            size = 0
+                            with open(tmp_path, "wb") as f:
+                                for chunk in response.iter_content(chunk_size=64 * 1024):
+                                    f.write(chunk)
+                                    size += len(chunk)
+                            os.replace(tmp_path, path)
+                            METRICS.observe("download_seconds", time.perf_counter() - start, source="reddit")
+                            return size
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == self.retries:
+                        raise
+                    delay = 2 ** attempt
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            time.sleep(delay)
+    
+    def _host_slot(self, host: str):
+        """Wait for this host's politeness delay, then hold one of its concurrency slots."""
+        with self._host_lock:
+            slot = self._host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host_limit))
+            now = time.monotonic()
+            start = max(now, self._host_next.get(host, now))
+            self._host_next[host] = start + self.host_delay
+        if start > now:
+            time.sleep(start - now)
+        return slot
+    
+    def iter_posts(self, subreddit, limit: int, seen: set):
+        """Lazily yield each unseen submission of the new/top/hot listings once."""
+        yielded = set()
+        for listing in LISTINGS:
+            streak = 0
+            for submission in getattr(subreddit, listing)(limit=limit):
+                if submission.id in seen:
+                    if listing == "new":
+                        break  # Everything further down "new" is older and was already processed
+                    streak += 1
+                    if streak >= self.seen_streak:
+                        break
+                    continue
+                streak = 0
+                if submission.id not in yielded:
+                    yielded.add(submission.id)
+                    yield submission
+    
     def scrape_subreddit(
         self,
         subreddit_name: str,
         keywords: List[str],
         output_dir: str,
         limit_per_subreddit: int = 1000
-    ) -> None:
-        """Scrape a subreddit for images matching specified keywords."""
+    ) -> Dict:
+        """Scrape a subreddit for images matching specified keywords.
+        
+        Posts are marked seen per subreddit and keyword set, so calls with other keywords
+        still see every post; to match several classes, prefer one scrape_subreddit_classes call.
+        """
+        seen_key = f"{subreddit_name}|{'|'.join(sorted(keywords))}"
+        return self.scrape_subreddit_classes(subreddit_name, {"": (keywords, output_dir)}, limit_per_subreddit,
+                                             seen_key=seen_key)
+    
+    def scrape_subreddit_classes(
+        self,
+        subreddit_name: str,
+        classes: Dict[str, Tuple[List[str], str]],
+        limit_per_subreddit: int = 1000,
+        seen_key: str = None
+    ) -> Dict:
+        """Fetch a subreddit once and match every post against each class's (keywords, output_dir).
+        
+        Fetched posts are marked seen under seen_key (default: the subreddit), so every class
+        that uses the subreddit has to be passed in the same call.
+        """
         print(f"\nScraping subreddit: {subreddit_name}")
+        seen_key = seen_key or subreddit_name
         subreddit = self.reddit.subreddit(subreddit_name)
+        seen = self.seen_index.load(seen_key)
+        retry_ids = self.seen_index.load_retry(seen_key)
         
-        posts = list(subreddit.top(limit=limit_per_subreddit)) + \
-                list(subreddit.new(limit=limit_per_subreddit)) + \
-                list(subreddit.hot(limit=limit_per_subreddit))
+        # Posts that failed before are fetched by id: they may sit below newer, already
+        # seen posts where the "new" listing stops
+        retry_posts = self.reddit.info(fullnames=[f"t3_{post_id}" for post_id in sorted(retry_ids)]) if retry_ids else []
         
-        print(f"Total posts fetched: {len(posts)}")
+        post_ids = []
+        downloads = []
+        for submission in itertools.chain(retry_posts, self.iter_posts(subreddit, limit_per_subreddit, seen | retry_ids)):
+            post_ids.append(submission.id)
+            if not self.is_image_url(submission.url):
+                continue
+            title = submission.title.lower()
+            for keywords, output_dir in classes.values():
+                if any(keyword in title for keyword in keywords):
+                    image_name = f"{submission.id}.jpg"
+                    downloads.append((submission.url, os.path.join(output_dir, image_name)))
         
-        for submission in posts:
-            if any(keyword in submission.title.lower() for keyword in keywords) and self.is_image_url(submission.url):
-                image_url = submission.url
-                image_name = f"{submission.id}.jpg"
-                image_path = os.path.join(output_dir, image_name)
-                
-                if not os.path.exists(image_path):
-                    if self.download_image(image_url, image_path):
-                        time.sleep(random.uniform(1, 3))
+        print(f"New posts fetched: {len(post_ids)}")
+        
+        summary = self.download_many(downloads)
+        
+        # Failed downloads go to the retry set, which the next run fetches directly
+        failed_ids = {os.path.splitext(os.path.basename(path))[0] for path in summary["failed_paths"]}
+        self.seen_index.add(seen_key, post_ids)
+        self.seen_index.update_retry(seen_key, sorted(failed_ids),
+                                     [post_id for post_id in post_ids if post_id in retry_ids and post_id not in failed_ids])
+        
+        print(f"r/{subreddit_name}: {summary['downloaded']} downloaded, {summary['skipped']} already present, "
+              f"{summary['failed']} failed, {summary['bytes'] / 1e6:.1f} MB in {summary['seconds']:.1f}s")
+        return summary
 
 def main():
     credentials = {
@@ -84,16 +341,17 @@ def main():
     
     downloader = RedditImageDownloader(credentials)
     
+    subreddits = {}
     for class_name, config in CLASS_CONFIG.items():
         output_dir = f"{class_name}_images"
         os.makedirs(output_dir, exist_ok=True)
         
         for subreddit in config["subreddits"]:
-            downloader.scrape_subreddit(
-                subreddit_name=subreddit,
-                keywords=config["keywords"],
-                output_dir=output_dir
-            )
+            subreddits.setdefault(subreddit, {})[class_name] = (config["keywords"], output_dir)
+    
+    # Seen posts are tracked per subreddit, so all classes sharing one are matched in one pass
+    for subreddit, classes in subreddits.items():
+        downloader.scrape_subreddit_classes(subreddit, classes)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
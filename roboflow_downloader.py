@@ -1,10 +1,28 @@
 import os
+import re
+import json
+import time
+import shutil
+import hashlib
 from roboflow import Roboflow
 from pathlib import Path
+from file_links import link_file
+from metrics import METRICS
+
+COMPLETE_MARKER = ".complete.json"
+STALE_PARTIAL_SECONDS = 3600  # Partial downloads older than this are from interrupted runs
+PARTIAL_POLL_SECONDS = 5  # How often to check on another process's download of the same version
 
 class RoboflowDownloader:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache_dir: str = None, cache_max_bytes: int = None):
+        """
+        Args:
+            cache_dir: Local cache of extracted dataset versions; None disables caching
+            cache_max_bytes: Size cap for the cache, least recently used versions are evicted first
+        """
         self.rf = Roboflow(api_key=api_key)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.cache_max_bytes = cache_max_bytes
 
     def download_dataset(
         self,
@@ -14,14 +32,179 @@ class RoboflowDownloader:
         class_name: str,
         format: str = "yolov8",
         output_dir: str = None
-    ) -> None:
+    ) -> bool:
         output_dir = Path(output_dir or f"{class_name}_images")
         output_dir.mkdir(parents=True, exist_ok=True)
 
+        if self.cache_dir is None:
+            return self._download(workspace, project, version, class_name, format, output_dir)
+
+        entry = self.cache_dir / self._cache_key(workspace, project, version, format)
+        if self._is_complete(entry):
+            print(f"[Roboflow] '{class_name}' {workspace}/{project} v{version} already cached")
+        else:
+            if not self._fill_cache(entry, workspace, project, version, class_name, format):
+                return False
+            self._evict(keep=entry)
+
+        os.utime(entry / COMPLETE_MARKER)  # Marker mtime is the LRU timestamp
+        self._materialize(entry, output_dir)
+        print(f"[Roboflow] '{class_name}' dataset available at: {output_dir}")
+        return True
+
+    def _download(self, workspace, project, version, class_name, format, location):
         print(f"[Roboflow] Downloading '{class_name}' from {workspace}/{project} v{version}...")
         try:
+            start = time.perf_counter()
             project_obj = self.rf.workspace(workspace).project(project)
-            project_obj.version(version).download(format=format, location=str(output_dir))
-            print(f"[Roboflow] Downloaded '{class_name}' dataset to: {output_dir}")
+            project_obj.version(version).download(format, location=str(location), overwrite=True)
+            METRICS.observe('download_seconds', time.perf_counter() - start, source='roboflow')
+            METRICS.inc('downloads_total', source='roboflow', status='ok')
+            print(f"[Roboflow] Downloaded '{class_name}' dataset to: {location}")
+            return True
         except Exception as e:
-            print(f"[Roboflow] Failed to download '{class_name}': {e}")
\ No newline at end of file
+            METRICS.inc('downloads_total', source='roboflow', status='failed')
+            print(f"[Roboflow] Failed to download '{class_name}': {e}")
+            return False
+
+    @staticmethod
+    def _cache_key(workspace, project, version, format):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', f"{workspace}__{project}__v{version}__{format}")
+
+    def _is_complete(self, entry):
+        """A version is usable only if its marker exists and its files still match the marker
+
+        File count, total size and newest mtime are compared on every hit. Cached files are
+        hardlinked into output folders, so an edit there changes the cache too; when the
+        newest mtime moved, the checksum decides and the marker is updated if it still matches.
+        """
+        marker = entry / COMPLETE_MARKER
+        try:
+            with open(marker) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return False
+        files = self._list_files(entry)
+        stats = [p.stat() for p in files]
+        if len(files) != info['files'] or sum(st.st_size for st in stats) != info['bytes']:
+            return False
+        max_mtime_ns = max((st.st_mtime_ns for st in stats), default=0)
+        if max_mtime_ns == info.get('max_mtime_ns'):
+            return True
+
+        if self._checksum(entry, files) != info['sha256']:
+            return False
+        self._write_marker(entry, {**info, 'max_mtime_ns': max_mtime_ns})  # Only touched, not changed
+        return True
+
+    @staticmethod
+    def _write_marker(root, info):
+        tmp_path = root / f"{COMPLETE_MARKER}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, root / COMPLETE_MARKER)
+
+    @staticmethod
+    def _checksum(root, files):
+        checksum = hashlib.sha256()
+        for path in files:
+            checksum.update(str(path.relative_to(root)).encode())
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def _wait_for_partials(self, entry, class_name):
+        """Wait while another process downloads this version; stale partials are removed"""
+        while True:
+            fresh = []
+            for partial in self.cache_dir.glob(f"{entry.name}.partial-*"):
+                try:
+                    age = time.time() - partial.stat().st_mtime
+                except FileNotFoundError:
+                    continue  # Renamed into place or removed meanwhile
+                if partial.name.endswith(f".partial-{os.getpid()}"):
+                    shutil.rmtree(partial, ignore_errors=True)  # Our own leftover from an earlier failure
+                elif age > STALE_PARTIAL_SECONDS:
+                    print(f"[Roboflow] Removing interrupted download: {partial}")
+                    shutil.rmtree(partial, ignore_errors=True)
+                else:
+                    fresh.append(partial)
+            if not fresh:
+                return
+            print(f"[Roboflow] Waiting for another download of '{class_name}': {fresh[0]}")
+            time.sleep(PARTIAL_POLL_SECONDS)
+
+    def _fill_cache(self, entry, workspace, project, version, class_name, format):
+        """Download into a partial directory and rename it into place only once complete"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._wait_for_partials(entry, class_name)
+        if self._is_complete(entry):
+            print(f"[Roboflow] '{class_name}' was cached by another process")
+            return True
+
+        partial = self.cache_dir / f"{entry.name}.partial-{os.getpid()}"
+        shutil.rmtree(partial, ignore_errors=True)
+        if not self._download(workspace, project, version, class_name, format, partial):
+            shutil.rmtree(partial, ignore_errors=True)
+            return False
+
+        files = self._list_files(partial)
+        stats = [p.stat() for p in files]
+        self._write_marker(partial, {
+            'workspace': workspace,
+            'project': project,
+            'version': version,
+            'format': format,
+            'files': len(files),
+            'bytes': sum(st.st_size for st in stats),
+            'max_mtime_ns': max((st.st_mtime_ns for st in stats), default=0),
+            'sha256': self._checksum(partial, files),
+            'created': time.time()
+        })
+
+        if self._is_complete(entry):
+            shutil.rmtree(partial, ignore_errors=True)  # Another process finished first
+            return True
+        shutil.rmtree(entry, ignore_errors=True)  # Incomplete leftover without a valid marker
+        try:
+            os.replace(partial, entry)
+        except OSError:
+            # Lost the rename to another process; fine as long as its copy is complete
+            shutil.rmtree(partial, ignore_errors=True)
+            if not self._is_complete(entry):
+                raise
+        return True
+
+    def _evict(self, keep):
+        """Remove least recently used versions until the cache fits cache_max_bytes"""
+        if not self.cache_max_bytes:
+            return
+
+        entries = []
+        for marker in self.cache_dir.glob(f"*/{COMPLETE_MARKER}"):
+            with open(marker) as f:
+                entries.append((marker.stat().st_mtime, json.load(f)['bytes'], marker.parent))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.cache_max_bytes:
+                break
+            if entry == keep:
+                continue
+            print(f"[Roboflow] Evicting cached version: {entry.name}")
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    @staticmethod
+    def _list_files(root):
+        return sorted(p for p in Path(root).rglob('*') if p.is_file() and not p.name.startswith(COMPLETE_MARKER))
+
+    def _materialize(self, entry, output_dir):
+        """Hardlink (or copy) a cached version into output_dir"""
+        for path in self._list_files(entry):
+            dst = output_dir / path.relative_to(entry)
+            if dst.exists() and os.path.samefile(path, dst):
+                continue  # Already linked by an earlier run
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            link_file(str(path), str(dst))
@@ -0,0 +1,105 @@
+import os
+import json
+import mmap
+import cv2
+import numpy as np
+
+SHARD_SIZE = 1024 * 1024 * 1024  # Bytes per shard file before a new one is started
+
+
+class ShardWriter:
+    """Pack a split's encoded images into large blob files plus a memory-mappable index
+
+    Layout of the split directory:
+        shard-00000.bin ...   concatenated encoded images
+        index.npy             int64 (N, 3): shard id, byte offset, byte length
+        labels.npy            float32 (M, 5): every box of the split (class, x, y, w, h)
+        label_offsets.npy     int64 (N + 1): boxes of image i are labels[offsets[i]:offsets[i + 1]]
+        names.json            original image filenames
+    """
+
+    def __init__(self, split_dir, shard_size=SHARD_SIZE):
+        self.split_dir = split_dir
+        self.shard_size = shard_size
+        os.makedirs(split_dir, exist_ok=True)
+
+        self.names = []
+        self.index = []
+        self.labels = []
+        self.label_offsets = [0]
+        self.shard_id = -1
+        self.shard = None
+        self.shard_bytes = 0
+
+    def add(self, name, image_bytes, labels):
+        """Append one encoded image and its (N, 5) label array"""
+        if self.shard is None or self.shard_bytes + len(image_bytes) > self.shard_size:
+            self._next_shard()
+
+        self.shard.write(image_bytes)
+        self.index.append((self.shard_id, self.shard_bytes, len(image_bytes)))
+        self.shard_bytes += len(image_bytes)
+
+        self.names.append(name)
+        self.labels.append(labels)
+        self.label_offsets.append(self.label_offsets[-1] + len(labels))
+
+    def close(self):
+        """Write the index files and return a summary for data.yaml"""
+        if self.shard:
+            self.shard.close()
+
+        labels = np.concatenate(self.labels) if self.labels else np.zeros((0, 5), dtype=np.float32)
+        np.save(os.path.join(self.split_dir, 'index.npy'), np.array(self.index, dtype=np.int64).reshape(-1, 3))
+        np.save(os.path.join(self.split_dir, 'labels.npy'), labels.astype(np.float32))
+        np.save(os.path.join(self.split_dir, 'label_offsets.npy'), np.array(self.label_offsets, dtype=np.int64))
+        with open(os.path.join(self.split_dir, 'names.json'), 'w') as f:
+            json.dump(self.names, f)
+
+        return {'images': len(self.names), 'shards': self.shard_id + 1}
+
+    def _next_shard(self):
+        if self.shard:
+            self.shard.close()
+        self.shard_id += 1
+        self.shard_bytes = 0
+        self.shard = open(os.path.join(self.split_dir, f"shard-{self.shard_id:05d}.bin"), 'wb')
+
+
+class ShardReader:
+    """O(1) random access to a split written by ShardWriter"""
+
+    def __init__(self, split_dir):
+        self.split_dir = split_dir
+        self.index = np.load(os.path.join(split_dir, 'index.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(split_dir, 'labels.npy'), mmap_mode='r')
+        self.label_offsets = np.load(os.path.join(split_dir, 'label_offsets.npy'), mmap_mode='r')
+        with open(os.path.join(split_dir, 'names.json')) as f:
+            self.names = json.load(f)
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """Return (name, encoded image bytes, (N, 5) labels) for sample i"""
+        shard_id, offset, length = (int(v) for v in self.index[i])
+        image_bytes = self._shard(shard_id)[offset:offset + length]
+        labels = self.labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+        return self.names[i], image_bytes, labels
+
+    def read_image(self, i):
+        """Decode sample i to a BGR array"""
+        _, image_bytes, _ = self[i]
+        return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards = {}
+
+    def _shard(self, shard_id):
+        if shard_id not in self._shards:
+            with open(os.path.join(self.split_dir, f"shard-{shard_id:05d}.bin"), 'rb') as f:
+                self._shards[shard_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._shards[shard_id]
@@ -0,0 +1,334 @@
+import os
+import json
+import queue
+import threading
+import time
+import numpy as np
+from collections import Counter
+from dataset_merger import DatasetMerger, hash_file, output_image_name, record_image_timings, _process_image
+from image_probe import probe_image_size
+from label_index import parse_label_file, scan_pairs
+from merge_manifest import MergeManifest
+from metrics import METRICS
+from profiling import span
+
+_DONE = object()  # End-of-stream marker passed down the stage chain
+
+
+def find_pairs(folder):
+    """Yield (image, label) pairs from every images/ directory under folder that has a sibling labels/"""
+    for root, dirs, _ in os.walk(folder):
+        if os.path.basename(root) != 'images':
+            continue
+        dirs.clear()
+        pair_root = os.path.dirname(root)
+        image_names, label_mtimes = scan_pairs(pair_root, label_mtimes=False)
+        for img_file, label_mtime in zip(image_names.tolist(), label_mtimes.tolist()):
+            if label_mtime >= 0:
+                yield (os.path.join(root, img_file),
+                       os.path.join(pair_root, 'labels', os.path.splitext(img_file)[0] + '.txt'))
+
+
+class StreamingIngest:
+    """Stream (image, label) pairs through hash/dedup -> probe/validate -> small-object tagging -> resize/place
+
+    Each stage runs in its own thread(s), connected by bounded queues: a slow stage blocks
+    the ones feeding it instead of letting items pile up in memory. An image is read in full
+    to hash it and again to decode it; the probe only reads its header. Results land in the
+    merger's incremental folder and manifest, so batch (`dataset_merger.py --incremental`)
+    and streaming merges share one dataset. Label problems are reported in issues.jsonl,
+    but the pair is still placed, as the batch merge does.
+    """
+
+    def __init__(self, merger_config, min_object_size=0.02, small_object_threshold=0.05,
+                 queue_size=64, resize_threads=None):
+        """
+        Args:
+            merger_config: DatasetMerger config; incremental 'files' output is forced
+            min_object_size: Relative box area below which a box is reported as an issue
+            small_object_threshold: Relative width and height below which an image is tagged small-object
+            queue_size: Items buffered between two stages
+            resize_threads: Threads decoding and resizing (cv2 releases the GIL); defaults to the merger's workers
+        """
+        self.merger = DatasetMerger({**merger_config, 'incremental': True, 'output_layout': 'files'})
+        self.output_folder = self.merger.output_folder
+        self.min_object_size = min_object_size
+        self.small_object_threshold = small_object_threshold
+        self.queue_size = queue_size
+        self.resize_threads = resize_threads or max(self.merger.workers, 1)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the stage threads; feed pairs with submit() and finish with close()"""
+        for split in ('train', 'val', 'test'):
+            os.makedirs(os.path.join(self.output_folder, split, 'images'), exist_ok=True)
+            os.makedirs(os.path.join(self.output_folder, split, 'labels'), exist_ok=True)
+        self.merger.create_yaml()
+
+        manifest = MergeManifest(os.path.join(self.output_folder, 'manifest.sqlite'))
+        try:
+            self.known = manifest.load()  # Updated by the hash stage as items arrive
+        finally:
+            manifest.close()
+        self.seen_hashes = {row['content_hash'] for row in self.known.values() if row['split']}
+        self.claimed = {}  # Content hash -> output image of the item placed with it this run
+        self.issues = open(os.path.join(self.output_folder, 'issues.jsonl'), 'a')
+        self.small_list = open(os.path.join(self.output_folder, 'small_objects.txt'), 'a')
+
+        self.inbox = queue.Queue(maxsize=self.queue_size)
+        hashed = queue.Queue(maxsize=self.queue_size)
+        validated = queue.Queue(maxsize=self.queue_size)
+        tagged = queue.Queue(maxsize=self.queue_size)
+        self.placed = queue.Queue(maxsize=self.queue_size)
+
+        self._spawn(self._stage, self._hash_and_dedup, self.inbox, hashed)
+        self._spawn(self._stage, self._probe_and_validate, hashed, validated)
+        self._spawn(self._stage, self._tag_small_objects, validated, tagged, self.resize_threads)
+        for _ in range(self.resize_threads):
+            self._spawn(self._stage, self._resize_and_place, tagged, self.placed)
+        self._spawn(self._record, self.placed, self.resize_threads)
+
+    def submit(self, image_path, label_path):
+        """Queue one pair; blocks while the first stage is full"""
+        self.inbox.put((image_path, label_path))
+
+    def submit_folder(self, folder):
+        """Queue every labelled image under folder, returning how many were queued"""
+        count = 0
+        for image_path, label_path in find_pairs(folder):
+            self.submit(image_path, label_path)
+            count += 1
+        return count
+
+    def close(self):
+        """Let queued items drain through every stage, then stop"""
+        self.inbox.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.issues.close()
+        self.small_list.close()
+        self.print_summary()
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _stage(self, func, inbox, outbox, consumers=1):
+        """Apply func to every item (None drops it), then pass one end marker to each downstream thread"""
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                for _ in range(consumers):
+                    outbox.put(_DONE)
+                return
+            try:
+                with span(func.__name__.lstrip('_')):
+                    result = func(item)
+            except Exception as e:
+                path = item[0] if isinstance(item, tuple) else item['image_path']
+                print(f"[Ingest] {func.__name__} failed for {path}: {e}")
+                if isinstance(item, dict):
+                    self._reject(item)
+                with self._lock:
+                    self.stats['errors'] += 1
+                continue
+            if result is not None:
+                outbox.put(result)
+
+    def _hash_and_dedup(self, pair):
+        """Skip unchanged pairs and copies of content that has already been placed
+
+        A hash only enters seen_hashes once its item is placed (see _record), so an item a
+        later stage rejects never turns its byte-identical copies into duplicates.
+        """
+        image_path, label_path = pair
+        img_stat = os.stat(image_path)
+        label_mtime_ns = os.stat(label_path).st_mtime_ns
+        with self._lock:
+            row = self.known.get(image_path)
+            if MergeManifest.is_unchanged(row, img_stat.st_size, img_stat.st_mtime_ns, label_mtime_ns):
+                self.stats['unchanged'] += 1
+                return None
+
+        entry = {
+            'image_path': image_path,
+            'label_path': label_path,
+            'size': img_stat.st_size,
+            'mtime_ns': img_stat.st_mtime_ns,
+            'label_mtime_ns': label_mtime_ns,
+            'content_hash': hash_file(image_path, self.merger.hash_algorithm),
+            'split': None,
+            'image_out': None,
+            'label_out': None
+        }
+        with self._lock:
+            if row and row['split']:
+                self.seen_hashes.discard(row['content_hash'])  # The file changed; its old content is gone
+            # Later submissions of the same unchanged file are skipped from here on
+            self.known[image_path] = entry
+            duplicate = entry['content_hash'] in self.seen_hashes
+            if duplicate:
+                self.stats['duplicates'] += 1
+
+        if duplicate:
+            # Recorded with no split, like the batch merge, so it is skipped next time too
+            print(f"Removed duplicate: {image_path}")
+            if row:
+                self.merger.remove_outputs([row])
+            self.placed.put(entry)
+            return None
+
+        entry['split'] = row['split'] if row and row['split'] else self.merger.assign_split(entry['content_hash'])
+        entry['previous'] = row  # Restored by _reject if a later stage drops the item
+        return entry
+
+    def _reject(self, entry):
+        """Forget an item a later stage dropped, so its path and content are tried again"""
+        previous = entry.pop('previous', None)
+        with self._lock:
+            if previous is None:
+                self.known.pop(entry['image_path'], None)
+            else:
+                self.known[entry['image_path']] = previous
+                if previous['split']:
+                    self.seen_hashes.add(previous['content_hash'])
+
+    def _claim(self, entry):
+        """Mark a placed item's content as seen; False if an identical item was placed first"""
+        with self._lock:
+            if entry['content_hash'] in self.seen_hashes:
+                self.stats['duplicates'] += 1
+                return False
+            self.seen_hashes.add(entry['content_hash'])
+            self.claimed[entry['content_hash']] = entry['image_out']
+            return True
+
+    def _probe_and_validate(self, entry):
+        """Read image dimensions from the header and report label problems
+
+        Unreadable images are dropped (the resize would fail on them anyway); pairs with
+        malformed or invalid labels are kept, and only their valid boxes are used for tagging.
+        """
+        with METRICS.timer('probe_seconds'):
+            size = probe_image_size(entry['image_path'])
+        if size is None:
+            self._issue('unreadable_image', entry)
+            self._reject(entry)
+            return None
+
+        try:
+            boxes = parse_label_file(entry['label_path'])
+        except ValueError:
+            self._issue('malformed_label', entry)
+            boxes = np.zeros((0, 5))
+
+        cls, coords = boxes[:, 0], boxes[:, 1:]
+        bad = ((cls < 0) | (cls >= len(self.merger.class_names)) | (cls != np.floor(cls))
+               | (coords < 0).any(axis=1) | (coords > 1).any(axis=1) | (coords[:, 2:] <= 0).any(axis=1))
+        if bad.any():
+            self._issue('invalid_boxes', entry, rows=np.flatnonzero(bad).tolist())
+            boxes = boxes[~bad]
+
+        entry['image_size'] = size
+        entry['boxes'] = boxes
+        return entry
+
+    def _tag_small_objects(self, entry):
+        """Report boxes below min_object_size and mark images the small-object filter would keep"""
+        boxes = entry.pop('boxes')
+        w, h = entry.pop('image_size')
+        small = boxes[boxes[:, 3] * boxes[:, 4] < self.min_object_size]
+        if len(small):
+            self._issue('small_objects', entry, small_objects=[{
+                'class': self.merger.class_names[int(cls)],
+                'size': (float(bw * w), float(bh * h)),
+                'relative_size': (float(bw), float(bh))
+            } for cls, _, _, bw, bh in small])
+
+        threshold = self.small_object_threshold
+        entry['small'] = bool(((boxes[:, 3] < threshold) & (boxes[:, 4] < threshold)).any())
+        return entry
+
+    def _resize_and_place(self, entry):
+        """Resize (or link) the image into its split and copy the label"""
+        split_dir = os.path.join(self.output_folder, entry['split'])
+        task = (entry['image_path'], entry['label_path'],
+                os.path.join(split_dir, 'images'), os.path.join(split_dir, 'labels'), self.merger.image_options)
+        _, ok, timings = _process_image(task)
+        record_image_timings(timings, ok)
+        if not ok:
+            print(f"Failed to read image: {entry['image_path']}")
+            self._reject(entry)
+            with self._lock:
+                self.stats['failed'] += 1
+            return None
+
+        entry['image_out'] = os.path.join(
+            split_dir, 'images', output_image_name(entry['image_path'], self.merger.image_options['output_format']))
+        entry['label_out'] = os.path.join(split_dir, 'labels', os.path.basename(entry['label_path']))
+        return entry
+
+    def _record(self, inbox, producers, batch_size=64, max_delay=2.0):
+        """Commit finished items to the manifest in small batches; this thread owns the SQLite connection"""
+        manifest = MergeManifest(os.path.join(self.output_folder, 'manifest.sqlite'))
+        pending = []
+        last_commit = time.monotonic()
+        try:
+            while producers:
+                try:
+                    item = inbox.get(timeout=max_delay)
+                except queue.Empty:
+                    item = None
+
+                if item is _DONE:
+                    producers -= 1
+                elif item is not None:
+                    item.pop('previous', None)
+                    small = item.pop('small', False)
+                    if item['split'] and not self._claim(item):
+                        # An identical copy that was still in flight was placed first
+                        print(f"Removed duplicate: {item['image_path']}")
+                        if item['image_out'] != self.claimed.get(item['content_hash']):
+                            self.merger.remove_outputs([item])  # Same-named copies share one output
+                        item.update(split=None, image_out=None, label_out=None)
+                    elif small:
+                        self.small_list.write(os.path.abspath(item['image_out']) + '\n')
+                    pending.append(item)
+
+                if pending and (len(pending) >= batch_size or time.monotonic() - last_commit >= max_delay):
+                    self._commit(manifest, pending)
+                    pending = []
+                    last_commit = time.monotonic()
+
+            if pending:
+                self._commit(manifest, pending)
+        finally:
+            manifest.close()
+
+    def _commit(self, manifest, rows):
+        manifest.upsert(rows)
+        self.small_list.flush()
+        self.issues.flush()
+        with self._lock:
+            for row in rows:
+                if row['split']:
+                    self.stats[row['split']] += 1
+
+    def _issue(self, kind, entry, **details):
+        with self._lock:
+            self.stats[kind] += 1
+            self.issues.write(json.dumps({'type': kind, 'image': entry['image_path'], **details}) + '\n')
+
+    def print_summary(self):
+        """Print how many items each stage placed or dropped"""
+        stats = self.stats
+        print(f"\nStreaming ingest: {stats['train'] + stats['val'] + stats['test']} placed "
+              f"(train {stats['train']}, val {stats['val']}, test {stats['test']}), "
+              f"{stats['unchanged']} unchanged, {stats['duplicates']} duplicates, {stats['failed']} failed")
+        print(f"Issues: {stats['unreadable_image']} unreadable, "
+              f"{stats['malformed_label'] + stats['invalid_boxes']} bad labels, "
+              f"{stats['small_objects']} with small objects (see {self.issues.name})")
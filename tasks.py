@@ -1,58 +1,319 @@
+import os
+import json
+import time
 import yaml
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from roboflow_downloader import RoboflowDownloader
-from reddit_downloader import RedditImageDownloader
-import time
+from rq import Queue, get_current_job
+from rq.job import Dependency, Job
+from lease_lock import LeaseLock
+from rate_limiter import get_rate_limiter
+from metrics import METRICS
+
+# The downloaders pull in praw, roboflow and cv2, so they are imported inside the jobs that
+# need them; pipeline.py only imports this module to reference job functions when scheduling.
+
+STAT_KEYS = ('downloaded', 'skipped', 'failed', 'bytes')
+INGEST_QUEUE_KEY = "ingest:folders"  # Folders whose downloads finished, consumed by Pipeline.run_streaming
+CATCH_UP_POLICIES = ('once', 'skip')
+PENDING_STATUSES = ('queued', 'deferred', 'scheduled')
+
+_configs = {}
+_clients = {}
+
+def _load_config(config_path):
+    """Parse config.yaml once per process (re-read only when the file changes)"""
+    key = (os.path.abspath(config_path), os.stat(config_path).st_mtime_ns)
+    if key not in _configs:
+        with open(config_path) as f:
+            _configs[key] = yaml.safe_load(f)
+    return _configs[key]
+
+def _cached_client(kind, config, factory):
+    """Build a client once per process and reuse it for later jobs with the same settings
+
+    Keyed on the whole config and the job's Redis server, since clients hold rate limiters,
+    the seen-post index and cache settings built from them. Only 'simple' workers keep
+    clients between jobs: a fork-mode job runs in a fresh child whose cache dies with it.
+    """
+    connection = _redis_connection()
+    key = (kind, json.dumps(config, sort_keys=True, default=str),
+           repr(connection.connection_pool) if connection is not None else None)
+    if key not in _clients:
+        _clients[key] = factory()
+    return _clients[key]
+
+def ping():
+    """Trivial job used to measure per-job worker overhead"""
+    return os.getpid()
+
+def _redis_connection():
+    """Redis connection of the running RQ job, or None when called outside a worker"""
+    job = get_current_job()
+    return job.connection if job else None
+
+@contextmanager
+def _job_metrics(job_name):
+    """Time a job and push this process's metrics to Redis when it ends"""
+    start = time.perf_counter()
+    status = 'failed'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        METRICS.observe('job_seconds', time.perf_counter() - start, job=job_name)
+        METRICS.inc('jobs_total', job=job_name, status=status)
+        connection = _redis_connection()
+        if connection is not None:
+            METRICS.flush(connection)
+
+@contextmanager
+def _single_flight(config, name, connection=None, ttl=None):
+    """Yield whether this process got the lease for name; always True outside a worker"""
+    connection = connection or _redis_connection()
+    if connection is None:
+        yield True
+        return
+    lease = LeaseLock(connection, name, ttl=ttl or config['scheduling'].get('lease_seconds', 120))
+    if not lease.acquire():
+        print(f"{name} is already running ({lease.holder()}), skipping")
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        lease.release()
+
+def next_run_time(connection, source, interval_seconds, catch_up='once', now=None):
+    """When a recurring job is next due, from the last run recorded in schedule:<source>
+
+    Returns None if it has never run. A run missed while nothing was running is due
+    immediately under the 'once' policy; 'skip' waits for the next slot on the original grid.
+    """
+    if catch_up not in CATCH_UP_POLICIES:
+        raise ValueError(f"Unknown catch_up policy '{catch_up}', expected one of {CATCH_UP_POLICIES}")
+    last_run = connection.hget(f"schedule:{source}", 'last_run')
+    if last_run is None:
+        return None
+    now = now or time.time()
+    due = float(last_run) + interval_seconds
+    if due < now and catch_up == 'skip':
+        due += -(-(now - due) // interval_seconds) * interval_seconds  # Ceil to the next slot
+    return datetime.fromtimestamp(max(due, now), timezone.utc)
+
+@contextmanager
+def _coordinate(config, source, connection):
+    """Yield whether a coordinator run of source should go ahead, recording it if so
+
+    Only one coordinator per source runs at a time. A run that starts more than
+    misfire_grace_minutes late (e.g. after downtime) is dropped under catch_up: skip and the
+    schedule moves to the next slot; under 'once' it runs, and later misses are not replayed.
+    """
+    if connection is None:
+        yield True
+        return
+
+    scheduling = config['scheduling']
+    interval = scheduling[f'{source}_interval_hours'] * 3600
+    catch_up = scheduling.get('catch_up', 'once')
+    grace = scheduling.get('misfire_grace_minutes', 10) * 60
+    job = get_current_job()
+    if job is not None and job.id == f"schedule-{source}":
+        # Only the scheduled run has a slot to be late for; manual runs always go ahead
+        last_run = connection.hget(f"schedule:{source}", 'last_run')
+        late = time.time() - float(last_run) - interval if last_run else 0
+        if catch_up == 'skip' and late > grace:
+            _reschedule(job, next_run_time(connection, source, interval, 'skip'))
+            print(f"{source} run is {late / 60:.0f} min late, skipping to the next slot")
+            yield False
+            return
+
+    with _single_flight(config, f"coordinator:{source}", connection, ttl=60) as acquired:
+        if acquired:
+            connection.hset(f"schedule:{source}", 'last_run', time.time())
+        yield acquired
+
+def _reschedule(job, when):
+    """Move a periodic rq_scheduler job's next run, which is otherwise now + interval"""
+    from rq_scheduler import Scheduler
+
+    # rq_scheduler re-adds the job for its next run before executing it
+    scheduler = Scheduler(connection=job.connection)
+    if job in scheduler:
+        scheduler.change_execution_time(job, when)
+
+def _rate_limiter(config, name):
+    """Redis-backed limiter shared by all workers, or a local one outside a worker"""
+    return get_rate_limiter(config, name, _redis_connection())
+
+def _classes_by_subreddit(config, output_dir):
+    """Invert reddit_classes into {subreddit: {class: (keywords, class_dir)}}"""
+    subreddits = {}
+    for class_name, class_config in config['reddit_classes'].items():
+        class_dir = output_dir / class_name
+        class_dir.mkdir(parents=True, exist_ok=True)
+        for subreddit in class_config['subreddits']:
+            subreddits.setdefault(subreddit, {})[class_name] = (class_config['keywords'], str(class_dir))
+    return subreddits
+
+def _fan_out(source, func, config_path, items, connection):
+    """Enqueue func(config_path, item) per item plus a stats job that runs once they all finish
 
-def run_reddit_job(config_path):
-    """Task function for Reddit downloads"""
+    An item whose previous job is still waiting, or running under its lease, is coalesced
+    into that job instead of being enqueued again. Without a Redis connection (called
+    outside a worker) the items run inline instead.
+    """
+    if connection is None:
+        return aggregate_stats(source, results=[func(config_path, item) for item in items])
+
+    # pending:<source>:<item> points at the item's latest job
+    pointer_keys = [f"pending:{source}:{item}" for item in items]
+    previous_ids = [job_id.decode() if job_id else None for job_id in connection.mget(pointer_keys)] if items else []
+    previous = {job.id: job for job in Job.fetch_many([i for i in previous_ids if i], connection=connection) if job}
+
+    queue = Queue('default', connection=connection)
+    jobs = []
+    coalesced = 0
+    for item, key, job_id in zip(items, pointer_keys, previous_ids):
+        job = previous.get(job_id)
+        if job is not None and _still_pending(job, f"lock:{source}:{item}"):
+            coalesced += 1
+            continue
+        job = queue.enqueue(func, config_path, item, description=f"{source}: {item}", meta={'fan_out': source})
+        connection.set(key, job.id, ex=7 * 24 * 3600)
+        jobs.append(job)
+
+    if jobs:
+        queue.enqueue(
+            aggregate_stats, source, [job.id for job in jobs],
+            depends_on=Dependency(jobs=jobs, allow_failure=True),
+            description=f"{source}: aggregate stats"
+        )
+    print(f"Enqueued {len(jobs)} {source} jobs, {coalesced} coalesced into jobs still pending")
+    return [job.id for job in jobs]
+
+def _still_pending(job, lease_key):
+    """True if job has yet to run, or is running on a worker that still holds its lease"""
+    status = job.get_status(refresh=False)
+    status = getattr(status, 'value', status)
+    if status in PENDING_STATUSES:
+        return True
+    # A started job whose lease expired belongs to a dead worker and will never finish
+    return status == 'started' and job.connection.exists(lease_key)
+
+def aggregate_stats(source, job_ids=None, results=None):
+    """Completion callback: sum the stats returned by a batch of fan-out jobs"""
+    totals = dict.fromkeys(STAT_KEYS, 0)
+    totals['jobs'] = 0
+    totals['failed_jobs'] = 0
+
+    connection = _redis_connection()
+    if job_ids:
+        results = []
+        for job in Job.fetch_many(job_ids, connection=connection):
+            if job is None or job.is_failed:
+                totals['failed_jobs'] += 1
+            else:
+                results.append(job.return_value())
+
+    for result in results or []:
+        totals['jobs'] += 1
+        for key in STAT_KEYS:
+            totals[key] += (result or {}).get(key, 0)
+
+    if connection is not None:
+        connection.hset(f"stats:{source}:last_run", mapping=totals)
+    print(f"{source} totals: {totals}")
+    return totals
+
+def run_reddit_job(config_path, connection=None):
+    """Task function for Reddit downloads: fans out one job per subreddit"""
     print(f"Starting Reddit download job with config: {config_path}")
     try:
-        with open(config_path) as f:
-            config = yaml.safe_load(f)
-        
-        downloader = RedditImageDownloader(config['reddit_credentials'])
-        output_dir = Path(config['output_base']) / "reddit_images"
-        output_dir.mkdir(exist_ok=True)
-        
-        for class_name, class_config in config['reddit_classes'].items():
-            class_dir = output_dir / class_name
-            class_dir.mkdir(exist_ok=True)
-            
-            for subreddit in class_config['subreddits']:
-                downloader.scrape_subreddit(
-                    subreddit_name=subreddit,
-                    keywords=class_config['keywords'],
-                    output_dir=str(class_dir),
-                    limit_per_subreddit=config['download_limits']['reddit']
-                )
-                time.sleep(config['rate_limits']['reddit'])
-                
+        config = _load_config(config_path)
+        connection = connection or _redis_connection()
+        with _coordinate(config, 'reddit', connection) as due:
+            if not due:
+                return []
+            output_dir = Path(config['output_base']) / "reddit_images"
+            subreddits = list(_classes_by_subreddit(config, output_dir))
+            return _fan_out('reddit', run_subreddit_job, config_path, subreddits, connection)
+
     except Exception as e:
         print(f"Reddit job failed: {e}")
         raise
 
-def run_roboflow_job(config_path):
-    """Task function for Roboflow downloads"""
+def run_subreddit_job(config_path, subreddit):
+    """Task function scraping one subreddit for every class that lists it"""
+    from reddit_downloader import RedditImageDownloader, SeenPostIndex
+
+    config = _load_config(config_path)
+    credentials = config['reddit_credentials']
+    downloader = _cached_client('reddit', config, lambda: RedditImageDownloader(
+        credentials,
+        api_limiter=_rate_limiter(config, 'reddit_api'),
+        image_limiter=_rate_limiter(config, 'image_hosts'),
+        seen_index=SeenPostIndex(_redis_connection())
+    ))
+    output_dir = Path(config['output_base']) / "reddit_images"
+
+    # The subreddit is fetched once and matched against every class that lists it
+    with _single_flight(config, f"reddit:{subreddit}") as acquired:
+        if not acquired:
+            return dict.fromkeys(STAT_KEYS, 0)
+        with _job_metrics('subreddit'):
+            summary = downloader.scrape_subreddit_classes(
+                subreddit_name=subreddit,
+                classes=_classes_by_subreddit(config, output_dir)[subreddit],
+                limit_per_subreddit=config['download_limits']['reddit']
+            )
+    return {key: summary[key] for key in STAT_KEYS}
+
+def run_roboflow_job(config_path, connection=None):
+    """Task function for Roboflow downloads: fans out one job per project"""
     print(f"Starting Roboflow download job with config: {config_path}")
     try:
-        with open(config_path) as f:
-            config = yaml.safe_load(f)
-        
-        downloader = RoboflowDownloader(config['roboflow_api_key'])
-        output_dir = Path(config['output_base']) / "roboflow_images"
-        output_dir.mkdir(exist_ok=True)
-        
-        for class_name, class_config in config['roboflow_classes'].items():
-            downloader.download_dataset(
+        config = _load_config(config_path)
+        connection = connection or _redis_connection()
+        with _coordinate(config, 'roboflow', connection) as due:
+            if not due:
+                return []
+            classes = list(config['roboflow_classes'])
+            return _fan_out('roboflow', run_roboflow_project_job, config_path, classes, connection)
+
+    except Exception as e:
+        print(f"Roboflow job failed: {e}")
+        raise
+
+def run_roboflow_project_job(config_path, class_name):
+    """Task function downloading one Roboflow project"""
+    from roboflow_downloader import RoboflowDownloader
+
+    config = _load_config(config_path)
+    class_config = config['roboflow_classes'][class_name]
+    cache_config = config.get('roboflow_cache', {})
+    downloader = _cached_client('roboflow', config, lambda: RoboflowDownloader(
+        config['roboflow_api_key'],
+        cache_dir=cache_config.get('dir'),
+        cache_max_bytes=int(cache_config['max_gb'] * 1024 ** 3) if cache_config.get('max_gb') else None
+    ))
+    output_dir = Path(config['output_base']) / "roboflow_images"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with _single_flight(config, f"roboflow:{class_name}") as acquired:
+        if not acquired:
+            return {'downloaded': 0, 'failed': 0}
+        with _job_metrics('roboflow_project'):
+            _rate_limiter(config, 'roboflow').acquire()
+            ok = downloader.download_dataset(
                 workspace=class_config['workspace'],
                 project=class_config['project'],
                 version=class_config['version'],
                 class_name=class_name,
                 output_dir=str(output_dir / class_name)
             )
-            time.sleep(config['rate_limits']['roboflow'])
-            
-    except Exception as e:
-        print(f"Roboflow job failed: {e}")
-        raise
\ No newline at end of file
+    connection = _redis_connection()
+    if ok and connection is not None:
+        connection.rpush(INGEST_QUEUE_KEY, str(output_dir / class_name))
+    return {'downloaded': int(ok), 'failed': int(not ok)}
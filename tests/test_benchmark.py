@@ -0,0 +1,35 @@
+import pytest
+from benchmark import compare, run_stage
+
+
+def _results(**seconds):
+    return {
+        'dataset': {'images': 10},
+        'workers': 2,
+        'stages': {name: {'seconds': value} for name, value in seconds.items()}
+    }
+
+
+def test_compare_flags_slower_stages_only():
+    baseline = _results(**{'merge.total': 1.0, 'validate.total': 2.0, 'filter.total': 1.0})
+    results = _results(**{'merge.total': 1.5, 'validate.total': 1.0, 'filter.total': 1.05})
+    assert compare(results, baseline, threshold=0.1) == ['merge.total']
+
+
+def test_compare_ignores_noise_below_min_delta():
+    baseline = _results(**{'filter.total': 0.010})
+    results = _results(**{'filter.total': 0.030})  # 3x slower, but only 20 ms
+    assert compare(results, baseline, threshold=0.1, min_delta=0.05) == []
+    assert compare(results, baseline, threshold=0.1, min_delta=0.01) == ['filter.total']
+
+
+def test_compare_skips_stages_missing_from_baseline():
+    baseline = _results(**{'merge.total': 1.0})
+    results = _results(**{'merge.total': 1.0, 'download.download_many': 5.0})
+    assert compare(results, baseline, threshold=0.1) == []
+
+
+def test_run_stage_raises_when_child_crashes(tmp_path):
+    # validate needs a merged dataset; without one the child raises before reporting
+    with pytest.raises(RuntimeError, match="exited with code"):
+        run_stage('validate', str(tmp_path), 1, poll_seconds=0.2)
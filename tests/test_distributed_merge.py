@@ -0,0 +1,61 @@
+import os
+import cv2
+import fakeredis
+import numpy as np
+from rq import Queue, SimpleWorker
+import distributed_merge
+
+
+def _dataset(root, count):
+    os.makedirs(root / 'images')
+    os.makedirs(root / 'labels')
+    for i in range(count):
+        image = np.full((64, 64, 3), i * 10, dtype=np.uint8)  # Distinct content, so no duplicates
+        cv2.imwrite(str(root / 'images' / f"img_{i}.jpg"), image)
+        (root / 'labels' / f"img_{i}.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+
+
+def _work(connection):
+    SimpleWorker([Queue('default', connection=connection)], connection=connection).work(burst=True)
+
+
+def test_resume_reruns_only_failed_chunks(tmp_path, monkeypatch):
+    _dataset(tmp_path / 'source', 6)
+    connection = fakeredis.FakeRedis()
+    config = {
+        'input_folders': [str(tmp_path / 'source')],
+        'output_base': str(tmp_path / 'out'),
+        'split_ratio': [1.0, 0.0, 0.0],
+        'target_size': [32, 32],
+        'class_names': ['cat']
+    }
+
+    process_image = distributed_merge._process_image
+    processed = []
+
+    def flaky(task):
+        processed.append(os.path.basename(task[0]))
+        if os.path.basename(task[0]) == 'img_3.jpg':
+            raise OSError("disk full")
+        return process_image(task)
+
+    monkeypatch.setattr(distributed_merge, '_process_image', flaky)
+    merge_id = distributed_merge.enqueue_merge(config, connection, chunk_images=2, retries=0)
+    _work(connection)
+
+    status = distributed_merge.merge_status(connection, merge_id)
+    assert status['state'] == 'incomplete'
+    assert (status['chunks'], status['done'], status['failed']) == (3, 2, 1)
+    assert status['images'] == 4
+
+    monkeypatch.setattr(distributed_merge, '_process_image', process_image)
+    processed.clear()
+    assert len(distributed_merge.resume_merge(connection, merge_id, retries=0)) == 1
+    _work(connection)
+
+    status = distributed_merge.merge_status(connection, merge_id)
+    assert status['state'] == 'complete'
+    assert (status['done'], status['failed'], status['images']) == (3, 0, 6)
+    assert processed == []  # The resumed chunk ran with the real function, nothing else re-ran
+    assert len(os.listdir(os.path.join(status['output_folder'], 'train', 'images'))) == 6
+    assert os.path.exists(os.path.join(status['output_folder'], 'data.yaml'))
@@ -0,0 +1,41 @@
+import fakeredis
+import pytest
+from rq import Queue, SimpleWorker
+import tasks
+
+
+def download_item(config_path, item):
+    """Stand-in for a per-item download job"""
+    if item == 'broken':
+        raise RuntimeError("download failed")
+    return {'downloaded': len(item), 'skipped': 1, 'failed': 0, 'bytes': 100}
+
+
+@pytest.fixture
+def connection():
+    return fakeredis.FakeRedis()
+
+
+def _work(connection):
+    SimpleWorker([Queue('default', connection=connection)], connection=connection).work(burst=True)
+
+
+def test_fan_out_runs_aggregate_after_every_job(connection):
+    job_ids = tasks._fan_out('test', download_item, 'config.yaml', ['cats', 'dogs', 'broken'], connection)
+    assert len(job_ids) == 3
+    _work(connection)
+
+    totals = {k.decode(): int(v) for k, v in connection.hgetall('stats:test:last_run').items()}
+    assert totals == {'downloaded': 8, 'skipped': 2, 'failed': 0, 'bytes': 200, 'jobs': 2, 'failed_jobs': 1}
+
+
+def test_fan_out_coalesces_items_still_queued(connection):
+    first = tasks._fan_out('test', download_item, 'config.yaml', ['cats', 'dogs'], connection)
+    second = tasks._fan_out('test', download_item, 'config.yaml', ['cats', 'birds'], connection)
+    assert len(first) == 2
+    assert len(second) == 1  # cats is still waiting from the first fan-out
+
+
+def test_fan_out_with_no_items_enqueues_nothing(connection):
+    assert tasks._fan_out('test', download_item, 'config.yaml', [], connection) == []
+    assert Queue('default', connection=connection).count == 0
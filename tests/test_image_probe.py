@@ -0,0 +1,66 @@
+import struct
+import cv2
+import numpy as np
+import pytest
+from image_probe import read_image_header, read_image_size
+
+
+def _segment(marker, payload):
+    return b'\xff' + bytes([marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _exif(orientation, endian='<'):
+    order = b'II' if endian == '<' else b'MM'
+    tiff = order + struct.pack(endian + 'HI', 42, 8)
+    tiff += struct.pack(endian + 'H', 1) + struct.pack(endian + 'HHIHH', 0x0112, 3, 1, orientation, 0)
+    return _segment(0xE1, b'Exif\x00\x00' + tiff + struct.pack(endian + 'I', 0))
+
+
+def _sof(width, height):
+    return _segment(0xC0, struct.pack('>BHHB', 8, height, width, 3) + b'\x01\x22\x00' * 3)
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_real_files_match_decoded_size(tmp_path):
+    image = np.zeros((30, 50, 3), dtype=np.uint8)
+    for ext in ('.jpg', '.png'):
+        path = str(tmp_path / f"a{ext}")
+        cv2.imwrite(path, image)
+        assert read_image_header(path) == (50, 30, 1)
+
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+def test_exif_orientation_before_sof_swaps_size(tmp_path, endian):
+    path = _write(tmp_path / 'a.jpg', b'\xff\xd8' + _exif(6, endian) + _sof(640, 480) + b'\xff\xd9')
+    assert read_image_header(path) == (640, 480, 6)
+    assert read_image_size(path) == (480, 640)
+
+
+def test_sof_without_exif_keeps_size(tmp_path):
+    path = _write(tmp_path / 'a.jpg', b'\xff\xd8' + _segment(0xE0, b'JFIF\x00' + b'\x00' * 9) + _sof(64, 32))
+    assert read_image_size(path) == (64, 32)
+
+
+@pytest.mark.parametrize('data', [
+    b'\xff\xd8',                                              # Nothing after SOI
+    b'\xff\xd8' + _segment(0xE0, b'JFIF\x00' + b'\x00' * 9),  # Ends before any frame header
+    b'\xff\xd8\xff\xe0\x00',                                  # Truncated segment length
+    b'\xff\xd8\xff\xc0\x00\x11\x08\x01',                      # Truncated SOF
+    b'\xff\xd8\xff\xe0\x00\x00' + _sof(64, 32),               # Segment length 0
+    b'\xff\xd8\xff\xe0\x00\x01' + _sof(64, 32),               # Segment length 1
+    b'\xff\xd8\xff\xda\x00\x02',                              # Scan data before the frame header
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\x0dIHDR\x00\x00',         # Truncated PNG header
+    b'GIF89a',                                                # Unsupported format
+])
+def test_malformed_headers_are_unparseable(tmp_path, data):
+    assert read_image_header(_write(tmp_path / 'bad.jpg', data)) is None
+
+
+def test_truncated_exif_keeps_default_orientation(tmp_path):
+    segment = _segment(0xE1, b'Exif\x00\x00II*\x00\xff\x00\x00\x00')  # IFD offset past the end
+    path = _write(tmp_path / 'a.jpg', b'\xff\xd8' + segment + _sof(64, 32))
+    assert read_image_header(path) == (64, 32, 1)
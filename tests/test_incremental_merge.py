@@ -0,0 +1,141 @@
+import os
+import shutil
+import sqlite3
+import cv2
+import numpy as np
+import pytest
+import dataset_merger
+from dataset_merger import DatasetMerger
+
+
+def _write_pair(folder, name, value):
+    os.makedirs(folder / 'images', exist_ok=True)
+    os.makedirs(folder / 'labels', exist_ok=True)
+    cv2.imwrite(str(folder / 'images' / f"{name}.png"), np.full((64, 64, 3), value, dtype=np.uint8))
+    (folder / 'labels' / f"{name}.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+
+
+@pytest.fixture
+def source(tmp_path):
+    for i in range(8):
+        _write_pair(tmp_path / 'source', f"img_{i}", i * 20)
+    return tmp_path / 'source'
+
+
+@pytest.fixture
+def merge(tmp_path, source, monkeypatch):
+    """Run an incremental merge of the given folders; returns the paths it hashed"""
+    hash_file = dataset_merger.hash_file
+
+    def run(*folders):
+        hashed = []
+
+        def recording(path, **kwargs):
+            hashed.append(os.path.basename(path))
+            return hash_file(path, **kwargs)
+
+        monkeypatch.setattr(dataset_merger, 'hash_file', recording)
+        DatasetMerger({
+            'input_folders': [str(folder) for folder in folders or (source,)],
+            'output_base': str(tmp_path / 'out'),
+            'split_ratio': (0.5, 0.3, 0.2),
+            'target_size': (32, 32),
+            'class_names': ['cat'],
+            'incremental': True
+        }).run()
+        return sorted(hashed)
+    return run
+
+
+def _output(tmp_path):
+    return tmp_path / 'out' / 'dataset_incremental'
+
+
+def _manifest(tmp_path):
+    with sqlite3.connect(_output(tmp_path) / 'manifest.sqlite') as conn:
+        rows = conn.execute("SELECT image_path, content_hash, split, image_out FROM pairs").fetchall()
+    return {os.path.basename(path): (content_hash, split, image_out) for path, content_hash, split, image_out in rows}
+
+
+def _placed(tmp_path):
+    return sorted(name for split in ('train', 'val', 'test')
+                  for name in os.listdir(_output(tmp_path) / split / 'images'))
+
+
+def test_first_run_places_every_pair(tmp_path, merge):
+    assert len(merge()) == 8
+    assert _placed(tmp_path) == [f"img_{i}.png" for i in range(8)]
+    assert all(os.path.exists(image_out) for _, _, image_out in _manifest(tmp_path).values())
+
+
+def test_unchanged_rerun_is_a_no_op(tmp_path, merge):
+    merge()
+    manifest = _manifest(tmp_path)
+    mtimes = {out: os.stat(out).st_mtime_ns for _, _, out in manifest.values()}
+
+    assert merge() == []  # Nothing re-read
+    assert _manifest(tmp_path) == manifest
+    assert {out: os.stat(out).st_mtime_ns for out in mtimes} == mtimes  # Nothing rewritten
+
+
+def test_changed_file_is_reprocessed_in_its_split(tmp_path, source, merge):
+    merge()
+    before = _manifest(tmp_path)['img_3.png']
+
+    _write_pair(source, 'img_3', 250)
+    path = source / 'images' / 'img_3.png'
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))  # Coarse mtime filesystems
+    assert merge() == ['img_3.png']
+
+    content_hash, split, image_out = _manifest(tmp_path)['img_3.png']
+    assert content_hash != before[0]
+    assert split == before[1]  # A changed file keeps its split
+    assert cv2.imread(image_out).mean() == pytest.approx(250, abs=1)
+
+
+def test_deleted_source_is_removed_from_the_output(tmp_path, source, merge):
+    merge()
+    image_out = _manifest(tmp_path)['img_5.png'][2]
+    os.remove(source / 'images' / 'img_5.png')
+    os.remove(source / 'labels' / 'img_5.txt')
+
+    assert merge() == []
+    assert 'img_5.png' not in _manifest(tmp_path)
+    assert not os.path.exists(image_out)
+    assert not os.path.exists(image_out.replace(os.sep + 'images' + os.sep, os.sep + 'labels' + os.sep)[:-4] + '.txt')
+    assert len(_placed(tmp_path)) == 7
+
+
+def test_splits_follow_the_content_hash_across_runs(tmp_path, source, merge):
+    merge()
+    first = _manifest(tmp_path)
+    splitter = DatasetMerger({'input_folders': [], 'output_base': str(tmp_path), 'split_ratio': (0.5, 0.3, 0.2),
+                              'target_size': (32, 32), 'class_names': ['cat']})
+    assert all(split == splitter.assign_split(content_hash) for content_hash, split, _ in first.values())
+
+    # New pairs do not move existing ones; a fresh output folder assigns the same splits
+    for i in range(8, 12):
+        _write_pair(source, f"img_{i}", i * 20)
+    merge()
+    second = _manifest(tmp_path)
+    assert {name: second[name][1] for name in first} == {name: split for name, (_, split, _) in first.items()}
+
+    shutil.rmtree(_output(tmp_path))
+    merge()
+    assert {name: row[1] for name, row in _manifest(tmp_path).items()} == \
+        {name: row[1] for name, row in second.items()}
+
+
+def test_duplicate_is_placed_once_its_kept_copy_goes_away(tmp_path, source, merge):
+    copy = tmp_path / 'copy'
+    _write_pair(copy, 'dup_1', 20)  # Same content as img_1
+    merge(source, copy)
+    manifest = _manifest(tmp_path)
+    assert manifest['dup_1.png'][1] is None
+    assert 'dup_1.png' not in _placed(tmp_path)
+
+    os.remove(source / 'images' / 'img_1.png')
+    os.remove(source / 'labels' / 'img_1.txt')
+    merge(source, copy)
+    assert _manifest(tmp_path)['dup_1.png'][1] == manifest['img_1.png'][1]
+    assert 'dup_1.png' in _placed(tmp_path)
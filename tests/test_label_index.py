@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from label_index import LabelIndex, parse_label_file
+
+
+def test_parse_label_file_rejects_partial_and_polygon_lines(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text("0 0.5 0.5 0.2 0.2\n\n1 0.1 0.1 0.05 0.05\n")
+    assert parse_label_file(path).shape == (2, 5)
+
+    for text in ("0 0.5 0.5 abc 0.2\n", "0 0.5 0.5 0.2\n0 0.5 0.5 0.2 0.2 0.1\n", "0 0.1 0.1 0.2 0.1 0.2 0.2\n"):
+        path.write_text(text)
+        with pytest.raises(ValueError):
+            parse_label_file(path)
+
+
+def test_class_counts_leave_out_unknown_class_ids():
+    boxes = np.array([[0, .5, .5, .1, .1], [2, .5, .5, .1, .1], [5, .5, .5, .1, .1]])
+    index = LabelIndex(np.array(['a.jpg', 'b.jpg']), np.array([0, 0]), np.array([0, 0, 1]), boxes)
+    assert index.class_counts(3).tolist() == [1, 0, 1]
+    assert index.unknown_class_images(3).tolist() == ['b.jpg']
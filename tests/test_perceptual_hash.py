@@ -0,0 +1,83 @@
+import random
+import cv2
+import numpy as np
+import pytest
+import dataset_merger
+from dataset_merger import DatasetMerger
+from perceptual_hash import BKTree, dhash, hamming
+
+
+def _tree(values):
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+    return tree
+
+
+def test_find_includes_the_radius_boundary():
+    tree = _tree([0b0000, 0b0001, 0b0011, 0b0111, 0b1111])  # Distances 0..4 from 0
+    assert sorted(tree.find(0, 2)) == [(0, 0), (1, 1), (2, 2)]
+    assert sorted(tree.find(0b1111, 1)) == [(0, 4), (1, 3)]
+
+
+def test_radius_zero_finds_exact_matches_only():
+    tree = _tree([5, 4, 5, 7])
+    assert sorted(tree.find(5, 0)) == [(0, 0), (0, 2)]
+    assert tree.find(6, 0) == []
+    assert BKTree().find(5, 3) == []
+
+
+def test_find_matches_brute_force():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    values += [v ^ (1 << rng.randrange(64)) for v in values[:50]]  # Some near neighbours
+    tree = _tree(values)
+    for query in values[:60] + [rng.getrandbits(64) for _ in range(20)]:
+        for radius in (0, 3, 10):
+            expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= radius)
+            assert sorted(tree.find(query, radius)) == expected
+
+
+def test_dhash_of_a_resaved_image_is_close(tmp_path):
+    image = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 255, (256, 256, 3), dtype=np.uint8), (31, 31), 0)
+    cv2.imwrite(str(tmp_path / 'a.png'), image)
+    cv2.imwrite(str(tmp_path / 'b.jpg'), image, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    assert hamming(dhash(str(tmp_path / 'a.png')), dhash(str(tmp_path / 'b.jpg'))) <= 6
+
+
+@pytest.fixture
+def merger(tmp_path, monkeypatch):
+    hashes = {}
+    monkeypatch.setitem(dataset_merger.HASH_FUNCTIONS, 'fake', lambda path: hashes.get(path))
+
+    def make(radius, values):
+        hashes.clear()
+        hashes.update(values)
+        return DatasetMerger({
+            'input_folders': [], 'output_base': str(tmp_path), 'split_ratio': [1, 0, 0],
+            'target_size': [32, 32], 'class_names': ['cat'],
+            'near_duplicate_radius': radius, 'perceptual_hash': 'fake'
+        })
+    return make
+
+
+def _pairs(*names):
+    return [(name, name + '.txt') for name in names]
+
+
+def test_first_of_two_near_duplicates_is_kept(merger):
+    kept = merger(2, {'a': 0b0000, 'b': 0b0011, 'c': 0b1111}).remove_near_duplicates(_pairs('a', 'b', 'c'))
+    assert kept == _pairs('a', 'c')  # b is 2 bits from a; c is 4 bits from a and 2 from the removed b
+
+    kept = merger(2, {'a': 0b0000, 'b': 0b0011, 'c': 0b1111}).remove_near_duplicates(_pairs('b', 'a', 'c'))
+    assert kept == _pairs('b')  # a and c are both within 2 bits of b
+
+
+def test_radius_zero_only_removes_identical_hashes(merger):
+    kept = merger(0, {'a': 1, 'b': 1, 'c': 3}).remove_near_duplicates(_pairs('a', 'b', 'c'))
+    assert kept == _pairs('a', 'c')
+
+
+def test_unreadable_images_are_kept_for_reporting(merger):
+    kept = merger(4, {'a': 0, 'b': 1}).remove_near_duplicates(_pairs('a', 'missing', 'b'))
+    assert kept == _pairs('a', 'missing')  # No hash for missing; b is 1 bit from a
@@ -0,0 +1,68 @@
+import time
+import fakeredis
+import pytest
+from rate_limiter import LocalTokenBucket, RedisTokenBucket, bucket_settings, get_rate_limiter
+
+
+@pytest.fixture(params=['local', 'redis'])
+def make_bucket(request):
+    connection = fakeredis.FakeRedis()
+
+    def make(rate, capacity, key='test'):
+        if request.param == 'local':
+            return LocalTokenBucket(rate, capacity)
+        return RedisTokenBucket(connection, key, rate, capacity)
+    return make
+
+
+def test_burst_up_to_capacity_then_wait(make_bucket):
+    bucket = make_bucket(rate=10, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    wait = bucket.try_acquire()
+    assert 0.05 < wait <= 0.1  # One token refills in 1 / rate seconds
+
+
+def test_refill_after_waiting(make_bucket):
+    bucket = make_bucket(rate=20, capacity=1)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+    time.sleep(0.06)
+    assert bucket.try_acquire() == 0
+
+
+def test_acquire_blocks_until_refilled(make_bucket):
+    bucket = make_bucket(rate=20, capacity=1)
+    bucket.acquire()
+    start = time.monotonic()
+    assert bucket.acquire(timeout=1)
+    assert time.monotonic() - start >= 0.03
+
+
+def test_acquire_gives_up_at_timeout(make_bucket):
+    bucket = make_bucket(rate=0.5, capacity=1)
+    bucket.acquire()
+    assert bucket.acquire(timeout=0.1) is False
+
+
+def test_oversize_request_is_rejected(make_bucket):
+    bucket = make_bucket(rate=10, capacity=2)
+    with pytest.raises(ValueError):
+        bucket.acquire(3)
+
+
+def test_redis_buckets_share_state_by_key():
+    connection = fakeredis.FakeRedis()
+    first = RedisTokenBucket(connection, 'api', 1, 1)
+    second = RedisTokenBucket(connection, 'api', 1, 1)
+    other = RedisTokenBucket(connection, 'images', 1, 1)
+    assert first.try_acquire() == 0
+    assert second.try_acquire() > 0
+    assert other.try_acquire() == 0
+
+
+def test_settings_accept_both_config_forms():
+    config = {'rate_limits': {'new': {'rate': 5, 'burst': 10}, 'old': 2}}
+    assert bucket_settings(config, 'new') == (5.0, 10.0)
+    assert bucket_settings(config, 'old') == (0.5, 1.0)
+    assert isinstance(get_rate_limiter(config, 'new'), LocalTokenBucket)
+    assert isinstance(get_rate_limiter(config, 'new', fakeredis.FakeRedis()), RedisTokenBucket)
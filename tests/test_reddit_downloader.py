@@ -0,0 +1,66 @@
+import os
+from types import SimpleNamespace
+import pytest
+import reddit_downloader
+from reddit_downloader import RedditImageDownloader
+
+TITLES = ["A squirrel eating", "Trash panda at night", "A raccoon and a squirrel", "Sunset"]
+
+
+class FakeSubreddit:
+    def __init__(self, name):
+        self.posts = [SimpleNamespace(id=f"{name}{i}", title=title, url=f"https://i.example.com/{name}{i}.jpg")
+                      for i, title in enumerate(TITLES)]
+
+    def new(self, limit):
+        return iter(self.posts)
+
+    top = hot = new
+
+
+class FakeReddit:
+    def subreddit(self, name):
+        return FakeSubreddit(name)
+
+    def info(self, fullnames):
+        return []
+
+
+class OfflineDownloader(RedditImageDownloader):
+    def __init__(self, credentials=None, **kwargs):
+        super().__init__({'client_id': 'x', 'client_secret': 'x', 'username': 'x', 'password': 'x'}, **kwargs)
+        self.reddit = FakeReddit()
+
+    def _fetch(self, url, path):
+        with open(path, 'wb') as f:
+            f.write(b'jpeg')
+        return 4
+
+
+@pytest.fixture
+def downloader():
+    return OfflineDownloader(max_workers=2)
+
+
+def test_classes_sharing_a_subreddit_all_get_posts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(reddit_downloader, 'RedditImageDownloader', OfflineDownloader)
+    reddit_downloader.main()
+
+    # aww and AnimalsBeingBros are listed for both squirrel and raccoon
+    squirrels = set(os.listdir(tmp_path / 'squirrel_images'))
+    raccoons = set(os.listdir(tmp_path / 'raccoon_images'))
+    assert {'aww0.jpg', 'aww2.jpg', 'AnimalsBeingBros0.jpg'} <= squirrels
+    assert {'aww1.jpg', 'aww2.jpg', 'AnimalsBeingBros1.jpg'} <= raccoons
+
+
+def test_scrape_subreddit_tracks_seen_posts_per_keyword_set(tmp_path, downloader):
+    (tmp_path / 'squirrel').mkdir()
+    (tmp_path / 'raccoon').mkdir()
+    first = downloader.scrape_subreddit('aww', ['squirrel'], str(tmp_path / 'squirrel'))
+    second = downloader.scrape_subreddit('aww', ['raccoon', 'trash panda'], str(tmp_path / 'raccoon'))
+    assert first['downloaded'] == 2
+    assert second['downloaded'] == 2
+
+    # A repeat with the same keywords stops at the posts it has already seen
+    assert downloader.scrape_subreddit('aww', ['squirrel'], str(tmp_path / 'squirrel'))['downloaded'] == 0
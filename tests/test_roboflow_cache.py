@@ -0,0 +1,74 @@
+import os
+import pytest
+from roboflow_downloader import RoboflowDownloader
+
+
+@pytest.fixture
+def downloader(tmp_path, monkeypatch):
+    downloader = RoboflowDownloader.__new__(RoboflowDownloader)  # No API client needed
+    downloader.cache_dir = tmp_path / 'cache'
+    downloader.cache_max_bytes = None
+    downloader.downloads = 0
+
+    def fake_download(workspace, project, version, class_name, format, location):
+        downloader.downloads += 1
+        os.makedirs(os.path.join(location, 'train', 'images'), exist_ok=True)
+        for name in ('a.jpg', 'b.jpg'):
+            with open(os.path.join(location, 'train', 'images', name), 'w') as f:
+                f.write(name * 10)
+        return True
+
+    monkeypatch.setattr(downloader, '_download', fake_download)
+    return downloader
+
+
+@pytest.fixture
+def checksums(downloader, monkeypatch):
+    calls = []
+    checksum = RoboflowDownloader._checksum
+
+    def counting(root, files):
+        calls.append(root)
+        return checksum(root, files)
+
+    monkeypatch.setattr(downloader, '_checksum', counting)
+    return calls
+
+
+def _entry(downloader):
+    return downloader.cache_dir / downloader._cache_key('ws', 'proj', 1, 'yolov8')
+
+
+def test_cache_hit_skips_the_checksum(tmp_path, downloader, checksums):
+    assert downloader.download_dataset('ws', 'proj', 1, 'cat', output_dir=str(tmp_path / 'out1'))
+    assert len(checksums) == 1  # Computed once when filling the cache
+    assert downloader.download_dataset('ws', 'proj', 1, 'cat', output_dir=str(tmp_path / 'out2'))
+    assert downloader.downloads == 1
+    assert len(checksums) == 1
+    assert os.path.exists(tmp_path / 'out2' / 'train' / 'images' / 'a.jpg')
+
+
+def test_touched_file_is_checksummed_once(tmp_path, downloader, checksums):
+    downloader.download_dataset('ws', 'proj', 1, 'cat', output_dir=str(tmp_path / 'out'))
+    path = _entry(downloader) / 'train' / 'images' / 'a.jpg'
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+
+    assert downloader._is_complete(_entry(downloader))
+    assert downloader._is_complete(_entry(downloader))
+    assert len(checksums) == 2  # Fill, then the one check after the touch
+
+
+def test_same_size_edit_invalidates_the_entry(tmp_path, downloader):
+    downloader.download_dataset('ws', 'proj', 1, 'cat', output_dir=str(tmp_path / 'out'))
+    path = _entry(downloader) / 'train' / 'images' / 'a.jpg'
+    stat = path.stat()
+    path.write_text('x' * stat.st_size)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not downloader._is_complete(_entry(downloader))
+
+
+def test_missing_file_invalidates_the_entry(tmp_path, downloader, checksums):
+    downloader.download_dataset('ws', 'proj', 1, 'cat', output_dir=str(tmp_path / 'out'))
+    os.remove(_entry(downloader) / 'train' / 'images' / 'b.jpg')
+    assert not downloader._is_complete(_entry(downloader))
+    assert len(checksums) == 1
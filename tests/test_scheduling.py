@@ -0,0 +1,109 @@
+import time
+from datetime import datetime, timezone
+import fakeredis
+import pytest
+import tasks
+from lease_lock import LeaseLock
+
+HOUR = 3600
+
+
+@pytest.fixture
+def connection():
+    return fakeredis.FakeRedis()
+
+
+def test_lease_is_exclusive_until_released(connection):
+    first = LeaseLock(connection, 'job', ttl=5)
+    second = LeaseLock(connection, 'job', ttl=5)
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.holder() == first.token
+    first.release()
+    assert first.holder() is None
+    assert second.acquire()
+    second.release()
+
+
+def test_heartbeat_keeps_the_lease_past_its_ttl(connection):
+    lease = LeaseLock(connection, 'job', ttl=0.3, heartbeat=0.05)
+    assert lease.acquire()
+    time.sleep(0.6)
+    assert lease.holder() == lease.token
+    assert not lease.lost.is_set()
+    lease.release()
+
+
+def test_lease_expires_without_renewals(connection):
+    crashed = LeaseLock(connection, 'job', ttl=0.2, heartbeat=60)  # Never renews in time, like a dead worker
+    assert crashed.acquire()
+    time.sleep(0.3)
+    successor = LeaseLock(connection, 'job', ttl=5)
+    assert successor.acquire()
+
+    crashed.release()  # Must not delete the successor's lease
+    assert successor.holder() == successor.token
+    successor.release()
+
+
+def test_heartbeat_notices_a_lost_lease(connection):
+    lease = LeaseLock(connection, 'job', ttl=5, heartbeat=0.05)
+    assert lease.acquire()
+    connection.set('lock:job', 'someone-else')
+    assert lease.lost.wait(1)
+    lease.release()
+    assert connection.get('lock:job') == b'someone-else'
+
+
+def test_single_flight_skips_while_held(connection):
+    config = {'scheduling': {'lease_seconds': 5}}
+    with tasks._single_flight(config, 'reddit:aww', connection) as first:
+        with tasks._single_flight(config, 'reddit:aww', connection) as second:
+            assert (first, second) == (True, False)
+    with tasks._single_flight(config, 'reddit:aww', connection) as again:
+        assert again
+
+
+def _last_run(connection, timestamp):
+    connection.hset('schedule:reddit', 'last_run', timestamp)
+
+
+def test_next_run_time_before_the_first_run(connection):
+    assert tasks.next_run_time(connection, 'reddit', 6 * HOUR) is None
+
+
+def test_next_run_time_on_schedule(connection):
+    _last_run(connection, 1000 * HOUR)
+    expected = datetime.fromtimestamp(1006 * HOUR, timezone.utc)
+    for policy in tasks.CATCH_UP_POLICIES:
+        assert tasks.next_run_time(connection, 'reddit', 6 * HOUR, policy, now=1001 * HOUR) == expected
+        # Due exactly now is not a miss
+        assert tasks.next_run_time(connection, 'reddit', 6 * HOUR, policy, now=1006 * HOUR) == expected
+
+
+@pytest.mark.parametrize('now_hours, skip_hours', [
+    (1006.5, 1012),   # Just missed one slot
+    (1012, 1012),     # Exactly on a later slot
+    (1012.25, 1018),  # Missed two slots
+])
+def test_next_run_time_after_downtime(connection, now_hours, skip_hours):
+    _last_run(connection, 1000 * HOUR)
+    now = now_hours * HOUR
+    assert tasks.next_run_time(connection, 'reddit', 6 * HOUR, 'once', now=now) == \
+        datetime.fromtimestamp(now, timezone.utc)  # One catch-up run right away
+    assert tasks.next_run_time(connection, 'reddit', 6 * HOUR, 'skip', now=now) == \
+        datetime.fromtimestamp(skip_hours * HOUR, timezone.utc)  # Back on the original grid
+
+
+def test_next_run_time_rejects_unknown_policies(connection):
+    with pytest.raises(ValueError):
+        tasks.next_run_time(connection, 'reddit', HOUR, 'replay_all')
+
+
+def test_coordinate_records_the_run_and_blocks_a_second_coordinator(connection):
+    config = {'scheduling': {'reddit_interval_hours': 6}}
+    with tasks._coordinate(config, 'reddit', connection) as due:
+        assert due
+        assert abs(float(connection.hget('schedule:reddit', 'last_run')) - time.time()) < 5
+        with tasks._coordinate(config, 'reddit', connection) as again:
+            assert not again
@@ -0,0 +1,70 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from filter_small_objects import _tile_image, clip_boxes_to_tiles, tile_origins
+
+
+def test_image_smaller_than_or_equal_to_the_tile_is_one_tile():
+    assert tile_origins(100, 256, 0.2).tolist() == [0]
+    assert tile_origins(256, 256, 0.2).tolist() == [0]
+
+
+@pytest.mark.parametrize('length, tile, overlap', [(1000, 256, 0.2), (640, 320, 0.0), (641, 320, 0.5), (4000, 640, 0.25)])
+def test_origins_cover_the_image_with_the_overlap(length, tile, overlap):
+    origins = tile_origins(length, tile, overlap)
+    assert origins[0] == 0
+    assert origins[-1] == length - tile  # Last tile is aligned with the edge, not past it
+    steps = np.diff(origins)
+    assert (steps > 0).all()
+    assert (steps <= tile * (1 - overlap) + 1).all()  # +1 for rounding to whole pixels
+
+
+def test_exact_fit_needs_no_extra_tile():
+    assert tile_origins(640, 320, 0.0).tolist() == [0, 320]
+    assert tile_origins(1000, 256, 0.2).tolist() == [0, 186, 372, 558, 744]
+
+
+def test_boxes_are_clipped_to_each_tile_in_tile_coordinates():
+    tiles = np.array([[0, 0, 100, 100], [80, 0, 180, 100]])
+    boxes = np.array([[70.0, 10, 90, 30],    # Straddles x=80 and x=100
+                      [10.0, 10, 20, 20]])   # Inside the first tile only
+    clipped, keep = clip_boxes_to_tiles(boxes, tiles, min_visibility=0.5)
+
+    assert clipped[0, 0].tolist() == [70, 10, 90, 30]
+    assert clipped[1, 0].tolist() == [0, 10, 10, 30]  # Half of it, shifted by the tile origin
+    assert keep[:, 0].tolist() == [True, True]
+    assert keep[:, 1].tolist() == [True, False]
+    assert clipped[1, 1, 2] <= clipped[1, 1, 0]  # Empty once clipped to the second tile
+
+
+@pytest.mark.parametrize('min_visibility, kept', [(0.25, True), (0.3, True), (0.31, False), (1.0, False)])
+def test_min_visibility_threshold_is_inclusive(min_visibility, kept):
+    tiles = np.array([[0, 0, 100, 100]])
+    boxes = np.array([[70.0, 0, 110, 10]])  # 30 of its 40 px width inside -> 0.75 visible
+    boxes_30 = np.array([[70.0, 0, 170, 10]])  # 30 of 100 px inside -> 0.3 visible
+    _, keep = clip_boxes_to_tiles(boxes_30, tiles, min_visibility)
+    assert keep[0, 0] == kept
+    _, keep = clip_boxes_to_tiles(boxes, tiles, min_visibility)
+    assert keep[0, 0] == (min_visibility <= 0.75)
+
+
+def test_tile_image_counts_only_boxes_no_tile_keeps(tmp_path):
+    img_path = str(tmp_path / 'a.jpg')
+    cv2.imwrite(img_path, np.zeros((200, 400, 3), dtype=np.uint8))
+    boxes = np.array([
+        [0, 0.1, 0.5, 0.02, 0.04],   # Small object in the left tile
+        [0, 0.9, 0.5, 0.02, 0.04],   # Small object in the right tile
+        [1, 0.55, 0.5, 0.8, 0.2],    # Wide box: 44% of it in the left tile, 56% in the right
+    ])
+    os.makedirs(tmp_path / 'images')
+    os.makedirs(tmp_path / 'labels')
+    _, tiles, kept, dropped = _tile_image((img_path, boxes, str(tmp_path / 'images'), str(tmp_path / 'labels'),
+                                           200, 0.0, 0.6, 0.05))
+    assert (tiles, kept, dropped) == (2, 2, 1)
+
+    # At 0.5 the right tile keeps it, and it is not counted as dropped from the left one
+    _, tiles, kept, dropped = _tile_image((img_path, boxes, str(tmp_path / 'images'), str(tmp_path / 'labels'),
+                                           200, 0.0, 0.5, 0.05))
+    assert (tiles, kept, dropped) == (2, 3, 0)
+    assert sorted(os.listdir(tmp_path / 'images')) == ['a_jpg_0_0.jpg', 'a_jpg_200_0.jpg']
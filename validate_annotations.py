@@ -1,13 +1,64 @@
 import os
-import cv2
 import yaml
+import numpy as np
 from tqdm import tqdm
-import shutil
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from image_probe import DimensionCache
+from label_index import load_label_index, parse_label_file
+from file_links import link_file
+from metrics import METRICS
+from profiling import span
+
+ISSUE_KINDS = ('missing_annotations', 'small_objects', 'unknown_classes')  # Also the output_dir folder names
+
+_worker_validator = None
+
+
+def _init_worker(dataset_path, min_object_size):
+    """Give each pool process its own validator (and dimension cache connection)"""
+    global _worker_validator
+    _worker_validator = AnnotationValidator(dataset_path, min_object_size)
+
+
+def _load_index(split_path):
+    """Build or load one split's label index (runs inside pool workers)"""
+    with METRICS.timer('label_index_seconds'):
+        index = load_label_index(split_path)
+    return index, METRICS.drain()
+
+
+def _describe_chunk(task):
+    """Describe small objects for one shard of flagged images (runs inside pool workers)"""
+    split, split_path, entries = task
+    results = []
+    for img_file, boxes in entries:
+        small_objs = _worker_validator.describe_small_objects(os.path.join(split_path, 'images', img_file), boxes)
+        if small_objs:
+            results.append({
+                'image': os.path.join(split, 'images', img_file),
+                'small_objects': small_objs
+            })
+    _worker_validator.dimension_cache.flush()
+    return results, METRICS.drain()  # Pool processes ship their timings back to the parent
+
+
+def _check_copies(futures):
+    """Wait for copy/link futures, report every failure and re-raise the first one"""
+    errors = [future.exception() for future in futures]
+    errors = [error for error in errors if error is not None]
+    for error in errors:
+        print(f"Failed to save problematic file: {error}")
+    if errors:
+        raise errors[0]
+
 
 class AnnotationValidator:
-    def __init__(self, dataset_path, min_object_size=0.02):
+    def __init__(self, dataset_path, min_object_size=0.02, chunk_size=256, copy_workers=8):
         self.dataset_path = dataset_path
         self.min_object_size = min_object_size  # Relative size threshold (2% of image area)
+        self.chunk_size = chunk_size  # Flagged images per parallel task
+        self.copy_workers = copy_workers  # Threads copying/linking problematic files
         
         # Load dataset config
         with open(os.path.join(dataset_path, 'data.yaml')) as f:
@@ -15,95 +66,211 @@ class AnnotationValidator:
         
         self.class_names = self.config['names']
         
+        # Image sizes come from file headers, cached by (path, mtime) across runs
+        self.dimension_cache = DimensionCache(os.path.join(dataset_path, '.dimension_cache.sqlite'))
+        
     def validate_dataset(self, output_dir=None):
         """Validate all images in dataset"""
         splits = ['train', 'val', 'test'] if not output_dir else ['']
-        issues = {'missing_annotations': [], 'small_objects': []}
+        issues = {'missing_annotations': [], 'small_objects': [], 'unknown_classes': [],
+                  'class_counts': dict.fromkeys(self.class_names, 0)}
         
         for split in splits:
             split_path = os.path.join(self.dataset_path, split) if split else self.dataset_path
-            images_dir = os.path.join(split_path, 'images')
-            labels_dir = os.path.join(split_path, 'labels')
+            with span('label_index'), METRICS.timer('label_index_seconds'):
+                index = load_label_index(split_path)
+            METRICS.inc('validated_images_total', len(index))
             
-            for img_file in tqdm(os.listdir(images_dir), desc=f"Validating {split or 'dataset'}"):
-                if not img_file.endswith(('.jpg', '.png', '.jpeg')):
-                    continue
-                
-                # Check annotation file exists
-                label_file = os.path.join(labels_dir, os.path.splitext(img_file)[0] + '.txt')
-                if not os.path.exists(label_file):
-                    issues['missing_annotations'].append(os.path.join(split, 'images', img_file))
-                    continue
-                
-                # Check object sizes
-                img_path = os.path.join(images_dir, img_file)
-                small_objs = self.check_small_objects(img_path, label_file)
-                if small_objs:
-                    issues['small_objects'].append({
-                        'image': os.path.join(split, 'images', img_file),
-                        'small_objects': small_objs
-                    })
+            # Images without a label file
+            for img_file in index.image_names[~index.has_label]:
+                issues['missing_annotations'].append(os.path.join(split, 'images', str(img_file)))
+            
+            # Check object sizes
+            with span('check_small_objects'):
+                issues['small_objects'].extend(self.find_small_objects(index, split, split_path))
+            
+            for name, count in zip(self.class_names, index.class_counts(len(self.class_names))):
+                issues['class_counts'][name] += int(count)
+            
+            # Class ids with no entry in data.yaml
+            for img_file in index.unknown_class_images(len(self.class_names)):
+                issues['unknown_classes'].append(os.path.join(split, 'images', str(img_file)))
+        
+        self.dimension_cache.flush()
         
         # Save problematic files if output directory specified
         if output_dir:
-            self.save_problematic_files(issues, output_dir)
+            with span('save_problematic_files'):
+                self.save_problematic_files(issues, output_dir)
             
         return issues
     
-    def check_small_objects(self, img_path, label_path):
-        """Check for objects smaller than threshold"""
-        img = cv2.imread(img_path)
-        h, w = img.shape[:2]
-        small_objects = []
+    def validate_dataset_parallel(self, output_dir=None, workers=None, issues_path='issues.jsonl'):
+        """Validate splits across worker processes, streaming issues to a JSONL file
+        
+        Only counts are kept in memory; the returned dict holds totals instead of issue lists.
+        """
+        splits = ['train', 'val', 'test'] if not output_dir else ['']
+        counts = {'missing_annotations': 0, 'small_objects': 0, 'unknown_classes': 0,
+                  'class_counts': dict.fromkeys(self.class_names, 0)}
+        copier = ThreadPoolExecutor(max_workers=self.copy_workers) if output_dir else None
+        copies = []
+        if output_dir:
+            for kind in ISSUE_KINDS:
+                os.makedirs(os.path.join(output_dir, kind), exist_ok=True)
+        
+        def emit(kind, issue):
+            out.write(json.dumps({'type': kind, **issue}) + '\n')
+            counts[kind] += 1
+            if copier:
+                src = os.path.join(self.dataset_path, issue['image'])
+                copies.append(copier.submit(
+                    link_file, src, os.path.join(output_dir, kind, os.path.basename(issue['image']))))
         
-        with open(label_path) as f:
-            for line in f:
-                cls, x, y, bw, bh = map(float, line.strip().split())
-                # Convert to absolute pixels
-                abs_w = bw * w
-                abs_h = bh * h
-                area = abs_w * abs_h
+        with open(issues_path, 'w') as out, ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(self.dataset_path, self.min_object_size)) as executor:
+            # Label indexes for all splits are built concurrently
+            index_futures = {}
+            for split in splits:
+                split_path = os.path.join(self.dataset_path, split) if split else self.dataset_path
+                index_futures[executor.submit(_load_index, split_path)] = (split, split_path)
+            
+            chunk_futures = []
+            for future in as_completed(index_futures):
+                split, split_path = index_futures[future]
+                index, worker_metrics = future.result()
+                METRICS.merge(worker_metrics)
+                METRICS.inc('validated_images_total', len(index))
+                
+                for img_file in index.image_names[~index.has_label]:
+                    emit('missing_annotations', {'image': os.path.join(split, 'images', str(img_file))})
+                
+                for name, count in zip(self.class_names, index.class_counts(len(self.class_names))):
+                    counts['class_counts'][name] += int(count)
                 
-                # Check if object is too small
-                if area < (self.min_object_size * w * h):
-                    small_objects.append({
-                        'class': self.class_names[int(cls)],
-                        'size': (abs_w, abs_h),
-                        'relative_size': (bw, bh)
-                    })
+                for img_file in index.unknown_class_images(len(self.class_names)):
+                    emit('unknown_classes', {'image': os.path.join(split, 'images', str(img_file))})
+                
+                entries = list(self.flagged_images(index))
+                for start in range(0, len(entries), self.chunk_size):
+                    task = (split, split_path, entries[start:start + self.chunk_size])
+                    chunk_futures.append(executor.submit(_describe_chunk, task))
+            
+            with span('check_small_objects'):
+                for future in tqdm(as_completed(chunk_futures), total=len(chunk_futures), desc="Validating"):
+                    results, worker_metrics = future.result()
+                    METRICS.merge(worker_metrics)
+                    for item in results:
+                        emit('small_objects', item)
         
-        return small_objects
+        if copier:
+            with span('save_problematic_files'):
+                copier.shutdown(wait=True)
+                _check_copies(copies)
+        return counts
+    
+    def flagged_images(self, index):
+        """Yield (image filename, small boxes) for every image with a box below the size threshold"""
+        # Relative area below the threshold is the same test as absolute area below min_object_size * w * h
+        rows = np.flatnonzero(index.w * index.h < self.min_object_size)
+        image_ids, starts = np.unique(index.image_id[rows], return_index=True)
+        for image_id, image_rows in zip(image_ids, np.split(rows, starts[1:])):
+            yield str(index.image_names[image_id]), index.boxes[image_rows]
+    
+    def find_small_objects(self, index, split, split_path):
+        """Vectorized small-object check over a split's LabelIndex"""
+        flagged = list(self.flagged_images(index))
+        
+        results = []
+        for img_file, boxes in tqdm(flagged, desc=f"Validating {split or 'dataset'}"):
+            small_objs = self.describe_small_objects(os.path.join(split_path, 'images', img_file), boxes)
+            if small_objs:
+                results.append({
+                    'image': os.path.join(split, 'images', img_file),
+                    'small_objects': small_objs
+                })
+        return results
+    
+    def check_small_objects(self, img_path, label_path):
+        """Check for objects smaller than threshold"""
+        boxes = parse_label_file(label_path)
+        small = boxes[boxes[:, 3] * boxes[:, 4] < self.min_object_size]
+        return self.describe_small_objects(img_path, small) if len(small) else []
+    
+    def describe_small_objects(self, img_path, boxes):
+        """Report (class, pixel size, relative size) for boxes already known to be small"""
+        with METRICS.timer('probe_seconds'):
+            size = self.dimension_cache.get_size(img_path)
+        if size is None:
+            print(f"Failed to read image: {img_path}")
+            return []
+        w, h = size
+        
+        return [{
+            'class': self.class_names[int(cls)] if 0 <= cls < len(self.class_names) else int(cls),
+            'size': (float(bw * w), float(bh * h)),
+            'relative_size': (float(bw), float(bh))
+        } for cls, _, _, bw, bh in boxes]
     
     def save_problematic_files(self, issues, output_dir):
         """Save problematic files to separate folders"""
-        os.makedirs(os.path.join(output_dir, 'missing_annotations'), exist_ok=True)
-        os.makedirs(os.path.join(output_dir, 'small_objects'), exist_ok=True)
+        for kind in ISSUE_KINDS:
+            os.makedirs(os.path.join(output_dir, kind), exist_ok=True)
         
-        # Copy files with missing annotations
-        for img_path in issues['missing_annotations']:
-            src = os.path.join(self.dataset_path, img_path)
-            dst = os.path.join(output_dir, 'missing_annotations', os.path.basename(img_path))
-            shutil.copy2(src, dst)
+        jobs = [(img_path, 'missing_annotations') for img_path in issues['missing_annotations']]
+        jobs += [(item['image'], 'small_objects') for item in issues['small_objects']]
+        jobs += [(img_path, 'unknown_classes') for img_path in issues['unknown_classes']]
         
-        # Copy files with small objects
-        for item in issues['small_objects']:
-            src = os.path.join(self.dataset_path, item['image'])
-            dst = os.path.join(output_dir, 'small_objects', os.path.basename(item['image']))
-            shutil.copy2(src, dst)
+        # Hardlinked when on the same filesystem, copied otherwise
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as executor:
+            futures = []
+            for img_path, folder in jobs:
+                src = os.path.join(self.dataset_path, img_path)
+                dst = os.path.join(output_dir, folder, os.path.basename(img_path))
+                futures.append(executor.submit(link_file, src, dst))
+        _check_copies(futures)
 
 if __name__ == "__main__":
     import argparse
+    import profiling
     
     parser = argparse.ArgumentParser()
     parser.add_argument('--dataset', type=str, required=True, help='Path to YOLO dataset')
     parser.add_argument('--output', type=str, help='Output directory for problematic files')
     parser.add_argument('--min-size', type=float, default=0.02, 
                        help='Minimum object size as fraction of image area (default: 0.02)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Worker processes; >1 streams issues to --issues instead of holding them in memory')
+    parser.add_argument('--issues', type=str, default='issues.jsonl',
+                       help='JSONL file for streamed issues in parallel mode (default: issues.jsonl)')
+    parser.add_argument('--metrics', type=str, help='Write probe/index timings here in Prometheus text format')
+    profiling.add_arguments(parser)
     args = parser.parse_args()
     
     validator = AnnotationValidator(args.dataset, args.min_size)
-    issues = validator.validate_dataset(args.output)
+    if args.workers > 1:
+        with profiling.from_args(args):
+            counts = validator.validate_dataset_parallel(args.output, args.workers, args.issues)
+        print(f"\nIssues written to {args.issues}")
+    else:
+        with profiling.from_args(args):
+            issues = validator.validate_dataset(args.output)
+        counts = {
+            'missing_annotations': len(issues['missing_annotations']),
+            'small_objects': len(issues['small_objects']),
+            'unknown_classes': len(issues['unknown_classes']),
+            'class_counts': issues['class_counts']
+        }
     
     print("\nValidation Results:")
-    print(f"- Images with missing annotations: {len(issues['missing_annotations'])}")
-    print(f"- Images with small objects: {len(issues['small_objects'])}")
\ No newline at end of file
+    print(f"- Images with missing annotations: {counts['missing_annotations']}")
+    print(f"- Images with small objects: {counts['small_objects']}")
+    print(f"- Images with class ids missing from data.yaml: {counts['unknown_classes']}")
+    print("- Boxes per class:")
+    for name, count in counts['class_counts'].items():
+        print(f"    {name}: {count}")
+    
+    if args.metrics:
+        from metrics import write_textfile
+        write_textfile(args.metrics)
\ No newline at end of file
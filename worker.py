@@ -1,5 +1,5 @@
 from redis import Redis
-from rq.worker import Worker
+from rq.worker import SimpleWorker, Worker
 from rq.queue import Queue
 from rq.registry import StartedJobRegistry
 import logging
@@ -17,42 +17,116 @@ logging.basicConfig(
     ]
 )
 
-def start_worker():
-    """Start an RQ worker with unique naming and cleanup"""
+MEASURE_QUEUE = 'measure'  # Used only by --measure
+
+def redis_connection():
+    """Open the Redis connection used by workers"""
+    return Redis(
+        host='localhost',
+        port=6379,
+        db=0,
+        socket_connect_timeout=5
+    )
+
+def clean_registries(redis_conn):
+    """Clean up jobs left behind by dead workers (run once per launch, not per worker)"""
+    StartedJobRegistry('default', connection=redis_conn).cleanup()
+
+def preload(config_path='config.yaml'):
+    """Import heavy job modules and parse the config once so forked job processes start warm"""
+    start = time.perf_counter()
+    import cv2  # noqa: F401
+    import tasks
+    import reddit_downloader  # noqa: F401 (praw)
+    import roboflow_downloader  # noqa: F401 (roboflow)
+    
+    if os.path.exists(config_path):
+        tasks._load_config(config_path)
+    logging.info(f"Preloaded job modules in {time.perf_counter() - start:.2f}s")
+
+def start_worker(mode='fork', preload_modules=True, clean=True, config_path='config.yaml', burst=False, name=None,
+                 queue_name='default'):
+    """Start an RQ worker with unique naming and cleanup
+    
+    mode 'fork' runs each job in a child forked from this (preloaded) process; 'simple'
+    runs jobs in-process so cached clients are reused across jobs.
+    """
     try:
         # Initialize Redis connection
-        redis_conn = Redis(
-            host='localhost',
-            port=6379,
-            db=0,
-            socket_connect_timeout=5
-        )
+        redis_conn = redis_connection()
         
         # Clean up any stale workers
-        StartedJobRegistry('default', connection=redis_conn).cleanup()
+        if clean:
+            clean_registries(redis_conn)
+        
+        if preload_modules:
+            preload(config_path)
         
-        # Create unique worker name
-        worker_name = f"worker_{socket.gethostname()}_{os.getpid()}_{int(time.time())}"
+        # Create unique worker name (supervised workers are named by their supervisor)
+        worker_name = name or f"worker_{socket.gethostname()}_{os.getpid()}_{int(time.time())}"
         
         # Initialize worker
-        worker = Worker(
-            queues=['default'],
+        worker_class = SimpleWorker if mode == 'simple' else Worker
+        worker = worker_class(
+            queues=[queue_name],
             connection=redis_conn,
             name=worker_name,
             default_worker_ttl=600,  # Auto-cleanup if worker crashes
             job_monitoring_interval=5  # Check for new jobs every 5 seconds
         )
         
-        logging.info(f"Starting worker {worker_name}")
-        logging.info(f"onnected to Redis at localhost:6379")
-        logging.info(f"Listening on queue: default")
+        logging.info(f"Starting {mode} worker {worker_name}")
+        logging.info(f"Connected to Redis at localhost:6379")
+        logging.info(f"Listening on queue: {queue_name}")
         
         # Start working (burst=False for continuous operation)
-        worker.work(with_scheduler=True)
+        worker.work(with_scheduler=True, burst=burst)
         
     except Exception as e:
         logging.error(f"Worker failed: {str(e)}")
         raise
 
+def measure_overhead(jobs=20):
+    """Print cold-start and per-job overhead for each worker mode (needs a running Redis)"""
+    import subprocess
+    import sys
+    from tasks import ping
+    
+    cold = subprocess.run(
+        [sys.executable, '-c', 'import time; t = time.perf_counter(); import tasks; print(time.perf_counter() - t)'],
+        capture_output=True, text=True, check=True
+    )
+    print(f"Cold import of tasks: {float(cold.stdout) * 1000:.0f} ms")
+    
+    # A queue of its own, so the burst workers neither run nor drain production jobs
+    queue = Queue(MEASURE_QUEUE, connection=redis_connection())
+    variants = [('fork', False), ('fork', True), ('simple', True)]
+    for mode, preloaded in variants:
+        timings = []
+        for count in (0, jobs):
+            for _ in range(count):
+                queue.enqueue(ping)
+            args = [sys.executable, __file__, '--burst', '--mode', mode, '--queue', MEASURE_QUEUE]
+            args += [] if preloaded else ['--no-preload']
+            start = time.perf_counter()
+            subprocess.run(args, capture_output=True, check=True)
+            timings.append(time.perf_counter() - start)
+        per_job = (timings[1] - timings[0]) / jobs
+        print(f"{mode:6} preload={preloaded!s:5}  startup {timings[0]:.2f}s  per job {per_job * 1000:.0f} ms")
+
 if __name__ == "__main__":
-    start_worker()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['fork', 'simple'], default='fork',
+                        help='fork: one child per job from the warm parent; simple: jobs run in-process')
+    parser.add_argument('--no-preload', action='store_true', help='Skip importing job modules up front')
+    parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+    parser.add_argument('--queue', default='default', help='Queue to listen on')
+    parser.add_argument('--measure', type=int, metavar='JOBS', help='Measure startup and per-job overhead')
+    args = parser.parse_args()
+    
+    if args.measure:
+        measure_overhead(args.measure)
+    else:
+        start_worker(mode=args.mode, preload_modules=not args.no_preload, burst=args.burst, queue_name=args.queue)
\ No newline at end of file
@@ -0,0 +1,202 @@
+import os
+import json
+import math
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+import multiprocessing
+from multiprocessing import Process
+from rq import Queue
+from rq.registry import StartedJobRegistry
+from rq.worker import Worker
+from metrics import METRICS
+from worker import start_worker
+
+
+class WorkerSupervisor:
+    """Keeps between min_workers and max_workers RQ worker processes, sized to the queue
+
+    Every check_seconds it reads the queue depth, the running jobs and the age of the oldest
+    waiting job. It adds workers when jobs pile up or wait too long, retires idle workers once
+    demand has stayed low for idle_seconds, and replaces crashed workers after an exponential
+    backoff. Each decision is appended to log_path as a JSON line.
+
+    Retiring sends SIGTERM, which RQ treats as a warm shutdown: the worker finishes its
+    current job and exits.
+    """
+
+    def __init__(self, connection, config_path, config, log_path=None, queue_name='default'):
+        """
+        Args:
+            connection: Redis connection used to read queue state
+            config_path: Config file passed on to the workers
+            config: The parallelism section of config.yaml
+            log_path: JSON-lines file recording scaling decisions (optional)
+        """
+        self.connection = connection
+        self.config_path = config_path
+        self.min_workers = config.get('min_workers', 1)
+        self.max_workers = max(config.get('max_workers', config.get('workers', 4)), self.min_workers)
+        self.jobs_per_worker = config.get('jobs_per_worker', 4)  # Waiting + running jobs one worker is expected to absorb
+        self.max_job_age = config.get('max_job_age_seconds', 60)  # Oldest job waiting longer than this adds a worker
+        self.idle_seconds = config.get('idle_seconds', 120)
+        self.check_seconds = config.get('check_seconds', 5)
+        self.restart_backoff = config.get('restart_backoff_seconds', 5)
+        self.max_backoff = config.get('max_backoff_seconds', 300)
+        self.log_path = log_path
+
+        self.queue_name = queue_name
+        self.queue = Queue(queue_name, connection=connection)
+        self.registry = StartedJobRegistry(queue_name, connection=connection)
+        self.workers = {}  # RQ worker name -> (Process, start time)
+        self.retiring = set()
+        self.crashes = 0  # Consecutive crashes, drives the restart backoff
+        self.backoff_until = 0
+        self.low_since = None  # When demand first dropped below the running workers
+        self._spawned = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start min_workers workers and the supervising thread"""
+        for _ in range(self.min_workers):
+            self._spawn()
+        self._log('start', f"{self.min_workers}-{self.max_workers} workers", **self.sample())
+        self._thread = threading.Thread(target=self._loop, name='worker-supervisor', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=60):
+        """Stop supervising and shut every worker down, letting running jobs finish within timeout"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for process, _ in self.workers.values():
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for process, _ in self.workers.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.kill()
+        self.workers = {}
+        self.retiring = set()
+
+    def _loop(self):
+        while not self._stop.wait(self.check_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Worker supervisor check failed: {e}")
+
+    def sample(self):
+        """Queue depth, running jobs and age in seconds of the oldest waiting job"""
+        depth = self.queue.count
+        running = self.registry.count
+        oldest_age = 0.0
+        job_ids = self.queue.get_job_ids(0, 0)
+        job = self.queue.fetch_job(job_ids[0]) if job_ids else None
+        if job is not None and job.enqueued_at:
+            enqueued_at = job.enqueued_at
+            if enqueued_at.tzinfo is None:
+                enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)  # Older RQ stores naive UTC
+            oldest_age = max((datetime.now(timezone.utc) - enqueued_at).total_seconds(), 0.0)
+        return {'depth': depth, 'running': running, 'oldest_age': round(oldest_age, 1)}
+
+    def target(self, sample, active):
+        """How many workers the current load calls for"""
+        demand = math.ceil((sample['depth'] + sample['running']) / self.jobs_per_worker)
+        target = max(self.min_workers, min(self.max_workers, demand))
+        if sample['oldest_age'] > self.max_job_age:
+            # Jobs are waiting too long even if the queue is short, e.g. slow fan-out jobs
+            target = max(target, min(self.max_workers, active + 1))
+        return target
+
+    def check(self):
+        """Reap exited workers, then scale toward the target once"""
+        self._reap()
+        sample = self.sample()
+        active = len(self.workers) - len(self.retiring)
+        target = self.target(sample, active)
+        now = time.monotonic()
+
+        if target > active:
+            self.low_since = None
+            if now < self.backoff_until:
+                return
+            for _ in range(target - active):
+                self._spawn()
+            reason = 'jobs waiting too long' if sample['oldest_age'] > self.max_job_age else 'queue depth'
+            if active < self.min_workers:
+                reason = 'below min_workers'
+            self._log('scale_up', reason, workers=target, **sample)
+        elif target < active:
+            if self.low_since is None:
+                self.low_since = now
+            elif now - self.low_since >= self.idle_seconds:
+                retired = self._retire_idle(active - target)
+                if retired:
+                    self._log('scale_down', f"idle for {now - self.low_since:.0f}s",
+                              workers=active - len(retired), retired=retired, **sample)
+                    self.low_since = now
+        else:
+            self.low_since = None
+
+    def _spawn(self):
+        self._spawned += 1
+        name = f"worker_{socket.gethostname()}_{os.getpid()}_{self._spawned}"
+        # Forked workers inherit the modules preloaded in this process; spawned ones start
+        # from a fresh interpreter and have to import them themselves
+        preload_modules = multiprocessing.get_start_method() != 'fork'
+        process = Process(target=start_worker, kwargs={
+            'clean': False, 'preload_modules': preload_modules, 'config_path': self.config_path,
+            'name': name, 'queue_name': self.queue_name})
+        process.start()
+        self.workers[name] = (process, time.monotonic())
+        print(f"Started worker {name} (PID: {process.pid})")
+
+    def _retire_idle(self, count):
+        """Warm-stop up to count workers that are not running a job, newest first"""
+        retired = []
+        for name in reversed(list(self.workers)):
+            if len(retired) == count:
+                break
+            if name in self.retiring:
+                continue
+            worker = Worker.find_by_key(Worker.redis_worker_namespace_prefix + name, connection=self.connection)
+            state = worker.get_state() if worker else None
+            if getattr(state, 'value', state) != 'idle':
+                continue
+            self.workers[name][0].terminate()
+            self.retiring.add(name)
+            retired.append(name)
+        return retired
+
+    def _reap(self):
+        for name, (process, started) in list(self.workers.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self.workers[name]
+            if name in self.retiring:
+                self.retiring.discard(name)
+                continue
+
+            uptime = time.monotonic() - started
+            if uptime > self.max_backoff:
+                self.crashes = 0  # It ran long enough; this is not a crash loop
+            self.crashes += 1
+            backoff = min(self.restart_backoff * 2 ** (self.crashes - 1), self.max_backoff)
+            self.backoff_until = time.monotonic() + backoff
+            self._log('crash', f"exit code {process.exitcode} after {uptime:.0f}s, restarting in {backoff:g}s",
+                      worker=name, workers=len(self.workers) - len(self.retiring))
+
+    def _log(self, action, reason, **details):
+        """Record a scaling decision so capacity settings can be tuned from real load"""
+        METRICS.inc('worker_scaling_total', action=action)
+        METRICS.flush(self.connection)
+        print(f"[Supervisor] {action}: {reason} {details}")
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'),
+                                    'action': action, 'reason': reason, **details}) + '\n')